@@ -0,0 +1,349 @@
+"""
+
+    Yfirlestur: Online spelling and grammar correction for Icelandic
+
+    ASGI front end
+
+    Copyright (C) 2020-2025 Miðeind ehf.
+
+    This software is licensed under the MIT License:
+
+        Permission is hereby granted, free of charge, to any person
+        obtaining a copy of this software and associated documentation
+        files (the "Software"), to deal in the Software without restriction,
+        including without limitation the rights to use, copy, modify, merge,
+        publish, distribute, sublicense, and/or sell copies of the Software,
+        and to permit persons to whom the Software is furnished to do so,
+        subject to the following conditions:
+
+        The above copyright notice and this permission notice shall be
+        included in all copies or substantial portions of the Software.
+
+        THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+        EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+        MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+        IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+        CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+        TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+        SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+    This module is an asyncio front end for the Yfirlestur.is web server,
+    in the form of an ASGI application that can be run e.g. by Uvicorn
+    workers within Gunicorn (cf. gunicorn_config.py).
+
+    Under the WSGI server, each request occupies a thread until it is
+    answered, so a few synchronous API calls that wait for long texts to
+    be corrected can hold up all other requests, including static pages
+    and status polls. Here, synchronous correction requests and long-polling
+    status requests wait for their correction tasks on the event loop
+    instead, so that any number of them can be pending at once while the
+    worker pool does the actual work. The same goes for the Server-Sent
+    Events streams of asynchronous tasks, which are only offered under this
+    front end. All other requests are passed to the Flask application,
+    which handles them on a pool of threads.
+
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple, Union, cast
+
+import io
+import os
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode
+
+from flask.wrappers import Response
+from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from main import app as flask_app
+from routes.api import (
+    MAX_LONG_POLL_WAIT,
+    MAX_SYNCHRONOUS_WAIT,
+    ChildTask,
+    launch_sync,
+    sync_result,
+)
+
+
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+WSGIApp = Callable[[Dict[str, Any], Callable[..., Any]], Iterable[bytes]]
+
+# Number of threads that run requests in the Flask application.
+# Can be overridden via the environment.
+WSGI_THREADS = int(os.environ.get("WSGI_THREADS", 16))
+
+# Event streams are served on the event loop, cf. get_process_events()
+ChildTask.stream_events = True
+
+# Applies the same proxy header handling to the WSGI environment
+# of natively handled requests as main.py does for the Flask application
+_proxy_fix = ProxyFix(lambda environ, start_response: [environ])
+
+
+def build_environ(scope: Scope, body: bytes) -> Dict[str, Any]:
+    """Build a WSGI environment for the HTTP request in the given ASGI
+    scope, with the given request body"""
+    server = scope.get("server") or ("localhost", 80)
+    environ: Dict[str, Any] = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    client = scope.get("client")
+    if client:
+        environ["REMOTE_ADDR"] = client[0]
+        environ["REMOTE_PORT"] = str(client[1])
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key not in ("CONTENT_LENGTH", "CONTENT_TYPE"):
+            key = "HTTP_" + key
+        value = value.decode("latin-1")
+        if key in environ:
+            # Repeated headers are joined, as in HTTP
+            value = environ[key] + "," + value
+        environ[key] = value
+    # The body has been read in full, even if it was sent in chunks
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+def start_wsgi(app: WSGIApp, environ: Dict[str, Any]) -> Tuple[int, Any, Any]:
+    """Call a WSGI application, returning the status code and headers
+    of its response, along with the response body iterable"""
+    started: List[Any] = []
+
+    def start_response(status: str, headers: Any, exc_info: Any = None) -> Any:
+        started[:] = [int(status.split(" ", 1)[0]), headers]
+
+    body = app(environ, start_response)
+    status, headers = started
+    return status, headers, body
+
+
+def dispatch(environ: Dict[str, Any], view: Callable[..., Any], *args: Any) -> Any:
+    """Call a view function within a Flask request context for the given
+    WSGI environment, as Flask would dispatch a request to it. If the view
+    returns a ChildTask, that is returned; otherwise the final response."""
+    with flask_app.request_context(environ):
+        try:
+            try:
+                rv = flask_app.preprocess_request()
+                if rv is None:
+                    rv = view(*args)
+            except Exception as e:
+                rv = flask_app.handle_user_exception(e)
+            if isinstance(rv, ChildTask):
+                return rv
+            return flask_app.finalize_request(rv)
+        except Exception as e:
+            return flask_app.handle_exception(e)
+
+
+class Application:
+
+    """The ASGI application"""
+
+    def __init__(self) -> None:
+        self.executor = ThreadPoolExecutor(WSGI_THREADS, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+        body = await self.read_body(receive)
+        environ = build_environ(scope, body or b"")
+        if body is None:
+            # Request body too large
+            await self.send_response(send, Response(status=413), environ)
+            return
+        try:
+            endpoint, values = (
+                flask_app.url_map.bind_to_environ(environ).match()  # type: ignore
+            )
+        except HTTPException:
+            endpoint, values = "", {}
+        if endpoint == "routes.correct_sync":
+            await self.correct_sync(receive, send, environ, values.get("version", 1))
+        elif endpoint == "routes.get_process_status":
+            await self.get_process_status(send, environ, values["process"])
+        elif endpoint == "routes.get_process_events":
+            await self.get_process_events(receive, send, environ, values["process"])
+        else:
+            await self.send_response(send, flask_app, environ)
+
+    async def lifespan(self, receive: Receive, send: Send) -> None:
+        """Handle the ASGI lifespan protocol. The correction pool is
+        created when main.py is imported, so there is nothing to do."""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read_body(self, receive: Receive) -> Union[bytes, None]:
+        """Read the body of a HTTP request, or return None
+        if it exceeds the maximum upload size"""
+        limit = flask_app.config["MAX_CONTENT_LENGTH"]
+        chunks: List[bytes] = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if limit is not None and size > limit:
+                return None
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+        return b"".join(chunks)
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run a blocking function on the thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def send_response(
+        self, send: Send, app: WSGIApp, environ: Dict[str, Any]
+    ) -> None:
+        """Run a WSGI application, which may be the Flask application or
+        a Flask response, on the thread pool, and send its response.
+        The response body is sent as it is generated, so that streaming
+        responses are streamed."""
+        status, headers, body = await self.run(start_wsgi, app, environ)
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": status,
+                    "headers": [
+                        (name.lower().encode("latin-1"), value.encode("latin-1"))
+                        for name, value in headers
+                    ],
+                }
+            )
+            it = iter(body)
+            while True:
+                chunk = await self.run(next, it, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            close = getattr(body, "close", None)
+            if close is not None:
+                await self.run(close)
+
+    async def wait_for_disconnect(self, receive: Receive) -> None:
+        """Return once the client has disconnected"""
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def correct_sync(
+        self, receive: Receive, send: Send, environ: Dict[str, Any], version: int
+    ) -> None:
+        """Handle a synchronous correction request, cf. correct_sync() in
+        routes/api.py, waiting for its task on the event loop. If the
+        client disconnects in the meantime, the task is cancelled."""
+        environ = cast(Dict[str, Any], _proxy_fix(environ, None)[0])
+        rv = await self.run(dispatch, environ, launch_sync, version)
+        if isinstance(rv, ChildTask):
+            waiting = asyncio.ensure_future(rv.wait_async(MAX_SYNCHRONOUS_WAIT))
+            disconnect = asyncio.ensure_future(self.wait_for_disconnect(receive))
+            await asyncio.wait(
+                (waiting, disconnect), return_when=asyncio.FIRST_COMPLETED
+            )
+            disconnect.cancel()
+            if not waiting.done():
+                # Nobody is waiting for the result anymore
+                waiting.cancel()
+                await self.run(rv.cancel)
+                return
+            rv = await self.run(dispatch, environ, sync_result, rv, waiting.result())
+        await self.send_response(send, rv, environ)
+
+    async def get_process_status(
+        self, send: Send, environ: Dict[str, Any], process_id: str
+    ) -> None:
+        """Handle a status request for a correction task. A long-polling
+        request for a task of this process waits for it on the event loop,
+        and is then passed on to the Flask application without its wait
+        parameter. Other requests are passed on as they are."""
+        args = parse_qsl(environ["QUERY_STRING"], keep_blank_values=True)
+        try:
+            wait = float(dict(args).get("wait", 0.0))
+        except ValueError:
+            wait = 0.0
+        wait = max(0.0, min(wait, MAX_LONG_POLL_WAIT))
+        task = ChildTask.processes.get(process_id)
+        if task is not None and wait > 0.0:
+            await task.wait_async(wait)
+            environ["QUERY_STRING"] = urlencode([(k, v) for k, v in args if k != "wait"])
+        await self.send_response(send, flask_app, environ)
+
+    async def get_process_events(
+        self, receive: Receive, send: Send, environ: Dict[str, Any], process_id: str
+    ) -> None:
+        """Stream the Server-Sent Events of a correction task of this
+        process, cf. get_events() in routes/api.py, waiting for the task
+        on the event loop until it completes or the client disconnects.
+        Other requests are passed on to the Flask application."""
+        task = ChildTask.processes.get(process_id)
+        if task is None or environ["REQUEST_METHOD"] != "GET":
+            await self.send_response(send, flask_app, environ)
+            return
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    # Instruct nginx not to buffer the stream
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        disconnect = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            async for event in task.events_async():
+                if disconnect.done():
+                    # Nobody is listening anymore; the task itself may
+                    # still be polled, so it is left running
+                    return
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": event.encode("utf-8"),
+                        "more_body": True,
+                    }
+                )
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            disconnect.cancel()
+
+
+app = Application()
@@ -0,0 +1,103 @@
+"""
+
+    Yfirlestur: Online spelling and grammar correction for Icelandic
+
+    Pool autoscaling module
+
+    Copyright (C) 2020-2025 Miðeind ehf.
+
+    This software is licensed under the MIT License:
+
+        Permission is hereby granted, free of charge, to any person
+        obtaining a copy of this software and associated documentation
+        files (the "Software"), to deal in the Software without restriction,
+        including without limitation the rights to use, copy, modify, merge,
+        publish, distribute, sublicense, and/or sell copies of the Software,
+        and to permit persons to whom the Software is furnished to do so,
+        subject to the following conditions:
+
+        The above copyright notice and this permission notice shall be
+        included in all copies or substantial portions of the Software.
+
+        THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+        EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+        MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+        IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+        CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+        TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+        SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+    This module contains the policy that decides how many worker processes
+    the correction pool should have. The pool is sampled periodically:
+    if all of its workers are busy and jobs have been waiting for a worker
+    for a while, a worker is added for each waiting job; if at least one
+    worker has been idle for a long time, a worker is removed. The size of
+    the pool is kept within a minimum and a maximum.
+
+"""
+
+from typing import Optional
+
+
+# Jobs must have been waiting for a worker for this long before the pool grows
+SCALE_UP_DELAY = 2.0  # Seconds
+# A worker must have been idle for this long before the pool shrinks
+SCALE_DOWN_IDLE_TIME = 60.0  # Seconds
+
+
+class Autoscaler:
+
+    """Decides the size of the worker pool from samples of its load"""
+
+    def __init__(
+        self,
+        min_size: int,
+        max_size: int,
+        size: int,
+        up_delay: float = SCALE_UP_DELAY,
+        idle_time: float = SCALE_DOWN_IDLE_TIME,
+    ) -> None:
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.size = min(self.max_size, max(self.min_size, size))
+        self._up_delay = up_delay
+        self._idle_time = idle_time
+        # When did jobs start waiting for a worker, if they are waiting?
+        self._backlog_since: Optional[float] = None
+        # Start of the current observation window, and the highest
+        # number of busy workers seen within it
+        self._window_start: Optional[float] = None
+        self._peak = 0
+
+    def _restart(self, now: float) -> None:
+        """Start a new observation window"""
+        self._window_start = now
+        self._peak = 0
+        self._backlog_since = None
+
+    def update(self, running: int, pending: int, now: float) -> int:
+        """Take a sample of the load of the pool, i.e. the number of jobs
+        running in it and the number of jobs waiting for a worker, at the
+        given time (in terms of time.monotonic()), and return the number
+        of workers that the pool should have"""
+        if self._window_start is None:
+            self._restart(now)
+        self._peak = max(self._peak, running)
+        if pending and running >= self.size:
+            # All workers are busy and jobs are waiting for them
+            if self._backlog_since is None:
+                self._backlog_since = now
+            if now - self._backlog_since >= self._up_delay and self.size < self.max_size:
+                # Add a worker for each waiting job
+                self.size = min(self.max_size, self.size + pending)
+                self._restart(now)
+            return self.size
+        self._backlog_since = None
+        if now - self._window_start >= self._idle_time:  # type: ignore
+            if self._peak < self.size:
+                # At least one worker has been idle throughout the window
+                self.size = max(self.min_size, self.size - 1)
+            self._restart(now)
+        return self.size
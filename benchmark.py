@@ -0,0 +1,229 @@
+"""
+
+    Yfirlestur: Online spelling and grammar correction for Icelandic
+
+    Worker pool benchmark
+
+    Copyright (C) 2020-2025 Miðeind ehf.
+
+    This software is licensed under the MIT License:
+
+        Permission is hereby granted, free of charge, to any person
+        obtaining a copy of this software and associated documentation
+        files (the "Software"), to deal in the Software without restriction,
+        including without limitation the rights to use, copy, modify, merge,
+        publish, distribute, sublicense, and/or sell copies of the Software,
+        and to permit persons to whom the Software is furnished to do so,
+        subject to the following conditions:
+
+        The above copyright notice and this permission notice shall be
+        included in all copies or substantial portions of the Software.
+
+        THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+        EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+        MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+        IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+        CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+        TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+        SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+    This program measures the throughput of a pool of correction workers,
+    without the web server, with and without pinning each worker to a CPU
+    core of its own. It is run from the command line, e.g.:
+
+        python benchmark.py --workers 7 --cpus 1-7 --jobs 500
+
+    The text to check may be given in a file; by default, a few sentences
+    of sample text are used. Each job checks the whole text.
+
+    By default, all jobs are submitted at once, which measures the maximum
+    throughput; the time that each job spends waiting in the queue then
+    depends mostly on the number of jobs. The running time of each job is
+    therefore measured within the worker. To measure latencies under a
+    given load, the jobs can instead be submitted at a fixed rate, e.g.
+    with --rate 20 for 20 jobs per second.
+
+"""
+
+from typing import Any, List, NamedTuple, Optional, Sequence
+
+import sys
+import time
+import argparse
+import statistics
+from multiprocessing import get_context
+
+from correct import warm_up
+from workerpool import (
+    RecyclingPool,
+    cpu_affinity,
+    init_worker,
+    parse_cpu_list,
+    prepare_fork,
+    finish_fork,
+    run_task,
+)
+
+
+SAMPLE_TEXT = (
+    "Manninum á verkstæðinu vanntar hamar. Ég á hest. "
+    "Hér er Maríanna Gvendardóttir. Mér langar í brauðsneið. "
+    "Páli, vini mínum, langaði að horfa á sjónnvarpið. "
+    "Hann hefur verið í fríi í 2 vikur, og kemur aftur á mánudaginn."
+)
+
+
+class Outcome(NamedTuple):
+
+    """The measurements of a benchmark run, in seconds"""
+
+    duration: float
+    # How long each job ran within its worker
+    run_times: List[float]
+    # How long each job took from submission to completion
+    latencies: List[float]
+
+
+def timed_task(*args: Any) -> float:
+    """Run a job in a pool worker, cf. run_task(), and return
+    how long it ran, in seconds"""
+    start = time.perf_counter()
+    run_task(*args)
+    return time.perf_counter() - start
+
+
+def percentile(values: List[float], p: int) -> float:
+    """Return the p-th percentile of the given values"""
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+def run(
+    workers: int,
+    jobs: int,
+    text: str,
+    cpus: Sequence[int],
+    pin: bool,
+    rate: float = 0.0,
+) -> Outcome:
+    """Run the given number of jobs on a fresh pool, once its workers
+    have warmed up, with each worker pinned to one of the given CPU
+    cores if pin is True. The jobs are submitted at the given rate,
+    in jobs per second, or all at once if it is zero."""
+    ctx: Any = get_context("fork")
+    table = ctx.RawArray("d", workers)
+    warm = ctx.Value("i", 0)
+    cpu_table = ctx.Array("i", len(cpus)) if pin else None
+    pool = RecyclingPool(
+        workers,
+        initializer=init_worker,
+        initargs=(
+            table,
+            None,
+            warm,
+            None,
+            0,
+            None,
+            cpus if pin else (),
+            cpu_table,
+        ),
+        context=ctx,
+    )
+    try:
+        while warm.value < workers:
+            time.sleep(0.1)
+        completed = [0.0] * jobs
+        submitted: List[Any] = []
+        start = time.monotonic()
+        for ix in range(jobs):
+            if rate:
+                time.sleep(max(0.0, start + ix / rate - time.monotonic()))
+
+            def finished(_: float, ix: int = ix) -> None:
+                # Called in the pool's result handler thread
+                completed[ix] = time.monotonic()
+
+            submitted.append(
+                (
+                    time.monotonic(),
+                    pool.apply_async(
+                        timed_task, (ix % workers, [text], {}), callback=finished
+                    ),
+                )
+            )
+        run_times = [result.get() for _, result in submitted]
+        # The callback of the last job may still be running
+        pool.close()
+        pool.join()
+        return Outcome(
+            max(completed) - start,
+            run_times,
+            [done - t0 for (t0, _), done in zip(submitted, completed)],
+        )
+    finally:
+        pool.terminate()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the benchmark with and without pinning, and print the results"""
+    available = cpu_affinity(0) or []
+    parser = argparse.ArgumentParser(description="Benchmark the worker pool")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=max(1, len(available) - 1),
+        help="number of pool workers",
+    )
+    parser.add_argument(
+        "--cpus",
+        default="",
+        help="CPU cores for the workers, e.g. '1-7' (default: all but the first)",
+    )
+    parser.add_argument("--jobs", type=int, default=200, help="number of jobs")
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0.0,
+        help="jobs submitted per second (default: all at once)",
+    )
+    parser.add_argument("--file", help="file containing the text to check")
+    args = parser.parse_args(argv)
+    if args.cpus:
+        cpus = parse_cpu_list(args.cpus)
+    else:
+        cpus = available[1:] or available
+    text = SAMPLE_TEXT
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            text = f.read()
+    # Load the correction engine before forking, as the server does
+    prepare_fork(warm_up)
+    finish_fork()
+    print(
+        f"{args.workers} workers on cores {cpus}, {args.jobs} jobs "
+        f"of {len(text)} characters each"
+    )
+    baseline = 0.0
+    for pin in (False, True):
+        outcome = run(args.workers, args.jobs, text, cpus, pin, args.rate)
+        throughput = args.jobs * len(text) / outcome.duration
+        change = f" ({throughput / baseline - 1.0:+.1%})" if baseline else ""
+        baseline = baseline or throughput
+        report = (
+            f"{'pinned' if pin else 'unpinned':>8}: "
+            f"{throughput:10.0f} chars/s{change}, run time "
+            f"median {statistics.median(outcome.run_times):.3f} s, "
+            f"p95 {percentile(outcome.run_times, 95):.3f} s"
+        )
+        if args.rate:
+            # Without a fixed rate, latency is mostly time spent in the queue
+            report += (
+                f"; latency median {statistics.median(outcome.latencies):.3f} s, "
+                f"p95 {percentile(outcome.latencies, 95):.3f} s"
+            )
+        print(report)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
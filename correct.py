@@ -30,11 +30,15 @@
 
     This module exports check_grammar(), a function called from main.py
     to apply grammar and spelling annotations to user-supplied text.
+    It also exports split_into_chunks(), merge_check_results() and
+    rebase_paragraph(), which allow a large text to be checked in several
+    parts, e.g. in parallel or incrementally, and the results combined.
 
 """
 
 from typing import (
     Any,
+    Dict,
     List,
     Sequence,
     Tuple,
@@ -49,20 +53,31 @@ from typing_extensions import TypedDict
 import os
 import hashlib
 import random
+import threading
+
+from cachetools import LRUCache
 
 from tokenizer import Tok
-from reynir.bintokenizer import StringIterable
+from reynir.bintokenizer import StringIterable, TokenList
+from reynir.reynir import Job
 from reynir import Sentence
 
 import reynir_correct
 import nertokenizer
 from reynir_correct.annotation import Annotation
-from reynir_correct import CorrectionPipeline, check_with_stats
+from reynir_correct import CorrectionPipeline
 
 
 # True if running in a continuous integration (CI) test environment
 CI_RUN = os.environ.get("CI", "") > ""
 
+# Maximum total length, in characters, of the sentences whose
+# encoded annotation results are kept in the per-process sentence cache
+SENTENCE_CACHE_SIZE = int(os.environ.get("SENTENCE_CACHE_SIZE", 512 * 1024))
+
+# Text that is checked to warm up the correction engine in a new process
+WARM_UP_TEXT = "Þetta er upphitun. Manninum á verkstæðinu vanntar hamar."
+
 # Salt that is used during generation of a hashed token
 # to be returned when giving feedback on an annotation
 START_SALT = "*[GC start]*"
@@ -124,6 +139,29 @@ class AnnResultDict(TypedDict):
 CheckResult = Tuple[List[List[AnnResultDict]], StatsDict]
 
 
+class SentenceCacheEntry(TypedDict):
+
+    """The parts of an encoded sentence that do not depend on its position
+    within the checked text, as stored in the sentence cache"""
+
+    # Tokens, without character offsets
+    tokens: List[AnnTokenDict]
+    # Annotations, without character offsets
+    annotations: List[Dict[str, Any]]
+    corrected: str
+    # Number of parse tree combinations, or 0 if the sentence was not parsed
+    num: int
+
+
+# Per-process cache of encoded sentences, keyed by the options in effect
+# and the original text of the sentence tokens
+_sentence_cache: LRUCache[str, SentenceCacheEntry] = LRUCache(
+    maxsize=SENTENCE_CACHE_SIZE,
+    getsizeof=lambda entry: sum(len(t.get("o", "")) for t in entry["tokens"]) + 1,
+)
+_sentence_cache_lock = threading.Lock()
+
+
 class RecognitionPipeline(CorrectionPipeline):
     """Derived class that adds a named entity recognition pass
     to the GreynirCorrect tokenization pipeline"""
@@ -159,6 +197,51 @@ class NERCorrect(reynir_correct.GreynirCorrect):
         return pipeline.tokenize()
 
 
+class CachedSentence:
+
+    """Stand-in for a sentence whose encoded result was found in the
+    sentence cache, and which therefore need not be parsed or annotated"""
+
+    def __init__(self, tokens: TokenList, entry: SentenceCacheEntry) -> None:
+        self.tokens = tokens
+        self.entry = entry
+
+
+class CachingCorrect(reynir_correct.GreynirCorrect):
+
+    """Derived class that skips the parsing and annotation of sentences
+    whose encoded results are already in the sentence cache"""
+
+    def __init__(self, **options: Any) -> None:
+        # The cache key prefix covers all options that affect the result
+        self._options_key = repr(
+            sorted(
+                (k, sorted(v) if isinstance(v, (list, tuple, set, frozenset)) else v)
+                for k, v in options.items()
+            )
+        )
+        super().__init__(**options)
+
+    def sentence_key(self, tokens: TokenList) -> str:
+        """Return the sentence cache key for the given tokens"""
+        return self._options_key + "".join(t.original or "" for t in tokens)
+
+    def create_sentence(self, job: Job, s: TokenList) -> Sentence:
+        """Return a cached stand-in for the sentence if available,
+        otherwise create, parse and annotate it as usual"""
+        key = self.sentence_key(s)
+        with _sentence_cache_lock:
+            entry = _sentence_cache.get(key)
+        if entry is None:
+            sent = super().create_sentence(job, s)
+            setattr(sent, "cache_key", key)
+            return sent
+        # Account for the sentence in the job statistics and
+        # progress reporting, as if it had been parsed
+        job._add_sentence(s, entry["num"], 0.0, 0.0)  # type: ignore
+        return cast(Sentence, CachedSentence(s, entry))
+
+
 def generate_nonce() -> str:
     """Generate a random nonce, consisting of 8 digits"""
     return "{0:08}".format(random.randint(0, 10**8 - 1))
@@ -227,31 +310,37 @@ def check_grammar(
     annotate_unparsed_sentences: bool = True,
     suppress_suggestions: bool = False,
     ignore_wordlist: Sequence[str] = [],
-    ignore_rules: Sequence[str] = DEFAULT_IGNORED_RULES
+    ignore_rules: Sequence[str] = DEFAULT_IGNORED_RULES,
+    paragraph_func: Optional[Callable[[List[AnnResultDict]], None]] = None
 ) -> CheckResult:
     """Check the grammar and spelling of the given text and return
     a list of annotated paragraphs, containing sentences, containing
     tokens. The progress_func, if given, will be called periodically
     during processing to indicate progress, with a ratio parameter
-    which is a float in the range 0.0..1.0."""
+    which is a float in the range 0.0..1.0. If paragraph_func is given,
+    it is called with each annotated paragraph as soon as it has been
+    checked, and the returned paragraph list is empty."""
 
-    result = check_with_stats(
-        text,
-        progress_func=progress_func,
-        split_paragraphs=split_paragraphs,
+    rc = CachingCorrect(
         annotate_unparsed_sentences=annotate_unparsed_sentences,
         suppress_suggestions=suppress_suggestions,
         ignore_wordlist=ignore_wordlist,
         ignore_rules=ignore_rules,
     )
+    job = rc.submit(
+        text,
+        parse=True,
+        split_paragraphs=split_paragraphs,
+        progress_func=progress_func,
+    )
 
     # Character index of each token within the submitted text,
     # counting from its beginning
     offset = 0
 
-    def encode_sentence(sent: Sentence) -> AnnResultDict:
-        """Map a reynir._Sentence object to a raw sentence dictionary
-        expected by the web UI"""
+    def cache_entry(sent: Sentence) -> SentenceCacheEntry:
+        """Map a reynir._Sentence object to the position-independent
+        parts of a raw sentence dictionary expected by the web UI"""
         tokens: List[AnnTokenDict]
         if sent.tree is None:
             # Not parsed: use the raw token list
@@ -271,14 +360,46 @@ def check_grammar(
                 )
                 for ix, d in enumerate(sent.tokens)
             ]
-        # Add token character offsets to the annotation tokens
+        a: Iterable[Annotation] = getattr(
+            sent, "annotations", cast(List[Annotation], [])
+        )
+        annotations: List[Dict[str, Any]] = [
+            dict(
+                start=ann.start,
+                end=ann.end,
+                references=ann.references,
+                code=ann.code,
+                text=ann.text,
+                detail=ann.detail,
+                suggest=ann.suggest,
+                suggestlist=ann.suggestlist,
+            )
+            for ann in a
+        ]
+        return SentenceCacheEntry(
+            tokens=tokens,
+            annotations=annotations,
+            corrected=sent.tidy_text,
+            num=sent.combinations or 0,
+        )
+
+    def encode_sentence(sent: Sentence) -> AnnResultDict:
+        """Map a reynir._Sentence object, or a cached stand-in for one,
+        to a raw sentence dictionary expected by the web UI"""
+        if isinstance(sent, CachedSentence):
+            entry = sent.entry
+        else:
+            entry = cache_entry(sent)
+            key: Optional[str] = getattr(sent, "cache_key", None)
+            if key is not None:
+                with _sentence_cache_lock:
+                    _sentence_cache[key] = entry
+        # Copy the cached tokens, adding their character offsets
+        tokens = [AnnTokenDict(**t) for t in entry["tokens"]]  # type: ignore
         nonlocal offset
         for ix, t in enumerate(sent.tokens):
             tokens[ix]["i"] = offset
             offset += len(t.original or "")
-        a: Iterable[Annotation] = getattr(
-            sent, "annotations", cast(List[Annotation], [])
-        )
         len_tokens = len(tokens)
         # Reassemble the original sentence text, as the tokenizer saw it
         original = "".join((t.original or "") for t in sent.tokens)
@@ -289,27 +410,27 @@ def check_grammar(
         annotations: List[AnnDict] = [
             AnnDict(
                 # Start token index of this annotation
-                start=ann.start,
+                start=ann["start"],
                 # End token index (inclusive)
-                end=ann.end,
+                end=ann["end"],
                 # Character offset of the start of the annotation in the original text
-                start_char=tokens[ann.start].get("i", 0),
+                start_char=tokens[ann["start"]].get("i", 0),
                 # Character offset of the end of the annotation in the original text
                 # (inclusive, i.e. the offset of the last character)
                 end_char=(
-                    tokens[ann.end + 1].get("i", 0)
-                    if ann.end + 1 < len_tokens
+                    tokens[ann["end"] + 1].get("i", 0)
+                    if ann["end"] + 1 < len_tokens
                     else offset
                 )
                 - 1,
-                references=ann.references,
-                code=ann.code,
-                text=ann.text,
-                detail=ann.detail,
-                suggest=ann.suggest,
-                suggestlist=ann.suggestlist,
+                references=ann["references"],
+                code=ann["code"],
+                text=ann["text"],
+                detail=ann["detail"],
+                suggest=ann["suggest"],
+                suggestlist=ann["suggestlist"],
             )
-            for ann in a
+            for ann in entry["annotations"]
         ]
         return AnnResultDict(
             original=original,
@@ -317,18 +438,127 @@ def check_grammar(
             token=token,
             nonce=nonce,
             annotations=annotations,
-            corrected=sent.tidy_text,
+            corrected=entry["corrected"],
         )
 
-    pglist = result["paragraphs"]
-    pgs = [[encode_sentence(sent) for sent in pg] for pg in pglist]
+    # Enumerating through the job's paragraphs and sentences causes them
+    # to be parsed, one paragraph at a time
+    pgs: List[List[AnnResultDict]] = []
+    for pg in job.paragraphs():
+        encoded = [encode_sentence(sent) for sent in pg]
+        if paragraph_func is None:
+            pgs.append(encoded)
+        else:
+            paragraph_func(encoded)
 
     stats = StatsDict(
-        num_tokens=result["num_tokens"],
-        num_sentences=result["num_sentences"],
-        num_parsed=result["num_parsed"],
+        num_tokens=job.num_tokens,
+        num_sentences=job.num_sentences,
+        num_parsed=job.num_parsed,
         num_chars=offset,
-        ambiguity=result["ambiguity"],
+        ambiguity=job.ambiguity,
     )
 
     return pgs, stats
+
+
+def warm_up() -> None:
+    """Load the correction engine into memory and exercise it once,
+    including the tokenizer, BÍN lookups, the parser and the annotator"""
+    check_grammar(WARM_UP_TEXT)
+
+
+def split_into_chunks(text: str, max_chunks: int) -> List[str]:
+    """Split a text on paragraph (newline) boundaries into at most
+    max_chunks chunks of roughly equal length. Joining the chunks
+    with newlines yields the original text."""
+    lines = text.split("\n")
+    if max_chunks <= 1 or len(lines) <= 1:
+        return [text]
+    target = len(text) / max_chunks
+    last = len(lines) - 1
+    chunks: List[str] = []
+    current: List[str] = []
+    length = 0
+    for ix, line in enumerate(lines):
+        current.append(line)
+        length += len(line) + 1
+        # Close the current chunk if the target length is nearer the end
+        # of this line than the end of the next one
+        if (
+            ix < last
+            and len(chunks) < max_chunks - 1
+            and length + (len(lines[ix + 1]) + 1) / 2 >= target
+        ):
+            chunks.append("\n".join(current))
+            current = []
+            length = 0
+    chunks.append("\n".join(current))
+    return chunks
+
+
+def empty_check_result() -> CheckResult:
+    """Return the result of checking a text without any sentences"""
+    return [], StatsDict(
+        num_tokens=0, num_sentences=0, num_parsed=0, num_chars=0, ambiguity=1.0
+    )
+
+
+def rebase_paragraph(pg: List[AnnResultDict], offset: int) -> List[AnnResultDict]:
+    """Return a copy of an annotated paragraph where the character
+    offsets of tokens and annotations have been shifted by offset"""
+    return [
+        AnnResultDict(
+            sent,  # type: ignore
+            tokens=[
+                AnnTokenDict(t, i=t.get("i", 0) + offset)  # type: ignore
+                for t in sent["tokens"]
+            ],
+            annotations=[
+                AnnDict(
+                    ann,  # type: ignore
+                    start_char=ann["start_char"] + offset,
+                    end_char=ann["end_char"] + offset,
+                )
+                for ann in sent["annotations"]
+            ],
+        )
+        for sent in pg
+    ]
+
+
+def paragraph_length(pg: List[AnnResultDict]) -> int:
+    """Return the number of characters in an annotated paragraph,
+    counted in the same way as the num_chars statistic"""
+    return sum(len(sent["original"]) for sent in pg)
+
+
+def merge_check_results(results: Sequence[CheckResult]) -> CheckResult:
+    """Merge the results of checking consecutive paragraph chunks
+    of a text, cf. split_into_chunks(), into a single result, as if the
+    whole text had been checked at once. Character offsets are rebased
+    and statistics are added up. The original results are not modified."""
+    pgs: List[List[AnnResultDict]] = []
+    # Character offset of the start of the current chunk
+    offset = 0
+    num_tokens = num_sentences = num_parsed = 0
+    total_ambiguity = 0.0
+    for chunk_pgs, chunk_stats in results:
+        if offset:
+            # Create rebased copies, leaving the original results intact
+            chunk_pgs = [rebase_paragraph(pg, offset) for pg in chunk_pgs]
+        pgs.extend(chunk_pgs)
+        offset += chunk_stats["num_chars"]
+        num_tokens += chunk_stats["num_tokens"]
+        num_sentences += chunk_stats["num_sentences"]
+        num_parsed += chunk_stats["num_parsed"]
+        # The ambiguity is a token-weighted average
+        total_ambiguity += chunk_stats["ambiguity"] * chunk_stats["num_tokens"]
+    stats = StatsDict(
+        num_tokens=num_tokens,
+        num_sentences=num_sentences,
+        num_parsed=num_parsed,
+        num_chars=offset,
+        ambiguity=(total_ambiguity / num_tokens) if num_tokens > 0 else 1.0,
+    )
+    return pgs, stats
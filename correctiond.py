@@ -0,0 +1,605 @@
+"""
+
+    Yfirlestur: Online spelling and grammar correction for Icelandic
+
+    Correction service module
+
+    Copyright (C) 2020-2025 Miðeind ehf.
+
+    This software is licensed under the MIT License:
+
+        Permission is hereby granted, free of charge, to any person
+        obtaining a copy of this software and associated documentation
+        files (the "Software"), to deal in the Software without restriction,
+        including without limitation the rights to use, copy, modify, merge,
+        publish, distribute, sublicense, and/or sell copies of the Software,
+        and to permit persons to whom the Software is furnished to do so,
+        subject to the following conditions:
+
+        The above copyright notice and this permission notice shall be
+        included in all copies or substantial portions of the Software.
+
+        THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+        EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+        MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+        IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+        CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+        TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+        SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+    This module is written in Python 3 and is compatible with PyPy3.
+
+    This module contains the standalone correction service, which owns
+    the pool of correction workers (cf. correctionpool.py) and accepts
+    jobs from web server processes over a Unix socket, along with the
+    client that the web server uses to reach it.
+
+    Running the pool outside the web server means that restarting or
+    scaling the web server does not throw away warm workers, and that
+    several web server processes share one pool instead of each running
+    its own. Start the service with
+
+        python correctiond.py --socket /run/yfirlestur/correction.sock
+
+    and point the web server at it by setting CORRECTION_SOCKET to the same
+    path. Since messages are pickled, anyone who can connect to the socket
+    can run code as the service: the socket file is therefore only
+    accessible to the user that runs the service, or to a group as well,
+    as given by CORRECTION_SOCKET_MODE. Setting CORRECTION_AUTHKEY to
+    a shared secret in addition makes clients prove that they know it.
+
+    Messages are tuples, whose first element is their kind:
+
+    Client to service:
+        ("submit", job, lane, cost, texts, options, isolate, stream)
+        ("cancel", job)
+        ("report", request)
+
+    Service to client:
+        ("status", capacity, size, readiness, throughput, [(job, progress), ...])
+        ("paragraph", job, pos, paragraph)
+        ("complete", job, results)
+        ("error", job, exception)
+        ("lost", job, reason, pid)
+        ("refused", job)
+        ("report", request, memory_report)
+
+    Job and request numbers are assigned by the client. A status message is
+    sent periodically, and whenever a job is refused. The jobs of a client
+    that disconnects are cancelled.
+
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import os
+import sys
+import time
+import socket
+import logging
+import argparse
+import threading
+from functools import partial
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import (
+    Client,
+    Connection,
+    Listener,
+    answer_challenge,
+    deliver_challenge,
+)
+
+from correct import AnnResultDict
+from correctionpool import (
+    POOL_SIZE,
+    WORKER_THROUGHPUT,
+    CompleteFunc,
+    CorrectionPool,
+    ErrorFunc,
+    LostFunc,
+    ParagraphFunc,
+)
+from workerpool import PoolBusyError, WorkerLostError
+
+
+# Shared secret that clients must know to connect to the service; if empty,
+# access is only controlled by the permissions of the socket file
+CORRECTION_AUTHKEY = os.environ.get("CORRECTION_AUTHKEY", "")
+# Permissions of the socket file, in octal: by default, only the user that
+# runs the service may connect. Use e.g. 660 to admit the members of the
+# socket file's group, such as the user that runs the web server.
+CORRECTION_SOCKET_MODE = int(os.environ.get("CORRECTION_SOCKET_MODE", "600"), 8)
+# How long a connecting client may take to authenticate itself
+HANDSHAKE_TIMEOUT = 5.0  # Seconds
+# How often the service sends the progress of a client's jobs
+STATUS_INTERVAL = 0.25  # Seconds
+# How often the client tries to reconnect to the service
+RECONNECT_INTERVAL = 1.0  # Seconds
+# How long the client waits for the service to answer a report request
+REPORT_TIMEOUT = 5.0  # Seconds
+
+
+def _authkey() -> Optional[bytes]:
+    return CORRECTION_AUTHKEY.encode("utf-8") if CORRECTION_AUTHKEY else None
+
+
+def _shutdown(conn: Connection) -> None:
+    """Shut down the socket of a connection, which wakes up any thread
+    that is blocked reading from it"""
+    try:
+        with socket.fromfd(conn.fileno(), socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class ServiceSession:
+
+    """The service's end of a connection from a web server process"""
+
+    def __init__(self, pool: CorrectionPool, conn: Connection) -> None:
+        self.pool = pool
+        self.conn = conn
+        # Serializes messages from the pool's threads and the status thread
+        self.send_lock = threading.Lock()
+        self.lock = threading.Lock()
+        # The client's unfinished jobs, mapped to their pool tickets
+        self.jobs: Dict[int, int] = dict()
+        self.closed = threading.Event()
+
+    def send(self, *message: Any) -> None:
+        """Send a message to the client, unless it has gone away"""
+        if self.closed.is_set():
+            return
+        try:
+            with self.send_lock:
+                self.conn.send(message)
+        except (OSError, EOFError):
+            self.closed.set()
+
+    def authenticate(self, authkey: Optional[bytes]) -> bool:
+        """Check that the client knows the authentication key, if any,
+        and prove that we know it as well. This is done on the session's
+        own thread, so that a client that connects and stays silent does
+        not hold up others, and is cut off after HANDSHAKE_TIMEOUT."""
+        if authkey is None:
+            return True
+        timer = threading.Timer(HANDSHAKE_TIMEOUT, _shutdown, (self.conn,))
+        timer.start()
+        try:
+            deliver_challenge(self.conn, authkey)
+            answer_challenge(self.conn, authkey)
+            return True
+        except (OSError, EOFError, AuthenticationError) as e:
+            logging.warning(f"Refused a connection to the correction service: {e!r}")
+            return False
+        finally:
+            timer.cancel()
+
+    def run(self, authkey: Optional[bytes] = None) -> None:
+        """Serve the client until it disconnects"""
+        if not self.authenticate(authkey):
+            self.closed.set()
+            self.conn.close()
+            return
+        threading.Thread(target=self.send_status, daemon=True).start()
+        try:
+            while True:
+                message = self.conn.recv()
+                kind = message[0]
+                if kind == "submit":
+                    self.submit(*message[1:])
+                elif kind == "cancel":
+                    self.cancel(message[1])
+                elif kind == "report":
+                    self.send("report", message[1], self.pool.memory_report())
+        except (OSError, EOFError):
+            pass
+        finally:
+            self.closed.set()
+            self.conn.close()
+            # Nobody is waiting for the results of the client's jobs
+            with self.lock:
+                tickets = list(self.jobs.values())
+                self.jobs.clear()
+            dropped = sum(self.pool.cancel(ticket) for ticket in tickets)
+            if dropped:
+                logging.info(f"Cancelled {dropped} jobs of a disconnected client")
+
+    def submit(
+        self,
+        job: int,
+        lane: str,
+        cost: float,
+        texts: List[str],
+        options: Dict[str, Any],
+        isolate: bool,
+        stream: bool,
+    ) -> None:
+        """Submit a job to the pool on behalf of the client"""
+        with self.lock:
+            # Hold the lock, so that a job that finishes at once
+            # is not forgotten before it has been noted
+            ticket = self.pool.submit(
+                lane,
+                cost,
+                texts,
+                options,
+                partial(self.finish, "complete", job),
+                partial(self.finish, "error", job),
+                partial(self.lost, job),
+                partial(self.send, "paragraph", job) if stream else None,
+                isolate=isolate,
+            )
+            if ticket:
+                self.jobs[job] = ticket
+        if not ticket:
+            self.send("refused", job)
+            self.send_progress()
+
+    def finish(self, kind: str, job: int, outcome: Any) -> None:
+        """A job has completed or failed: send its outcome to the client"""
+        with self.lock:
+            self.jobs.pop(job, None)
+        if kind == "error":
+            try:
+                self.send(kind, job, outcome)
+                return
+            except Exception:
+                # The exception could not be pickled: send its message
+                outcome = RuntimeError(str(outcome))
+        self.send(kind, job, outcome)
+
+    def lost(self, job: int, reason: str, pid: int) -> None:
+        """The worker running a job crashed or hung"""
+        with self.lock:
+            self.jobs.pop(job, None)
+        self.send("lost", job, reason, pid)
+
+    def cancel(self, job: int) -> None:
+        """Cancel a job that the client no longer wants"""
+        with self.lock:
+            ticket = self.jobs.get(job)
+        if ticket and self.pool.cancel(ticket):
+            with self.lock:
+                self.jobs.pop(job, None)
+
+    def send_progress(self) -> None:
+        """Send the pool's status and the progress of the client's jobs"""
+        with self.lock:
+            progress = [
+                (job, self.pool.progress(ticket)) for job, ticket in self.jobs.items()
+            ]
+        self.send(
+            "status",
+            self.pool.capacity(),
+            self.pool.size,
+            self.pool.readiness(),
+            self.pool.throughput(),
+            progress,
+        )
+
+    def send_status(self) -> None:
+        """Send the status periodically, for as long as the client
+        is connected"""
+        while not self.closed.wait(STATUS_INTERVAL):
+            self.send_progress()
+
+
+class ClientJob:
+
+    """A job that the client has submitted to the service"""
+
+    __slots__ = ("complete", "error", "lost", "paragraph", "open_texts")
+
+    def __init__(
+        self,
+        complete: CompleteFunc,
+        error: ErrorFunc,
+        lost: LostFunc,
+        paragraph: Optional[ParagraphFunc],
+        open_texts: int,
+    ) -> None:
+        self.complete = complete
+        self.error = error
+        self.lost = lost
+        self.paragraph = paragraph
+        # The number of texts whose paragraphs have not all arrived
+        self.open_texts = open_texts
+
+
+class ServiceClient:
+
+    """A web server process's connection to the correction service,
+    with the same interface as a CorrectionPool that it owns"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn: Optional[Connection] = None
+        self.started = False
+        # The pool's status, as last reported by the service
+        self.size = POOL_SIZE
+        self.free = 0
+        self.status: Dict[str, Any] = dict(ready=False, workers=POOL_SIZE, warm=0)
+        self.measured = WORKER_THROUGHPUT * POOL_SIZE
+        # The unfinished jobs, by ticket, and their last reported progress
+        self.jobs: Dict[int, ClientJob] = dict()
+        self.progress_ratios: Dict[int, float] = dict()
+        # The streaming jobs whose paragraphs have not all arrived, by ticket
+        self.streams: Dict[int, ClientJob] = dict()
+        self.last_ticket = 0
+        # Memory reports requested from the service, by request number
+        self.reports: Dict[int, Tuple[threading.Event, List[Dict[str, Any]]]] = dict()
+        self.last_request = 0
+
+    def start(self) -> None:
+        """Start the thread that connects to the service and receives
+        its messages"""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        threading.Thread(target=self.receive, daemon=True).start()
+
+    def send(self, *message: Any) -> bool:
+        """Send a message to the service. Returns False if it cannot
+        be reached."""
+        with self.lock:
+            conn = self.conn
+            if conn is None:
+                return False
+            try:
+                conn.send(message)
+            except (OSError, EOFError):
+                return False
+        return True
+
+    def receive(self) -> None:
+        """Receive messages from the service, reconnecting whenever
+        the connection is lost, for as long as this process runs"""
+        while True:
+            try:
+                conn = Client(self.path, family="AF_UNIX", authkey=_authkey())
+            except (OSError, EOFError) as e:
+                logging.debug(f"Could not connect to the correction service: {e}")
+                time.sleep(RECONNECT_INTERVAL)
+                continue
+            except AuthenticationError as e:
+                # Keep trying, in case the service is restarted with the key
+                logging.error(f"The correction service refused the connection: {e}")
+                time.sleep(RECONNECT_INTERVAL)
+                continue
+            with self.lock:
+                self.conn = conn
+            logging.info(f"Connected to the correction service at {self.path}")
+            try:
+                while True:
+                    self.dispatch(conn.recv())
+            except (OSError, EOFError):
+                pass
+            except Exception as e:
+                logging.error(f"Exception in correction service client: {e}")
+            with self.lock:
+                self.conn = None
+                self.free = 0
+                self.status = dict(self.status, ready=False)
+            conn.close()
+            logging.warning("Lost the connection to the correction service")
+            self.fail_jobs()
+
+    def dispatch(self, message: Tuple[Any, ...]) -> None:
+        """Handle a message from the service"""
+        kind = message[0]
+        if kind == "status":
+            _, free, size, status, measured, progress = message
+            with self.lock:
+                self.free, self.size, self.status = free, size, status
+                self.measured = measured
+                self.progress_ratios.update(
+                    (ticket, ratio) for ticket, ratio in progress if ticket in self.jobs
+                )
+        elif kind == "paragraph":
+            _, ticket, pos, pg = message
+            self.receive_paragraph(ticket, pos, pg)
+        elif kind == "complete":
+            job = self.finish(message[1])
+            if job is not None:
+                job.complete(message[2])
+        elif kind == "error":
+            job = self.finish(message[1], failed=True)
+            if job is not None:
+                job.error(message[2])
+        elif kind == "lost":
+            job = self.finish(message[1], failed=True)
+            if job is not None:
+                job.lost(message[2], message[3])
+        elif kind == "refused":
+            job = self.finish(message[1], failed=True)
+            if job is not None:
+                job.error(PoolBusyError("Server busy, please retry later"))
+        elif kind == "report":
+            waiting = self.reports.get(message[1])
+            if waiting is not None:
+                waiting[1].append(message[2])
+                waiting[0].set()
+
+    def receive_paragraph(
+        self, ticket: int, pos: int, pg: Optional[List[AnnResultDict]]
+    ) -> None:
+        """Hand a streamed paragraph to its job"""
+        with self.lock:
+            job = self.streams.get(ticket)
+            if job is not None and pg is None:
+                job.open_texts -= 1
+                if job.open_texts <= 0:
+                    del self.streams[ticket]
+        if job is not None and job.paragraph is not None:
+            job.paragraph(pos, pg)
+
+    def finish(self, ticket: int, failed: bool = False) -> Optional[ClientJob]:
+        """Stop keeping track of a job that has finished or failed.
+        Returns the job, or None if it had already finished."""
+        with self.lock:
+            job = self.jobs.pop(ticket, None)
+            self.progress_ratios.pop(ticket, None)
+            if failed:
+                self.streams.pop(ticket, None)
+        return job
+
+    def fail_jobs(self) -> None:
+        """The connection was lost: fail the jobs that were outstanding,
+        since the service will not report their outcome"""
+        with self.lock:
+            tickets = list(self.jobs)
+        for ticket in tickets:
+            job = self.finish(ticket, failed=True)
+            if job is not None:
+                job.error(
+                    WorkerLostError("The connection to the correction service was lost")
+                )
+
+    def throughput(self) -> float:
+        """Return the throughput of the service's pool, in cost units
+        per second, as last reported by the service"""
+        return self.measured
+
+    def readiness(self) -> Dict[str, Any]:
+        """Return the readiness of the service's pool"""
+        return dict(self.status)
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until the service's pool is ready, or until the timeout
+        (in seconds) has passed. Returns True if the pool is ready."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.status["ready"]:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Return the memory report of the service's pool, or an empty
+        report if the service cannot be reached"""
+        with self.lock:
+            self.last_request += 1
+            request = self.last_request
+        waiting: Tuple[threading.Event, List[Dict[str, Any]]] = (threading.Event(), [])
+        self.reports[request] = waiting
+        try:
+            if self.send("report", request) and waiting[0].wait(REPORT_TIMEOUT):
+                return waiting[1][0]
+        finally:
+            del self.reports[request]
+        return dict(service="unreachable", workers=dict())
+
+    def capacity(self) -> int:
+        """Return the number of jobs that can be submitted at this time,
+        as last reported by the service"""
+        return self.free if self.conn is not None else 0
+
+    def submit(
+        self,
+        lane: str,
+        cost: float,
+        texts: List[str],
+        options: Dict[str, Any],
+        complete: CompleteFunc,
+        error: ErrorFunc,
+        lost: LostFunc,
+        paragraph: Optional[ParagraphFunc] = None,
+        isolate: bool = False,
+    ) -> int:
+        """Submit a job to the service, cf. CorrectionPool.submit().
+        Returns the job's ticket, or 0 if the service cannot be reached."""
+        with self.lock:
+            self.last_ticket += 1
+            ticket = self.last_ticket
+            job = ClientJob(complete, error, lost, paragraph, len(texts))
+            self.jobs[ticket] = job
+            self.progress_ratios[ticket] = 0.0
+            if paragraph is not None:
+                self.streams[ticket] = job
+            # The service has one less free slot, until it reports otherwise
+            self.free = max(0, self.free - 1)
+        message = (
+            "submit",
+            ticket,
+            lane,
+            cost,
+            texts,
+            options,
+            isolate,
+            paragraph is not None,
+        )
+        if not self.send(*message):
+            self.finish(ticket, failed=True)
+            return 0
+        return ticket
+
+    def progress(self, ticket: int) -> float:
+        """Return the progress of a job, which is 1.0 once it has finished"""
+        return self.progress_ratios.get(ticket, 1.0)
+
+    def cancel(self, ticket: int) -> bool:
+        """Ask the service to cancel a job, cf. CorrectionPool.cancel().
+        None of its callbacks will be called. Returns False if the job
+        has finished or the service cannot be reached."""
+        if ticket not in self.jobs or not self.send("cancel", ticket):
+            return False
+        self.finish(ticket, failed=True)
+        return True
+
+
+def serve(path: str) -> None:
+    """Run the correction pool and serve clients on the given socket,
+    until the process is terminated"""
+    pool = CorrectionPool()
+    pool.start()
+    if os.path.exists(path):
+        # Left behind by a previous instance
+        os.unlink(path)
+    # Create the socket file with its final permissions, so that nobody
+    # else can connect before they are set
+    umask = os.umask(0o777 & ~CORRECTION_SOCKET_MODE)
+    try:
+        # Clients are authenticated by their sessions, cf. authenticate()
+        listener = Listener(path, family="AF_UNIX")
+    finally:
+        os.umask(umask)
+    os.chmod(path, CORRECTION_SOCKET_MODE)
+    logging.info(f"Correction service listening on {path}")
+    authkey = _authkey()
+    while True:
+        try:
+            conn = listener.accept()
+        except OSError as e:
+            logging.warning(f"Could not accept a connection: {e}")
+            continue
+        session = ServiceSession(pool, conn)
+        threading.Thread(target=session.run, args=(authkey,), daemon=True).start()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Standalone correction service for Yfirlestur.is"
+    )
+    parser.add_argument(
+        "--socket",
+        default=os.environ.get("CORRECTION_SOCKET", ""),
+        help="path of the Unix socket to listen on (default: $CORRECTION_SOCKET)",
+    )
+    args = parser.parse_args()
+    if not args.socket:
+        parser.error("A socket path is required")
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    try:
+        serve(args.socket)
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,635 @@
+"""
+
+    Yfirlestur: Online spelling and grammar correction for Icelandic
+
+    Correction pool module
+
+    Copyright (C) 2020-2025 Miðeind ehf.
+
+    This software is licensed under the MIT License:
+
+        Permission is hereby granted, free of charge, to any person
+        obtaining a copy of this software and associated documentation
+        files (the "Software"), to deal in the Software without restriction,
+        including without limitation the rights to use, copy, modify, merge,
+        publish, distribute, sublicense, and/or sell copies of the Software,
+        and to permit persons to whom the Software is furnished to do so,
+        subject to the following conditions:
+
+        The above copyright notice and this permission notice shall be
+        included in all copies or substantial portions of the Software.
+
+        THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+        EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+        MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+        IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+        CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+        TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+        SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+    This module contains the pool of worker processes that correct texts,
+    along with everything that keeps it running: the scheduler that decides
+    the order of its jobs, the watchdog that detects crashed and hung
+    workers, and the autoscaler that adjusts the number of workers to the
+    load. Jobs are submitted with callbacks for their results, errors,
+    lost workers and streamed paragraphs, their progress can be read
+    while they run, and they can be cancelled.
+
+    The module does not depend on Flask, so that the pool can be owned
+    either by the web server process itself or by the standalone
+    correction service in correctiond.py, which the web server then
+    reaches over a Unix socket.
+
+"""
+
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    MutableSequence,
+    Optional,
+    Set,
+    Tuple,
+    cast,
+)
+
+import os
+import time
+import signal
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from functools import partial
+from multiprocessing import get_context
+
+from correct import AnnResultDict, warm_up
+from scheduler import Scheduler, ScheduledJob
+from autoscaler import Autoscaler
+from workerpool import (
+    FORKSERVER_PRELOAD,
+    RECYCLE_REASONS,
+    JobInfo,
+    RecyclingPool,
+    UnitResult,
+    cpu_affinity,
+    finish_fork,
+    init_worker,
+    memory_report,
+    memory_usage,
+    parse_cpu_list,
+    prepare_fork,
+    run_task,
+    set_affinity,
+)
+
+
+# How many pool jobs may be active at any given point in time?
+# This is also the number of slots in the shared-memory progress table.
+MAX_CHILD_TASKS = 250
+# How are pool worker processes started? 'fork' (the default) is fastest and
+# shares the parent's memory. 'forkserver' forks workers from a clean server
+# process that has only the correction stack loaded, without Flask, threads
+# or database connections. 'spawn' starts each worker from scratch.
+POOL_START_METHOD = os.environ.get("POOL_START_METHOD", "fork")
+_CTX = get_context(POOL_START_METHOD)
+if POOL_START_METHOD == "forkserver":
+    _CTX.set_forkserver_preload(FORKSERVER_PRELOAD)
+# Number of processes in worker pool
+# By default, use all available CPU cores except one
+POOL_SIZE = int(os.environ.get("POOL_SIZE", multiprocessing.cpu_count() - 1))
+# The pool starts with POOL_SIZE workers and is then scaled, according to
+# its load, between these limits. How often is the load sampled?
+POOL_MIN_SIZE = int(os.environ.get("POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(os.environ.get("POOL_MAX_SIZE", POOL_SIZE))
+AUTOSCALE_INTERVAL = 1.0  # Seconds
+# CPU cores reserved for the web server process, which serves HTTP requests
+# and status polls, e.g. '0'. Pool workers are kept off these cores.
+SERVER_CPUS = parse_cpu_list(os.environ.get("SERVER_CPUS", ""))
+# CPU cores to pin pool workers to, one worker per core, e.g. '2-7', or
+# 'auto' for all cores that are not reserved for the web server. By default,
+# workers are not pinned, but may run on any core that is not reserved.
+_WORKER_CPUS = os.environ.get("WORKER_CPUS", "")
+if _WORKER_CPUS == "auto":
+    WORKER_CPUS = [cpu for cpu in cpu_affinity(0) or [] if cpu not in SERVER_CPUS]
+else:
+    WORKER_CPUS = parse_cpu_list(_WORKER_CPUS)
+# Load the correction engine into the parent process before forking the pool
+# workers, so that they share it instead of each loading a private copy
+PRELOAD_BEFORE_FORK = os.environ.get("PRELOAD_BEFORE_FORK", "1") != "0"
+# Pool workers are replaced by fresh ones after this many tasks (0 = never),
+# or when their private memory exceeds this many megabytes after a task
+# (0 = no limit). Tasks are chunks of texts, or groups of batch items.
+MAX_TASKS_PER_CHILD = int(os.environ.get("MAX_TASKS_PER_CHILD", 1000))
+WORKER_MEMORY_LIMIT = int(os.environ.get("WORKER_MEMORY_LIMIT", 1024))  # MB
+# The watchdog checks the running pool jobs this often. A job whose worker
+# has run it for longer than WATCHDOG_MIN_TIME, and for longer than
+# WATCHDOG_FACTOR times its expected running time, is considered hung,
+# and the worker is killed.
+WATCHDOG_INTERVAL = 1.0  # Seconds
+WATCHDOG_MIN_TIME = float(os.environ.get("WATCHDOG_MIN_TIME", 60.0))  # Seconds
+WATCHDOG_FACTOR = 10.0
+# Initial estimate of the throughput of each pool worker, in cost units
+# per second, used until it has been measured
+WORKER_THROUGHPUT = float(os.environ.get("WORKER_THROUGHPUT", 2000.0))
+# The throughput of a worker is measured from the running times of the
+# jobs completed within this window, once there are enough of them
+THROUGHPUT_WINDOW = 60.0  # Seconds
+THROUGHPUT_SAMPLES = 8
+
+CompleteFunc = Callable[[List[UnitResult]], None]
+ErrorFunc = Callable[[BaseException], None]
+LostFunc = Callable[[str, int], None]
+ParagraphFunc = Callable[[int, Optional[List[AnnResultDict]]], None]
+
+
+class PoolJob:
+
+    """A job that has been submitted to the pool and has not finished"""
+
+    __slots__ = (
+        "ticket",
+        "slot",
+        "cost",
+        "scheduled",
+        "complete",
+        "error",
+        "lost",
+        "paragraph",
+        "open_texts",
+        "cancelled",
+    )
+
+    def __init__(
+        self,
+        ticket: int,
+        slot: int,
+        cost: float,
+        complete: CompleteFunc,
+        error: ErrorFunc,
+        lost: LostFunc,
+        paragraph: Optional[ParagraphFunc],
+    ) -> None:
+        self.ticket = ticket
+        self.slot = slot
+        self.cost = cost
+        # The scheduler's handle for the job
+        self.scheduled: Optional[ScheduledJob] = None
+        self.complete = complete
+        self.error = error
+        self.lost = lost
+        self.paragraph = paragraph
+        # The number of texts whose paragraphs have not all been streamed
+        self.open_texts = 0
+        # True if the job has been cancelled while running: it is kept
+        # until its worker stops, but its outcome is ignored
+        self.cancelled = False
+
+
+class CorrectionPool:
+
+    """The pool of worker processes that correct texts"""
+
+    def __init__(self) -> None:
+        """Create the pool object; its worker processes are created by
+        start()"""
+        self.lock = threading.Lock()
+        self.pool: Optional[RecyclingPool] = None
+        # The number of workers that the pool should have, as decided by
+        # the autoscaler
+        self.size = POOL_SIZE
+        self.autoscaler: Optional[Autoscaler] = None
+        # True once the pool's initial workers have warmed up
+        self.ready = False
+        # Shared-memory table of job progress ratios, one slot per active
+        # job. Workers write directly into their slot and the parent process
+        # reads from it, without any interprocess messaging.
+        self.progress_table: Optional[MutableSequence[float]] = None
+        # Indices of unused slots in the progress table
+        self.free_slots: List[int] = []
+        # Scheduler that decides the order in which pool jobs are run
+        self.scheduler: Optional[Scheduler] = None
+        # Shared counter of running pool workers that have warmed up
+        self.warm_workers: Optional[Any] = None
+        # Shared counters of recycled pool workers, by reason
+        self.recycled_workers: Optional[Any] = None
+        # Shared-memory table of the jobs running in each slot, cf. JobInfo
+        self.job_table: Optional[Any] = None
+        # Shared-memory table of the ticket of the job to be stopped in each
+        # slot, which a worker checks whenever it reports progress
+        self.cancel_table: Optional[Any] = None
+        # Shared table of the worker that has claimed each of the WORKER_CPUS
+        self.cpu_table: Optional[Any] = None
+        # Queue on which workers send annotated paragraphs of streaming
+        # jobs to the parent process, as soon as they have been checked
+        self.paragraph_queue: Optional[Any] = None
+        # The jobs that have not finished, by ticket, and the last
+        # ticket that was issued
+        self.jobs: Dict[int, PoolJob] = dict()
+        # The streaming jobs whose paragraphs have not all arrived, by ticket.
+        # Paragraphs travel on a queue of their own, so the last ones may
+        # arrive after the job's result.
+        self.streams: Dict[int, PoolJob] = dict()
+        self.last_ticket = 0
+        # Tickets of jobs whose worker was found dead in the last check
+        self.suspects: Set[int] = set()
+        # Number of pool jobs lost because their worker crashed or hung
+        self.lost_jobs: Dict[str, int] = dict(crashed=0, hung=0)
+        # Completion times, costs and running times of recently completed
+        # jobs, from which the throughput of the workers is measured
+        self.service: Deque[Tuple[float, float, float]] = deque()
+
+    def start(self) -> None:
+        """If needed, create the worker processes and the threads that
+        look after them"""
+        with self.lock:
+            if self.pool is not None:
+                return
+            # Allocate the progress table in shared memory before
+            # creating the pool, so that the workers can access it
+            table = cast(Any, _CTX).RawArray("d", MAX_CHILD_TASKS)
+            self.progress_table = cast(MutableSequence[float], table)
+            self.free_slots = list(range(MAX_CHILD_TASKS))
+            self.paragraph_queue = cast(Any, _CTX).SimpleQueue()
+            self.warm_workers = cast(Any, _CTX).Value("i", 0)
+            self.recycled_workers = cast(Any, _CTX).Array("i", len(RECYCLE_REASONS))
+            self.job_table = cast(Any, _CTX).RawArray(JobInfo, MAX_CHILD_TASKS)
+            self.cancel_table = cast(Any, _CTX).RawArray("l", MAX_CHILD_TASKS)
+            if WORKER_CPUS:
+                # Pin each worker to a core of its own
+                worker_cpus = WORKER_CPUS
+                self.cpu_table = cast(Any, _CTX).Array("i", len(worker_cpus))
+            else:
+                # Keep the workers off the web server's cores, if any
+                worker_cpus = []
+                if SERVER_CPUS:
+                    worker_cpus = [
+                        cpu for cpu in cpu_affinity(0) or [] if cpu not in SERVER_CPUS
+                    ]
+            self.autoscaler = Autoscaler(POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_SIZE)
+            self.size = self.autoscaler.size
+            forking = POOL_START_METHOD == "fork"
+            if forking:
+                # Load the correction engine and freeze the heap before forking,
+                # so that the workers share as much memory as possible with us
+                prepare_fork(warm_up if PRELOAD_BEFORE_FORK else None)
+            try:
+                # Initialize the worker process pool. The pool itself keeps
+                # the minimum number of workers running; the rest are
+                # started, and replaced, by autoscale().
+                self.pool = RecyclingPool(
+                    self.autoscaler.min_size,
+                    initializer=init_worker,
+                    initargs=(
+                        table,
+                        self.paragraph_queue,
+                        self.warm_workers,
+                        self.recycled_workers,
+                        WORKER_MEMORY_LIMIT * 1024,
+                        self.job_table,
+                        worker_cpus,
+                        self.cpu_table,
+                        self.cancel_table,
+                    ),
+                    maxtasksperchild=MAX_TASKS_PER_CHILD or None,
+                    context=_CTX,
+                )
+                self.pool.add_workers(self.size - self.autoscaler.min_size)
+            finally:
+                if forking:
+                    finish_fork()
+            # Keep one job per warm worker in the pool, holding the rest
+            # back in the scheduler until a worker becomes free
+            self.scheduler = Scheduler(self.pool, 1)
+            # Start a thread that delivers streamed paragraphs to their jobs
+            threading.Thread(target=self.receive_paragraphs, daemon=True).start()
+            # Start a thread that detects crashed and hung workers
+            threading.Thread(target=self.watch_workers, daemon=True).start()
+            # Start a thread that scales the pool according to its load
+            threading.Thread(target=self.autoscale, daemon=True).start()
+            # Keep this process, including its request threads, on the
+            # cores reserved for it. Workers forked from it later set
+            # their own affinity as they start.
+            set_affinity(SERVER_CPUS)
+
+    def warm_count(self) -> int:
+        """Return the number of running pool workers that have warmed up"""
+        if self.pool is None or self.warm_workers is None:
+            return 0
+        # Workers that die unexpectedly while idle are not counted out
+        return min(self.warm_workers.value, self.pool.alive_workers())
+
+    def readiness(self) -> Dict[str, Any]:
+        """Return the readiness of the pool, i.e. whether it exists
+        and all its workers have warmed up"""
+        warm = self.warm_count()
+        if warm >= self.size:
+            # Once the pool is ready, it remains so, while workers
+            # that are added or replaced later warm up
+            self.ready = True
+        return dict(ready=self.ready, workers=self.size, warm=warm)
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until all pool workers have warmed up, or until the timeout
+        (in seconds) has passed. Returns True if the pool is ready."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.readiness()["ready"]:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def recycling_report(self) -> Dict[str, int]:
+        """Return the number of pool workers that have been recycled,
+        by reason"""
+        recycled = self.recycled_workers
+        if recycled is None:
+            return {reason: 0 for reason in RECYCLE_REASONS}
+        return {reason: recycled[i] for i, reason in enumerate(RECYCLE_REASONS)}
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Return the memory usage of the parent process and of each
+        pool worker, in kB, including how much of it is shared,
+        along with the number of workers that have been recycled,
+        and the number of jobs lost to crashed or hung workers.
+        The CPU cores that each process may run on are also reported."""
+        workers: List[Any] = cast(Any, self.pool)._pool if self.pool is not None else []
+        pids = [os.getpid()] + [w.pid for w in workers if w.pid is not None]
+        return dict(
+            parent=memory_usage(os.getpid()),
+            workers=memory_report(pids[1:]),
+            cpus={str(pid): cpu_affinity(pid) for pid in pids},
+            recycled=self.recycling_report(),
+            limits=dict(tasks=MAX_TASKS_PER_CHILD, memory=WORKER_MEMORY_LIMIT * 1024),
+            lost=dict(self.lost_jobs),
+        )
+
+    def capacity(self) -> int:
+        """Return the number of jobs that can be submitted at this time"""
+        return len(self.free_slots)
+
+    def submit(
+        self,
+        lane: str,
+        cost: float,
+        texts: List[str],
+        options: Dict[str, Any],
+        complete: CompleteFunc,
+        error: ErrorFunc,
+        lost: LostFunc,
+        paragraph: Optional[ParagraphFunc] = None,
+        isolate: bool = False,
+    ) -> int:
+        """Submit a job that checks the given texts, in the given lane and
+        with the given estimated cost. Once the job has run, the complete
+        function is called with its results, or the error function with
+        its exception; if its worker crashed or hung, the lost function is
+        called with the reason and the worker's process id. If a paragraph
+        function is given, the annotated paragraphs of each text are passed
+        to it, along with the text's position, as soon as they have been
+        checked, and then None once all paragraphs of the text have been
+        passed. If isolate is True, an exception while checking a text is
+        returned as an error message in place of its result. Returns the
+        job's ticket, or 0 if too many jobs are already active."""
+        assert self.scheduler is not None
+        assert self.progress_table is not None
+        with self.lock:
+            if not self.free_slots:
+                return 0
+            slot = self.free_slots.pop()
+            self.progress_table[slot] = 0.0
+            self.last_ticket += 1
+            ticket = self.last_ticket
+            job = PoolJob(ticket, slot, cost, complete, error, lost, paragraph)
+            self.jobs[ticket] = job
+            if paragraph is not None:
+                job.open_texts = len(texts)
+                self.streams[ticket] = job
+        # Here the magic happens, i.e. the handover into child
+        # processes via pickling and interprocess communication,
+        # once the scheduler decides that the job's turn has come
+        job.scheduled = self.scheduler.submit(
+            lane,
+            cost,
+            run_task,
+            (
+                slot,
+                texts,
+                options,
+                isolate,
+                str(ticket) if paragraph is not None else "",
+                ticket,
+            ),
+            partial(self.finished, ticket, complete),
+            partial(self.failed, ticket, error),
+            key=ticket,
+        )
+        return ticket
+
+    def finish(self, ticket: int, failed: bool = False) -> Optional[PoolJob]:
+        """Stop keeping track of a job that has finished or been lost,
+        releasing its slot. The paragraphs of a failed job that are still
+        to arrive are dropped. Returns the job, or None if it had already
+        finished."""
+        with self.lock:
+            job = self.jobs.pop(ticket, None)
+            if job is not None:
+                self.free_slots.append(job.slot)
+            if failed:
+                self.streams.pop(ticket, None)
+        return job
+
+    def finished(self, ticket: int, func: Callable[[Any], None], arg: Any) -> None:
+        """A job has run: note how long it took and pass its results on"""
+        job = self.jobs.get(ticket)
+        busy: Optional[float] = None
+        if job is not None and self.job_table is not None:
+            # The job table entry is valid until the job's slot is released
+            info = self.job_table[job.slot]
+            if info.ticket == ticket:
+                busy = time.time() - info.started
+        job = self.finish(ticket)
+        if job is None or job.cancelled:
+            return
+        if busy is not None:
+            self.record_service(job.cost, busy)
+        func(arg)
+
+    def failed(self, ticket: int, func: Callable[[Any], None], arg: Any) -> None:
+        """A job has raised an exception: pass it on"""
+        job = self.finish(ticket, failed=True)
+        if job is not None and not job.cancelled:
+            func(arg)
+
+    def record_service(
+        self, cost: float, busy: float, when: Optional[float] = None
+    ) -> None:
+        """Note that a job with the given cost kept its worker busy for
+        the given number of seconds, completing at the given time
+        (in terms of time.monotonic(), by default now)"""
+        with self.lock:
+            when = time.monotonic() if when is None else when
+            self.service.append((when, cost, busy))
+
+    def worker_throughput(self) -> float:
+        """Return the throughput of a single worker while it is busy,
+        in cost units per second, as measured from recently completed
+        jobs, or the initial estimate if there are too few of them.
+        Since this only counts the time spent running jobs, it does not
+        depend on how much work arrives."""
+        with self.lock:
+            horizon = time.monotonic() - THROUGHPUT_WINDOW
+            while self.service and self.service[0][0] < horizon:
+                self.service.popleft()
+            if len(self.service) < THROUGHPUT_SAMPLES:
+                return WORKER_THROUGHPUT
+            cost = sum(cost for _, cost, _ in self.service)
+            busy = sum(busy for _, _, busy in self.service)
+        return cost / max(busy, 0.001)
+
+    def throughput(self) -> float:
+        """Return the throughput of the pool, in cost units per second,
+        i.e. that of a worker times the number of warm workers"""
+        workers = min(self.size, self.warm_count()) or self.size
+        return self.worker_throughput() * workers
+
+    def progress(self, ticket: int) -> float:
+        """Return the progress of a job, which is 1.0 once it has finished"""
+        job = self.jobs.get(ticket)
+        if job is None or job.cancelled or self.progress_table is None:
+            return 1.0
+        return self.progress_table[job.slot]
+
+    def cancel(self, ticket: int) -> bool:
+        """Cancel a job: it is dropped if it is waiting for a worker, and
+        otherwise stopped the next time it reports progress. None of its
+        callbacks will be called. Returns False if the job has finished."""
+        assert self.scheduler is not None
+        assert self.cancel_table is not None
+        with self.lock:
+            job = self.jobs.get(ticket)
+            if job is None or job.cancelled or job.scheduled is None:
+                return False
+            job.cancelled = True
+            self.streams.pop(ticket, None)
+        if self.scheduler.cancel(job.scheduled):
+            self.finish(ticket, failed=True)
+        else:
+            # The job has been handed to the pool. Its slot is released
+            # once its worker stops and the job's exception arrives.
+            self.cancel_table[job.slot] = ticket
+        return True
+
+    def receive_paragraphs(self) -> None:
+        """Receive streamed paragraphs from the workers, for as long
+        as the parent process runs, and hand them to their jobs"""
+        assert self.paragraph_queue is not None
+        while True:
+            stream, _, pos, pg = self.paragraph_queue.get()
+            ticket = int(stream)
+            with self.lock:
+                job = self.streams.get(ticket)
+                if job is not None and pg is None:
+                    # All paragraphs of a text have arrived
+                    job.open_texts -= 1
+                    if job.open_texts <= 0:
+                        del self.streams[ticket]
+            if job is not None and job.paragraph is not None:
+                # If the job is gone, e.g. because its worker crashed,
+                # the paragraph is simply dropped
+                job.paragraph(pos, pg)
+
+    def watch_workers(self) -> None:
+        """Check the running pool jobs periodically,
+        for as long as the parent process runs"""
+        while True:
+            time.sleep(WATCHDOG_INTERVAL)
+            try:
+                self.check_workers()
+            except Exception as e:
+                logging.warning(f"Exception in pool watchdog: {e}")
+
+    def check_workers(self) -> None:
+        """Find pool jobs whose worker has died, or has been running them
+        for much longer than expected, and give up on them"""
+        assert self.scheduler is not None
+        assert self.job_table is not None
+        assert self.warm_workers is not None
+        alive = {w.pid for w in cast(Any, self.pool)._pool if w.exitcode is None}
+        # Expected running time of a job, in seconds per unit of cost
+        seconds_per_cost = 1.0 / self.worker_throughput()
+        now = time.time()
+        suspects: Set[int] = set()
+        for scheduled in self.scheduler.running():
+            job = self.jobs.get(scheduled.key)
+            if job is None:
+                continue
+            info = self.job_table[job.slot]
+            if info.ticket != job.ticket:
+                # The job has not started yet
+                continue
+            if info.pid not in alive:
+                # A worker may exit just before the result of its last
+                # job is delivered: only give up on the job if its worker
+                # is still found dead in the next check
+                if job.ticket not in self.suspects:
+                    suspects.add(job.ticket)
+                    continue
+                reason = "crashed"
+            elif now - info.started > max(
+                WATCHDOG_MIN_TIME, WATCHDOG_FACTOR * job.cost * seconds_per_cost
+            ):
+                reason = "hung"
+                try:
+                    # The pool replaces the worker once it has exited
+                    os.kill(info.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            else:
+                continue
+            if self.scheduler.abandon(scheduled) and self.finish(job.ticket, True):
+                self.lost_jobs[reason] += 1
+                logging.warning(f"Pool worker {info.pid} {reason} while running a job")
+                if not job.cancelled:
+                    job.lost(reason, info.pid)
+                # The worker did not get to count itself out
+                # of the warm workers
+                with self.warm_workers.get_lock():
+                    self.warm_workers.value -= 1
+        self.suspects = suspects
+
+    def autoscale(self) -> None:
+        """Scale the pool according to its load, for as long as the
+        parent process runs"""
+        while True:
+            time.sleep(AUTOSCALE_INTERVAL)
+            try:
+                self.scale()
+            except Exception as e:
+                logging.warning(f"Exception while scaling pool: {e}")
+
+    def scale(self) -> None:
+        """Sample the load of the pool and add or remove workers as the
+        autoscaler decides. Jobs are only handed to warm workers, so that
+        added capacity is put to use once it is ready, and not before."""
+        pool, scheduler, autoscaler = self.pool, self.scheduler, self.autoscaler
+        assert pool is not None and scheduler is not None and autoscaler is not None
+        stats = scheduler.stats()
+        pending = sum(stats["pending"].values())
+        size = autoscaler.update(stats["running"], pending, time.monotonic())
+        if size != self.size:
+            logging.info(f"Scaling pool from {self.size} to {size} workers")
+            if size < self.size:
+                pool.retire_workers(self.size - size)
+            self.size = size
+        # Start workers to make up for those that have exited; the pool
+        # replaces them itself while there are fewer than the minimum.
+        # Workers that have been asked to exit, but have not done so,
+        # still count, so that this errs on the side of fewer workers.
+        missing = size - max(pool.alive_workers(), autoscaler.min_size)
+        if missing > 0:
+            pool.add_workers(missing)
+        scheduler.resize(max(1, min(size, self.warm_count())))
@@ -23,11 +23,33 @@ else:
     DIR = "/usr/share/nginx/yfirlestur.is/"  # type: ignore
     bind = "unix:" + DIR + "gunicorn.sock"
 
-# Since Yfirlestur implements its own multiprocessing pool
-# for time-consuming tasks, we don't need a fancy monkey-patching
-# worker class such as eventlet.
-worker_class = "sync"
-workers = 1
+# If ASGI is set, serve the asyncio front end in asgi.py with a Uvicorn
+# worker, so that synchronous correction requests and long-polling status
+# requests wait on its event loop instead of occupying threads
+Y_ASGI = os.environ.get("ASGI", "") in ("1", "True", "TRUE", "true", "Yes", "yes", "YES")
+
+if Y_ASGI:
+    wsgi_app = "asgi:app"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "main:app"
+    # Since Yfirlestur implements its own multiprocessing pool
+    # for time-consuming tasks, we don't need a fancy monkey-patching
+    # worker class such as eventlet.
+    worker_class = "sync"
+# More than one web worker process requires a shared task registry
+# (cf. TASK_REGISTRY in routes/api.py), so that any of them can serve
+# a task's status requests, and a standalone correction service that they
+# share (cf. correctiond.py). Otherwise, each of them would run a full
+# correction pool of its own, on the same cores as the others, with its
+# own admission control that is unaware of their load.
+workers = int(os.environ.get("WEB_WORKERS", 1))
+if workers > 1 and not (
+    os.environ.get("TASK_REGISTRY") and os.environ.get("CORRECTION_SOCKET")
+):
+    raise RuntimeError(
+        "WEB_WORKERS > 1 requires TASK_REGISTRY and CORRECTION_SOCKET to be set"
+    )
 threads = 4
 timeout = 30
 
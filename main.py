@@ -55,6 +55,8 @@ import sys
 import os
 import time
 import re
+import threading
+import multiprocessing
 import logging
 from datetime import datetime
 
@@ -350,7 +352,26 @@ else:
     )
     app.logger.info(log_str)  # type: ignore
 
-    # Pre-load the correction engine into memory
-    reynir_correct.check_single("Þetta er upphitun")
+    # Create the correction worker pool now. The correction engine is
+    # pre-loaded into memory before the workers are forked, so that they
+    # share it with this process, and each worker then warms up on its own.
+    # Readiness is reported via /ready.api. If a standalone correction
+    # service is used (cf. correctiond.py), we connect to it instead.
+    # A worker that is started with the 'spawn' method imports this module
+    # anew, and must not create a pool of its own.
+    from routes.api import ChildTask  # noqa: E402
+
+    if multiprocessing.current_process().name == "MainProcess":
+        ChildTask.init_pool()
+
+    def report_ready() -> None:
+        ChildTask.wait_until_ready()
+        app.logger.info("Instance warmed up and ready.")  # type: ignore
+        for pid, usage in ChildTask.memory_report()["workers"].items():
+            if usage is not None:
+                app.logger.info(  # type: ignore
+                    f"Worker {pid}: {usage['shared']} kB shared, "
+                    f"{usage['private']} kB private"
+                )
 
-    app.logger.info("Instance warmed up and ready.")  # type: ignore
+    threading.Thread(target=report_ready, daemon=True).start()
@@ -33,14 +33,27 @@
 
 """
 
-from typing import TYPE_CHECKING, Tuple, Dict, Any, Callable, Optional, Union, cast
+from typing import (
+    TYPE_CHECKING,
+    Tuple,
+    List,
+    Dict,
+    Any,
+    Callable,
+    Optional,
+    Union,
+    cast,
+)
 
+import os
+import heapq
 import threading
 import time
 import uuid
 import json
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from flask import (
     Blueprint,
@@ -164,9 +177,31 @@ def text_from_request(
 # The following asynchronous support code is adapted from Miguel Grinberg's
 # PyCon 2016 "Flask at Scale" tutorial: https://github.com/miguelgrinberg/flack
 
+# Number of threads that run asynchronous tasks. Can be overridden via
+# the environment.
+ASYNC_TASK_THREADS = int(os.environ.get("ASYNC_TASK_THREADS", 8))
+# Number of asynchronous tasks that may wait for a thread. When this many
+# are waiting, further requests are refused with 503 Service Unavailable
+# until there is room again. Can be overridden via the environment.
+ASYNC_TASK_QUEUE_SIZE = int(os.environ.get("ASYNC_TASK_QUEUE_SIZE", 64))
+# How long the result of a finished asynchronous task is kept (in seconds)
+ASYNC_TASK_RETENTION = 5 * 60.0
+# Suggested delay before a refused request is retried (in seconds)
+ASYNC_TASK_RETRY_AFTER = 5
+
 # A dictionary of currently living tasks
 _tasks: Dict[str, Dict[str, Any]] = dict()
 _tasks_lock = threading.Lock()
+# A heap of (deadline, task_id) tuples for finished tasks, in the order
+# in which they are to be removed from _tasks
+_task_expiry: List[Tuple[float, str]] = []
+_task_expiry_changed = threading.Condition(_tasks_lock)
+# The threads that run asynchronous tasks, and a count of the places
+# left for tasks, running or waiting
+_task_executor = ThreadPoolExecutor(
+    max_workers=ASYNC_TASK_THREADS, thread_name_prefix="async_task"
+)
+_task_places = threading.BoundedSemaphore(ASYNC_TASK_THREADS + ASYNC_TASK_QUEUE_SIZE)
 
 
 def fancy_url_for(*args: Any, **kwargs: Any) -> str:
@@ -184,27 +219,25 @@ def fancy_url_for(*args: Any, **kwargs: Any) -> str:
     return url_for(*args, **kwargs)
 
 
-def start_task_cleanup_thread() -> None:
-    """Start a background thread that cleans up old tasks"""
-
-    def clean_old_tasks() -> None:
-        """This function cleans up old tasks from an in-memory data structure"""
-        global _tasks
+def expire_tasks() -> None:
+    """Remove finished tasks from _tasks as their results expire,
+    for as long as the process runs"""
+    with _tasks_lock:
         while True:
-            # Only keep tasks that are running or
-            # that finished less than 5 minutes ago
-            five_min_ago = datetime.utcnow() - timedelta(minutes=5)
-            with _tasks_lock:
-                _tasks = {
-                    task_id: task
-                    for task_id, task in _tasks.items()
-                    if "t" not in task or task["t"] > five_min_ago
-                }
-            time.sleep(60)
+            now = time.monotonic()
+            while _task_expiry and _task_expiry[0][0] <= now:
+                _, task_id = heapq.heappop(_task_expiry)
+                _tasks.pop(task_id, None)
+            # Sleep until the next deadline, or until an earlier one is added
+            timeout = _task_expiry[0][0] - now if _task_expiry else None
+            _task_expiry_changed.wait(timeout)
+
 
+def start_task_cleanup_thread() -> None:
+    """Start a background thread that cleans up old tasks"""
     # Don't start the cleanup thread if we're only running tests
     if not current_app.config["TESTING"]:
-        thread = threading.Thread(target=clean_old_tasks)
+        thread = threading.Thread(target=expire_tasks, daemon=True)
         thread.start()
 
 
@@ -284,7 +317,9 @@ class _RequestProxy:
 
 def async_task(f: Callable[[Any], Response]) -> Callable[[Any], Tuple[Any, ...]]:
     """This decorator transforms a sync route into an asynchronous one
-    by running it in a background thread"""
+    by running it on a bounded pool of background threads. If too many
+    tasks are already running or waiting, the request is refused
+    with 503 Service Unavailable and a Retry-After header."""
 
     @wraps(f)
     def wrapped(*args: Any, **kwargs: Any) -> Tuple[Any, ...]:
@@ -298,45 +333,72 @@ def async_task(f: Callable[[Any], Response]) -> Callable[[Any], Tuple[Any, ...]]
             _tasks[task_id]["progress"] = ratio
 
         def task(app: Any, rq: Request) -> None:
-            """Run the decorated route function in a new thread"""
+            """Run the decorated route function in a background thread"""
             this_task = _tasks[task_id]
-            # Pretty ugly hack, but no better solution is apparent:
-            # Create a fresh Flask RequestContext object, wrapping our
-            # custom _RequestProxy object that can be safely passed between threads
-            with RequestContext(app, rq.environ, request=rq):
-                try:
-                    # Run the original route function and record
-                    # the response (return value)
-                    rq.set_progress_func(progress)  # type: ignore
-                    this_task["rv"] = f(*args, **kwargs)  # type: ignore
-                except HTTPException as e:
-                    this_task["rv"] = current_app.handle_http_exception(e)  # type: ignore
-                except Exception as e:
-                    # The function raised an exception, so we set a 500 error
-                    this_task["rv"] = InternalServerError()
-                    if current_app.debug:
-                        # We want to find out if something happened, so reraise
-                        raise
-                finally:
-                    # We record the time of the response, to help in garbage
-                    # collecting old tasks
+            try:
+                # Pretty ugly hack, but no better solution is apparent:
+                # Create a fresh Flask RequestContext object, wrapping our
+                # custom _RequestProxy object that can be safely passed between threads
+                with RequestContext(app, rq.environ, request=rq):
+                    try:
+                        # Run the original route function and record
+                        # the response (return value)
+                        rq.set_progress_func(progress)  # type: ignore
+                        this_task["rv"] = f(*args, **kwargs)  # type: ignore
+                    except HTTPException as e:
+                        this_task["rv"] = current_app.handle_http_exception(e)  # type: ignore
+                    except Exception as e:
+                        # The function raised an exception, so we set a 500 error
+                        this_task["rv"] = InternalServerError()
+                        if current_app.debug:
+                            # We want to find out if something happened, so reraise
+                            raise
+            except Exception:
+                # The request context could not be set up or torn down
+                this_task.setdefault("rv", InternalServerError())
+                raise
+            finally:
+                # We record the time of the response, and schedule
+                # the task for removal once its result has expired
+                with _tasks_lock:
                     this_task["t"] = datetime.utcnow()
+                    heapq.heappush(
+                        _task_expiry,
+                        (time.monotonic() + ASYNC_TASK_RETENTION, task_id),
+                    )
+                    _task_expiry_changed.notify()
+                _task_places.release()
+
+        if not _task_places.acquire(blocking=False):
+            # Too many tasks are running or waiting: apply back-pressure
+            return (
+                json.dumps(dict(valid=False, error="Server busy, try again later")),
+                503,  # SERVICE UNAVAILABLE
+                {
+                    "Retry-After": str(ASYNC_TASK_RETRY_AFTER),
+                    "Content-Type": "application/json; charset=utf-8",
+                },
+            )
 
         # Record the task, and then launch it
         with _tasks_lock:
             _tasks[task_id] = dict(progress=0.0)
+        try:
             # Create our own request proxy object that can be safely
             # passed between threads, keeping the form data and uploaded files
             # intact and available even after the original request has been closed
             rq = _RequestProxy(request)
-            new_task = threading.Thread(
-                target=task,
-                args=(current_app._get_current_object(), rq),  # type: ignore
+            _task_executor.submit(
+                task, current_app._get_current_object(), rq  # type: ignore
             )
+        except BaseException:
+            # The task never started: give back its place
+            with _tasks_lock:
+                _tasks.pop(task_id, None)
+            _task_places.release()
+            raise
 
-        new_task.start()
-
-        # After starting the task on a new thread, we return a 202 response,
+        # After queuing the task for a background thread, we return a 202 response,
         # with a link in the 'Location' header that the client can use
         # to obtain task status
         return (
@@ -27,14 +27,18 @@
 
 
     API routes
-    Note: All routes ending with .api, .task and .process are configured
-    not to be cached by nginx
+    Note: All routes ending with .api, .task, .process and .batch are
+    configured not to be cached by nginx
 
 """
 
 from typing import (
     Any,
+    AsyncIterator,
+    Callable,
+    Deque,
     Dict,
+    Iterator,
     List,
     Mapping,
     Tuple,
@@ -48,48 +52,121 @@ from typing_extensions import Literal
 
 import os
 import time
+import asyncio
+import logging
 import threading
 import json
 import uuid
+import heapq
+import queue
+import hashlib
+import math
+from collections import deque
 from datetime import datetime, timedelta
 from functools import partial
 
-import multiprocessing
-from multiprocessing.pool import Pool as MultiprocessingPool
-from multiprocessing.pool import ApplyResult
-from multiprocessing.managers import SyncManager
-from multiprocessing import get_context
+from cachetools import TTLCache
+from flask_caching.backends import NullCache, SimpleCache
 
 from flask import request, abort, url_for, current_app
 from flask.wrappers import Request, Response
 
 from settings import Settings
 
-from correct import check_grammar, validate_token_and_nonce
+from correct import (
+    AnnResultDict,
+    CheckResult,
+    empty_check_result,
+    merge_check_results,
+    paragraph_length,
+    rebase_paragraph,
+    split_into_chunks,
+    validate_token_and_nonce,
+)
 from doc import SUPPORTED_DOC_MIMETYPES, doc_class_for_mime_type
-
+from scheduler import LANE_INTERACTIVE, LANE_API, LANE_BATCH
+from taskregistry import TaskRegistry, open_registry
+from workerpool import (
+    PoolBusyError,
+    TaskCancelledError,
+    UnitResult,
+    WorkerLostError,
+)
+from correctionpool import POOL_SIZE, WORKER_THROUGHPUT, CorrectionPool
+from correctiond import ServiceClient
 from db import SessionContext
 from db.models import Correction
 
-from . import routes, better_jsonify, text_from_request
+from . import (
+    routes,
+    better_jsonify,
+    restricted,
+    text_from_request,
+    cache,
+    _MAX_TEXT_LENGTH,
+)
 
 
 T = TypeVar("T")
 
-# For how long do we keep correction task results around?
+
+# For how long do we keep correction task results around after
+# the task completes, successfully or not?
 RESULT_AVAILABILITY_WINDOW = timedelta(minutes=2)
-# How often do we check and clean up old results sitting in memory?
-CLEANUP_INTERVAL = 15  # Seconds
 # How long do we wait for a child task to complete before aborting
-# a synchronous request?
-MAX_SYNCHRONOUS_WAIT = 5 * 60.0  # 5 minutes
-# How may child processes do we allow to be active at any given point in time?
-MAX_CHILD_TASKS = 250
-# Multiprocessing context with a 'fork' start method
-_CTX = get_context("fork")
-# Number of processes in worker pool
-# By default, use all available CPU cores except one
-POOL_SIZE = int(os.environ.get("POOL_SIZE", multiprocessing.cpu_count() - 1))
+# a synchronous request? Can be overridden via the environment (in seconds).
+MAX_SYNCHRONOUS_WAIT = float(os.environ.get("MAX_SYNCHRONOUS_WAIT", 5 * 60.0))
+# A task that has not completed this long after it started is given up on
+MAX_TASK_LIFETIME = MAX_SYNCHRONOUS_WAIT + RESULT_AVAILABILITY_WINDOW.total_seconds()
+# Maximum total length, in characters, of the texts of completed tasks whose
+# results have not been collected; beyond that, the oldest ones are evicted
+RESULT_RETENTION_SIZE = int(os.environ.get("RESULT_RETENTION_SIZE", 32 * 1024 * 1024))
+# How long may a client block on a long-polling status request?
+# This should be kept below the Gunicorn worker timeout.
+MAX_LONG_POLL_WAIT = 25.0  # Seconds
+# How often do we push progress updates to Server-Sent Events clients?
+SSE_PROGRESS_INTERVAL = 0.5  # Seconds
+# How often do we send a keep-alive comment on an otherwise idle SSE stream?
+SSE_KEEPALIVE_INTERVAL = 15.0  # Seconds
+# Texts are split on paragraph boundaries into chunks of at least this many
+# characters, which are then corrected in parallel by separate pool workers
+FANOUT_CHUNK_LENGTH = int(os.environ.get("FANOUT_CHUNK_LENGTH", 1024))
+# Maximum total size of the cached correction results, measured in characters
+# of their JSON representation
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 16 * 1024 * 1024))
+# For how long do we keep a cached correction result?
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 10 * 60))  # Seconds
+# Maximum total length, in characters, of the documents that are kept
+# around for incremental re-checking, and for how long they are kept
+DOCUMENT_STORE_SIZE = int(os.environ.get("DOCUMENT_STORE_SIZE", 4 * 1024 * 1024))
+DOCUMENT_TTL = int(os.environ.get("DOCUMENT_TTL", 30 * 60))  # Seconds
+# Maximum number of texts in a single batch request
+MAX_BATCH_ITEMS = int(os.environ.get("MAX_BATCH_ITEMS", 1000))
+# How often does a streaming batch response check for newly completed items?
+BATCH_POLL_INTERVAL = 0.1  # Seconds
+# Admission control: the maximum estimated time, in seconds, that the work
+# already queued in the pool may take to clear before new tasks are refused
+# (with HTTP 429 and Retry-After). Batch requests may only fill a part of
+# the queue, leaving room for interactive requests.
+MAX_QUEUE_DELAY = float(os.environ.get("MAX_QUEUE_DELAY", 60.0))
+BATCH_QUEUE_SHARE = 0.5
+# MIME types for newline-delimited JSON
+NDJSON_MIMETYPES = frozenset(("application/x-ndjson", "application/jsonl"))
+# A job whose worker died while running it is retried this many times
+# before the task fails
+WATCHDOG_RETRIES = 1
+# Unix socket of a standalone correction service (cf. correctiond.py) that
+# owns the correction pool. By default, this process owns a pool of its own.
+CORRECTION_SOCKET = os.environ.get("CORRECTION_SOCKET", "")
+# Registry in which the status and results of asynchronous correction tasks
+# are published, so that several web server processes can serve status
+# requests for each other's tasks, e.g. 'sqlite:/var/run/yfirlestur/tasks.db'.
+# By default, tasks are only known to the process that runs them.
+TASK_REGISTRY = os.environ.get("TASK_REGISTRY", "")
+# How often is the progress of running tasks published in the registry,
+# and how often does a long-polling status request for a task that runs
+# in another process check the registry?
+REGISTRY_INTERVAL = 1.0  # Seconds
 
 
 class RequestData:
@@ -175,6 +252,14 @@ class RequestData:
             r = cast(Any, self.q).getlist(key + "[]")
         return r if isinstance(r, list) else []
 
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "RequestData":
+        """Wrap a dictionary, e.g. an item within a JSON request"""
+        rqd = cls.__new__(cls)
+        rqd.q = d
+        rqd.using_json = True
+        return rqd
+
     def __getitem__(self, key: str) -> Any:
         """Shortcut: allow indexing syntax with an empty string default"""
         return self.q.get(key, "")
@@ -258,11 +343,21 @@ OPTIONS_FLAGS: Mapping[str, str] = {
 }
 
 
+# Default values of boolean option flags, cf. check_grammar()
+OPTIONS_DEFAULTS: Mapping[str, bool] = {
+    "annotate_unparsed_sentences": True,
+    "suppress_suggestions": False,
+}
+
+
 def opts_from_request(rq: Request) -> Dict[str, Any]:
     """Extract valid options from a request into dict."""
-    d: Dict[str, Any] = dict()
+    return opts_from_data(RequestData(rq))
+
 
-    rqd = RequestData(rq)
+def opts_from_data(rqd: RequestData) -> Dict[str, Any]:
+    """Extract valid options from request data into dict."""
+    d: Dict[str, Any] = dict()
 
     for k, v in OPTIONS_FLAGS.items():
         if v == "bool":
@@ -295,7 +390,7 @@ def correct_async(version: int = 1) -> Response:
     # Launch the correction task within a child process
     # and return an intermediate HTTP 202 result including a status/result URL
     # that can be queried later to obtain the progress or the final result
-    task = ChildTask(**opts)
+    task = ChildTask(polled=True, lane=LANE_INTERACTIVE, **opts)
     return task.launch(result)
 
 
@@ -305,7 +400,23 @@ def correct_sync(version: int = 1) -> Response:
     """Correct text provided by the user, i.e. not coming from an article.
     This can be either an uploaded file or a string.
     This is a synchronous HTTP API call that is easy for third party
-    code to work with."""
+    code to work with. If the client prefers newline-delimited JSON
+    (NDJSON), via the Accept header, the annotated paragraphs are streamed
+    one per line as soon as they have been checked, followed by a final
+    line with the statistics."""
+    rv = launch_sync(version)
+    if not isinstance(rv, ChildTask):
+        return rv
+    # Block until the pool delivers a result (or an exception),
+    # or until the deadline passes, whichever comes first
+    return sync_result(rv, rv.wait(MAX_SYNCHRONOUS_WAIT))
+
+
+def launch_sync(version: int) -> Union[Response, "ChildTask"]:
+    """Launch the correction task of a synchronous request. Returns the
+    task if the request should wait for it to complete, or otherwise the
+    response to the request. This is shared by correct_sync() and the
+    asyncio front end, which waits for the task without blocking a thread."""
     valid, result = validate(request, version)
     if not valid:
         assert isinstance(result, Response)
@@ -314,20 +425,27 @@ def correct_sync(version: int = 1) -> Response:
 
     # Retrieve option flags from request
     opts = opts_from_request(request)
+    offers = ["application/json", "application/x-ndjson"]
+    stream = request.accept_mimetypes.best_match(offers, offers[0]) in NDJSON_MIMETYPES
 
-    # Launch the correction task within a child process and wait for its outcome
-    task = ChildTask(**opts)
-    task.launch(result)
-    duration = 0.0
-    INCREMENT = 1.5  # Seconds
-    # Wait for the correction task for a maximum of 5 minutes
-    while duration < MAX_SYNCHRONOUS_WAIT:
-        # Check the progress of the child task once every 1.5 seconds
-        time.sleep(INCREMENT)
-        if task.is_complete:
-            # Finished (or an exception occurred): return the result
-            return task.result()
-        duration += INCREMENT
+    # Launch the correction task within a child process
+    task = ChildTask(stream=stream, **opts)
+    rv = task.launch(result)
+    if not task.accepted:
+        # The task was not launched, probably because the server is busy
+        return rv
+    if stream:
+        return Response(task.ndjson(), mimetype="application/x-ndjson")
+    return task
+
+
+def sync_result(task: "ChildTask", complete: bool) -> Response:
+    """Return the response to a synchronous request, once its task has
+    completed or the maximum waiting time has passed"""
+    if complete:
+        return task.result()
+    # Nobody will collect the result
+    task.cancel()
     return better_jsonify(
         valid=False,
         reason=f"Request took too long to process; maximum is "
@@ -335,6 +453,196 @@ def correct_sync(version: int = 1) -> Response:
     )
 
 
+@routes.route("/recheck.api", methods=["POST"])
+@routes.route("/recheck.api/v<int:version>", methods=["POST"])
+def correct_incremental(version: int = 1) -> Response:
+    """Correct a document that is being edited, re-checking only the
+    paragraphs that have changed since the last request. If no document
+    identifier is given, a new document is created from the text in the
+    request. Otherwise, the request contains either the full new text of
+    the document or a list of paragraph-level changes. The reply is the
+    same as from /correct.api, with the addition of the document
+    identifier to use in subsequent requests."""
+    rqd = RequestData(request, use_args=False)
+    identifier = rqd.get("document")
+    changes = rqd.get("changes")
+    doc: Optional[Document] = None
+    if identifier is not None and not isinstance(identifier, str):
+        # Not something that we could have handed out
+        resp = better_jsonify(valid=False, reason="Invalid document identifier")
+        resp.status_code = 400  # BAD REQUEST
+        return resp
+    if identifier:
+        if not (1 <= version <= 1):
+            return better_jsonify(valid=False, reason="Unsupported version")
+        doc = document_store.get(identifier)
+        if doc is None:
+            # The client should start over by sending the full text
+            return better_jsonify(valid=False, reason="Unknown or expired document")
+        opts = doc.options
+    else:
+        identifier = uuid.uuid4().hex
+        opts = opts_from_request(request)
+    if doc is not None and changes is not None:
+        if not isinstance(changes, list):
+            return better_jsonify(valid=False, reason="Invalid changes")
+        try:
+            paragraphs = doc.apply_changes(changes)
+        except ValueError as e:
+            return better_jsonify(valid=False, reason=f"Error in request: {e}")
+        if sum(len(pg) + 1 for pg in paragraphs) > _MAX_TEXT_LENGTH + 1:
+            return better_jsonify(valid=False, reason="Document too long")
+    else:
+        valid, result = validate(request, version)
+        if not valid:
+            assert isinstance(result, Response)
+            return result
+        assert isinstance(result, str)
+        paragraphs = result.split("\n")
+
+    # Launch a task that only checks the paragraphs that we don't already
+    # have results for, and wait for its outcome
+    known = doc.known_results(paragraphs) if doc is not None else {}
+    task = ChildTask(keep_units=True, lane=LANE_INTERACTIVE, **opts)
+    rv = task.launch_paragraphs(paragraphs, known)
+    if not task.accepted:
+        # The task was not launched, probably because the server is busy
+        return rv
+    if not task.wait(MAX_SYNCHRONOUS_WAIT):
+        # Cancel the task and report the timeout
+        return sync_result(task, False)
+    if isinstance(task.exception, PoolBusyError):
+        # The pool had no room for the task
+        return task.result()
+    if task.exception is None:
+        # Keep the paragraph results for the next version of the document
+        units = cast(List[CheckResult], task.units)
+        document_store.put(identifier, Document(opts, paragraphs, units))
+    return better_jsonify(document=identifier, **task.outcome())
+
+
+@routes.route("/correct.batch", methods=["POST"])
+@routes.route("/correct.batch/v<int:version>", methods=["POST"])
+def correct_batch(version: int = 1) -> Response:
+    """Correct a batch of independent texts, returning the results in
+    the same order. The request is either a JSON object with an 'items'
+    list, or newline-delimited JSON (NDJSON) with one item per line. Each
+    item is a string or an object with a 'text' field and optional per-item
+    options, which override the options given at the top level of a JSON
+    request (or as URL parameters of an NDJSON request). The reply is a
+    JSON object with a 'results' list, or NDJSON with one result per line,
+    streamed as the results become available. By default, the reply is
+    in the same format as the request, which the Accept header can override."""
+    if not (1 <= version <= 1):
+        return better_jsonify(valid=False, reason="Unsupported version")
+    content_type = (request.content_type or "").split(";")[0]
+    ndjson_in = content_type in NDJSON_MIMETYPES
+    try:
+        if ndjson_in:
+            items = [
+                json.loads(line)
+                for line in request.get_data(as_text=True).splitlines()
+                if line.strip()
+            ]
+        else:
+            items = RequestData(request, use_args=False).get("items")
+            if not isinstance(items, list):
+                raise ValueError("Expected a list of items")
+    except ValueError as e:
+        return better_jsonify(valid=False, reason=f"Error in request: {e}")
+    if not items:
+        return better_jsonify(valid=False, reason="Empty request")
+    if len(items) > MAX_BATCH_ITEMS:
+        return better_jsonify(
+            valid=False, reason=f"Too many items; maximum is {MAX_BATCH_ITEMS}"
+        )
+    defaults = opts_from_request(request)
+
+    # Validate the items and group them by their options
+    texts: List[str] = []
+    errors: Dict[int, str] = dict()
+    batches: Dict[str, Tuple[Dict[str, Any], List[int]]] = dict()
+    for ix, item in enumerate(items):
+        text: Any = item
+        opts = defaults
+        if isinstance(item, dict):
+            text = item.get("text")
+            opts = dict(defaults, **opts_from_data(RequestData.from_dict(item)))
+        if not isinstance(text, str):
+            errors[ix] = "Invalid item"
+            text = ""
+        text = text[0:_MAX_TEXT_LENGTH].strip()
+        if not text and ix not in errors:
+            errors[ix] = "Empty text"
+        texts.append(text)
+        if ix not in errors:
+            key = json.dumps(opts, sort_keys=True)
+            batches.setdefault(key, (opts, []))[1].append(ix)
+
+    # Launch a batch task for each distinct set of options
+    placement: Dict[int, Tuple[ChildTask, int]] = dict()
+    tasks: List[ChildTask] = []
+    for opts, indices in batches.values():
+        task = ChildTask(batch=True, **opts)
+        task.launch_batch([texts[ix] for ix in indices])
+        if not task.accepted:
+            # The server is busy
+            reason = "Too many child tasks already running"
+            if task.retry_after:
+                reason = f"Server busy, please retry after {task.retry_after} seconds"
+            for ix in indices:
+                errors[ix] = reason
+            continue
+        tasks.append(task)
+        placement.update((ix, (task, unit)) for unit, ix in enumerate(indices))
+
+    def item_result(ix: int, deadline: float) -> Dict[str, Any]:
+        """Wait for the result of a batch item and return it as a dict"""
+        if ix in errors:
+            return dict(index=ix, valid=False, reason=errors[ix])
+        task, unit = placement[ix]
+        while task.units[unit] is None and not task.is_complete:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0.0:
+                return dict(
+                    index=ix, valid=False, reason="Request took too long to process"
+                )
+            task.wait(min(remaining, BATCH_POLL_INTERVAL))
+        result = task.units[unit]
+        if result is None:
+            # The whole pool job failed
+            exc = task.exception
+            assert exc is not None
+            result = f"Exception {type(exc).__qualname__}: {exc}"
+        if isinstance(result, str):
+            return dict(index=ix, valid=False, error=result)
+        pgs, stats = result
+        return dict(index=ix, valid=True, result=pgs, stats=stats, text=texts[ix])
+
+    def results() -> Iterator[Dict[str, Any]]:
+        """Generate the item results in order, removing the batch
+        tasks once done, or cancelling them if the client goes away"""
+        deadline = time.monotonic() + MAX_SYNCHRONOUS_WAIT
+        try:
+            for ix in range(len(items)):
+                yield item_result(ix, deadline)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    # Reply in the format of the request, unless the client prefers otherwise
+    offers = ["application/json", "application/x-ndjson"]
+    if ndjson_in:
+        offers.reverse()
+    if request.accept_mimetypes.best_match(offers, offers[0]) in NDJSON_MIMETYPES:
+        # Stream the results as newline-delimited JSON
+        return Response(
+            (json.dumps(r, ensure_ascii=False) + "\n" for r in results()),
+            mimetype="application/x-ndjson",
+        )
+    return better_jsonify(valid=True, results=list(results()))
+
+
 def validate(request: Request, version: int) -> Tuple[bool, Union[str, Response]]:
     """Validate an incoming correction request and extract the
     text to validate from it, if valid"""
@@ -379,87 +687,711 @@ def validate(request: Request, version: int) -> Tuple[bool, Union[str, Response]
     return True, text
 
 
+def group_units(units: List[int], lengths: List[int], max_groups: int) -> List[List[int]]:
+    """Partition a list of text unit indices, with the given text lengths,
+    into at most max_groups consecutive groups of roughly equal total length"""
+    if not units:
+        return []
+    target = sum(lengths) / max(1, max_groups)
+    groups: List[List[int]] = [[]]
+    length = 0
+    for unit, unit_length in zip(units, lengths):
+        if length >= target and len(groups) < max_groups:
+            # This group is full: start a new one
+            groups.append([])
+            length = 0
+        groups[-1].append(unit)
+        length += unit_length
+    return groups
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a Server-Sent Event with a JSON data payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class ResultCache:
+
+    """A cache of correction results, keyed by a hash of the text and the
+    normalized correction options. The local cache is an LRU cache with
+    a bound on the total size of the cached results, where entries also
+    expire after a time-to-live. If the app-level Flask-Caching object is
+    shared between processes, results are stored there as well."""
+
+    def __init__(self, maxsize: int, ttl: int) -> None:
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._lru: TTLCache[str, CheckResult] = TTLCache(
+            maxsize=maxsize, ttl=ttl, getsizeof=self.sizeof
+        )
+
+    @staticmethod
+    def sizeof(result: CheckResult) -> int:
+        """Return the size of a result, i.e. the length of its JSON
+        representation, since annotated results are many times larger
+        than the texts they are for"""
+        return len(json.dumps(result, ensure_ascii=False))
+
+    @property
+    def shared(self) -> bool:
+        """True if the Flask-Caching backend is shared with other
+        processes; an in-process backend would only hold a second,
+        unbounded copy of the local cache"""
+        return not isinstance(
+            getattr(cache, "cache", None), (SimpleCache, NullCache, type(None))
+        )
+
+    @staticmethod
+    def key(text: str, options: Mapping[str, Any]) -> str:
+        """Return a cache key for the given text and options"""
+        normalized: Dict[str, Any] = dict()
+        for k, v in options.items():
+            if k in OPTIONS_DEFAULTS:
+                if v != OPTIONS_DEFAULTS[k]:
+                    normalized[k] = v
+            elif isinstance(v, list):
+                if v:
+                    normalized[k] = sorted(set(v))
+            else:
+                normalized[k] = v
+        h = hashlib.sha256(text.encode("utf-8"))
+        h.update(json.dumps(normalized, sort_keys=True).encode("utf-8"))
+        return "correct:" + h.hexdigest()
+
+    def get(self, key: str) -> Optional[CheckResult]:
+        """Return a cached result, or None if not found"""
+        with self._lock:
+            result = self._lru.get(key)
+        if result is None and self.shared:
+            result = cast(Optional[CheckResult], cache.get(key))
+            if result is not None:
+                with self._lock:
+                    self._lru[key] = result
+        return result
+
+    def put(self, key: str, result: CheckResult) -> None:
+        """Store a result in the cache"""
+        with self._lock:
+            try:
+                self._lru[key] = result
+            except ValueError:
+                # Larger than the entire cache: don't store it
+                return
+        if self.shared:
+            cache.set(key, result, timeout=self._ttl)
+
+
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+
+def estimate_cost(text: str) -> float:
+    """Estimate the cost of checking a text, in abstract units. Besides
+    the length of the text, each token carries an additional cost for
+    lookups and annotation."""
+    return len(text) + 4.0 * len(text.split())
+
+
+class AdmissionControl:
+
+    """Admission control for correction tasks, which keeps track of the
+    estimated cost of the work queued in the pool and of the throughput
+    of the pool, as measured by the pool. A task is refused if the queued
+    work would take too long to clear; the caller is told when to retry."""
+
+    def __init__(self, max_delay: float, workers: int) -> None:
+        self._lock = threading.Lock()
+        self._max_delay = max_delay
+        self._default_throughput = WORKER_THROUGHPUT * max(1, workers)
+        # Estimated cost of the work that has been admitted but not completed
+        self.queued = 0.0
+        # Returns the measured throughput of the pool, once it exists
+        self.measure: Optional[Callable[[], float]] = None
+
+    @property
+    def throughput(self) -> float:
+        """Return the throughput of the pool, in cost units per second,
+        or the initial estimate if the pool does not exist yet"""
+        if self.measure is None:
+            return self._default_throughput
+        return self.measure()
+
+    def admit(self, cost: float, batch: bool = False) -> Optional[int]:
+        """Admit work with the given estimated cost, returning None.
+        If the work cannot be admitted, return the number of seconds
+        after which the client should retry."""
+        throughput = self.throughput
+        max_delay = self._max_delay * (BATCH_QUEUE_SHARE if batch else 1.0)
+        with self._lock:
+            delay = (self.queued + cost) / throughput
+            if self.queued > 0.0 and delay > max_delay:
+                return min(300, max(1, math.ceil(delay - max_delay)))
+            self.queued += cost
+        return None
+
+    def release(self, cost: float) -> None:
+        """Release admitted work, which has completed or failed"""
+        with self._lock:
+            self.queued = max(0.0, self.queued - cost)
+
+    def retry_after(self) -> int:
+        """Return the number of seconds after which a client whose work
+        found no room in the pool should retry, i.e. the time that it
+        takes the pool to clear the work that has been admitted"""
+        throughput = self.throughput
+        with self._lock:
+            return min(300, max(1, math.ceil(self.queued / throughput)))
+
+
+admission = AdmissionControl(MAX_QUEUE_DELAY, POOL_SIZE)
+
+
+class Document:
+
+    """A text that has been checked paragraph by paragraph, along with
+    the correction options used and the check result for each paragraph"""
+
+    def __init__(
+        self,
+        options: Dict[str, Any],
+        paragraphs: List[str],
+        results: List[CheckResult],
+    ) -> None:
+        self.options = options
+        self.paragraphs = paragraphs
+        self.results = results
+
+    def known_results(self, paragraphs: List[str]) -> Dict[int, CheckResult]:
+        """Return the results that can be reused for a new version of
+        the document, indexed by paragraph, matching unchanged paragraphs
+        by their text"""
+        by_text: Dict[str, CheckResult] = dict()
+        for pg, result in zip(self.paragraphs, self.results):
+            by_text.setdefault(pg, result)
+        return {ix: by_text[pg] for ix, pg in enumerate(paragraphs) if pg in by_text}
+
+    def apply_changes(self, changes: List[Dict[str, Any]]) -> List[str]:
+        """Return the paragraphs of the document after applying a list of
+        paragraph-level changes, each of which is a dict with an op of
+        'replace' (the default), 'insert' or 'delete', a paragraph index
+        and, for replacements and insertions, the new paragraph text.
+        Raises ValueError if a change is invalid."""
+        paragraphs = list(self.paragraphs)
+        for change in changes:
+            if not isinstance(change, dict):
+                raise ValueError("Invalid change")
+            op = change.get("op", "replace")
+            ix = change.get("index")
+            text = change.get("text", "")
+            if not isinstance(ix, int) or not isinstance(text, str):
+                raise ValueError("Invalid change")
+            limit = len(paragraphs) + (1 if op == "insert" else 0)
+            if not (0 <= ix < limit):
+                raise ValueError("Paragraph index out of range")
+            # A change may not introduce new paragraph boundaries
+            text = text.replace("\n", " ")
+            if op == "replace":
+                paragraphs[ix] = text
+            elif op == "insert":
+                paragraphs.insert(ix, text)
+            elif op == "delete":
+                del paragraphs[ix]
+            else:
+                raise ValueError(f"Unknown change operation '{op}'")
+        return paragraphs
+
+
+class DocumentStore:
+
+    """Documents kept around for incremental re-checking, keyed by
+    a document identifier. The store is bounded by the total length
+    of the document texts, and documents expire after a time-to-live."""
+
+    def __init__(self, maxsize: int, ttl: int) -> None:
+        self._lock = threading.Lock()
+        self._docs: TTLCache[str, Document] = TTLCache(
+            maxsize=maxsize,
+            ttl=ttl,
+            getsizeof=lambda doc: sum(len(pg) + 1 for pg in doc.paragraphs),
+        )
+
+    def get(self, identifier: str) -> Optional[Document]:
+        """Return a stored document, or None if not found or expired"""
+        with self._lock:
+            return self._docs.get(identifier)
+
+    def put(self, identifier: str, doc: Document) -> None:
+        """Store a document, replacing an earlier version if any"""
+        with self._lock:
+            try:
+                self._docs[identifier] = doc
+            except ValueError:
+                # Larger than the entire store: forget about it
+                self._docs.pop(identifier, None)
+
+
+document_store = DocumentStore(DOCUMENT_STORE_SIZE, DOCUMENT_TTL)
+
+
 class ChildTask:
     """A container class for the multiprocessing pool logic we use
     to distribute correction workloads between CPU cores"""
 
     processes: Dict[str, "ChildTask"] = dict()
-    pool: Optional[MultiprocessingPool] = None
-    manager: Optional[SyncManager] = None
+    # The correction pool, which is either owned by this process or by
+    # a standalone correction service, reached through a client
+    pool: Optional[Union[CorrectionPool, ServiceClient]] = None
     lock = threading.Lock()
-    progress: Dict[str, float] = dict()
+    # Heap of the deadlines at which tasks are evicted from the processes
+    # dict, as (time.monotonic(), identifier) tuples. An entry is stale,
+    # and ignored, if its task is gone or has been given a new deadline.
+    expiry: List[Tuple[float, str]] = []
+    # Notified when a deadline is added to the heap
+    expiry_changed = threading.Condition(lock)
+    # Total length of the texts of completed tasks in the processes dict
+    retained_chars = 0
+    # Number of tasks evicted: when their results expired, because too
+    # many results were retained, or because they never completed
+    evictions: Dict[str, int] = dict(expired=0, overflow=0, lapsed=0)
+    # Registry of asynchronous tasks shared with other web server processes,
+    # and a queue of the completed and removed tasks that are yet to be
+    # published there, cf. publish_tasks()
+    registry: TaskRegistry = open_registry(TASK_REGISTRY)
+    unpublished: "queue.Queue[Tuple[str, ChildTask]]" = queue.Queue()
+    # Whether progress is offered as Server-Sent Events streams. Set by the
+    # asyncio front end, which serves them on its event loop: under the WSGI
+    # server, each open stream would occupy one of its few threads.
+    stream_events = False
 
     @classmethod
     def init_pool(cls) -> None:
-        """If needed, create the multiprocessing pool we'll use
-        for concurrent processing of correction tasks"""
+        """If needed, create the pool we'll use for concurrent processing
+        of correction tasks, or connect to the correction service"""
+        with cls.lock:
+            if cls.pool is not None:
+                return
+            if CORRECTION_SOCKET:
+                cls.pool = ServiceClient(CORRECTION_SOCKET)
+            else:
+                cls.pool = CorrectionPool()
+        admission.measure = cls.pool.throughput
+        cls.pool.start()
+        if cls.registry.shared:
+            # Start a thread that publishes tasks in the shared registry
+            threading.Thread(target=cls.publish_tasks, daemon=True).start()
+
+    @classmethod
+    def readiness(cls) -> Dict[str, Any]:
+        """Return the readiness of the pool, i.e. whether it exists
+        and all its workers have warmed up"""
         if cls.pool is None:
-            # Set up a Manager for shared memory messaging
-            cls.manager = _CTX.Manager()
-            # Create an inter-process dict object to hold progress info
-            assert cls.manager is not None
-            cls.progress = cast(Dict[str, float], cls.manager.dict())
-            # Initialize the worker process pool
-            cls.pool = cast(Any, _CTX).Pool(POOL_SIZE)
-
-    def __init__(self, **options: Any) -> None:
+            return dict(ready=False, workers=POOL_SIZE, warm=0)
+        return cls.pool.readiness()
+
+    @classmethod
+    def memory_report(cls) -> Dict[str, Any]:
+        """Return the memory usage of the pool's parent process and of each
+        pool worker, in kB, including how much of it is shared,
+        along with the number of workers that have been recycled,
+        and the number of jobs lost to crashed or hung workers.
+        The CPU cores that each process may run on are also reported,
+        as are the number of tasks held in memory and evicted from it."""
+        report = cls.pool.memory_report() if cls.pool is not None else dict()
+        report["tasks"] = dict(
+            active=len(cls.processes),
+            retained_chars=cls.retained_chars,
+            evicted=dict(cls.evictions),
+        )
+        return report
+
+    @classmethod
+    def wait_until_ready(cls, timeout: Optional[float] = None) -> bool:
+        """Block until all pool workers have warmed up, or until the timeout
+        (in seconds) has passed. Returns True if the pool is ready."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not cls.readiness()["ready"]:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    @classmethod
+    def publish_tasks(cls) -> None:
+        """Publish asynchronous tasks in the shared registry, for as long
+        as the parent process runs: the results of completed tasks as soon
+        as they complete, and the progress of running tasks periodically.
+        This is done on a thread of its own to keep database access out
+        of the request threads and the pool's result handler."""
+        next_update = 0.0
+        while True:
+            try:
+                action, task = cls.unpublished.get(
+                    timeout=max(0.0, next_update - time.monotonic())
+                )
+                if action == "finish":
+                    with task.publish_lock:
+                        if (
+                            not task.collected
+                            and cls.processes.get(task.identifier) is task
+                        ):
+                            # Not collected from this process yet
+                            cls.registry.finish(
+                                task.identifier,
+                                task.report(),
+                                time.time()
+                                + RESULT_AVAILABILITY_WINDOW.total_seconds(),
+                            )
+                            task.published = True
+                else:
+                    cls.registry.remove(task.identifier)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                logging.error(f"Could not publish task in the registry: {e}")
+            if time.monotonic() >= next_update:
+                next_update = time.monotonic() + REGISTRY_INTERVAL
+                with cls.lock:
+                    polled = [task for task in cls.processes.values() if task.polled]
+                running = [
+                    (task.identifier, task.current_progress)
+                    for task in polled
+                    if not task.is_complete
+                ]
+                try:
+                    cls.registry.publish_progress(running)
+                    cls.registry.expire()
+                    # Cancel the tasks that other processes have been asked
+                    # to cancel, and drop those whose outcome they delivered
+                    cancelled = cls.registry.cancelled([t.identifier for t in polled])
+                except Exception as e:
+                    logging.error(f"Could not update the task registry: {e}")
+                    cancelled = []
+                for identifier in cancelled:
+                    task = cls.processes.get(identifier)
+                    if task is not None:
+                        task.cancel()
+
+    def __init__(
+        self,
+        *,
+        polled: bool = False,
+        fan_out: Optional[bool] = None,
+        keep_units: bool = False,
+        batch: bool = False,
+        stream: bool = False,
+        lane: str = LANE_API,
+        **options: Any,
+    ) -> None:
+        """Create a child task. A polled task is one whose status
+        the client queries, which is published in the shared task registry,
+        if any, so that any web server process can report it. If fan_out is True, the text is split on
+        paragraph boundaries and the parts are corrected in parallel;
+        if None, this is done for texts longer than 2*FANOUT_CHUNK_LENGTH.
+        If keep_units is True, the results of the individual parts
+        are kept in the units attribute after the task completes.
+        A batch task checks independent texts, whose results are kept
+        in the units attribute and not merged, and where an exception
+        while checking one text is reported in place of its result.
+        A streaming task delivers annotated paragraphs from the workers
+        as soon as they have been checked, cf. paragraphs().
+        The lane is the quality of service class of the task's pool jobs;
+        batch tasks always go in the batch lane."""
         # Create a new, unique (random) process identifier
         with self.__class__.lock:
             self.identifier = uuid.uuid4().hex
             self.processes[self.identifier] = self
-            # Store the initial progress in the interprocess dict
-            self.progress[self.identifier] = 0.0
-            # Initialize the process status
-            self.status: Optional[ApplyResult[Tuple[Any, ...]]] = None
-            self.task_result: Optional[Tuple[Any, ...]] = None
+            self.polled = polled and self.registry.shared
+            # For polled tasks: whether the outcome has been published in
+            # the registry, and whether this process has collected it
+            self.published = False
+            self.collected = False
+            self.publish_lock = threading.Lock()
+            self.fan_out = fan_out
+            self.keep_units = keep_units or batch
+            self.batch = batch
+            # The results of the units (chunks, paragraphs or batch items)
+            # of the text, as they arrive. For batch tasks, an error
+            # message may appear in place of a result.
+            self.units: List[Optional[UnitResult]] = []
+            # Result cache keys of batch items
+            self.unit_keys: List[str] = []
+            self.stream = stream
+            self.lane = LANE_BATCH if batch else lane
+            # For streaming tasks, the paragraphs of each unit that have
+            # arrived but not yet been consumed, and whether all paragraphs
+            # of each unit have arrived
+            self.streamed: List[Deque[List[AnnResultDict]]] = []
+            self.closed: List[bool] = []
+            # Condition that is notified when streamed paragraphs arrive
+            self.arrived = threading.Condition()
+            # The unit indices that are checked by each pool job
+            self.groups: List[List[int]] = []
+            # The text lengths of the pool jobs, used to weigh their progress
+            self.weights: List[int] = []
+            # The estimated costs of the pool jobs, held in admission control
+            # until each job completes
+            self.costs: List[float] = []
+            # The texts checked by each pool job, the ticket of its latest
+            # submission and how often it has been submitted
+            self.job_texts: List[List[str]] = []
+            self.job_tickets: List[int] = []
+            self.attempts: List[int] = []
+            # If the task was refused by admission control or found no
+            # room in the pool, the number of seconds after which the
+            # client should retry
+            self.retry_after = 0
+            self.task_result: Optional[CheckResult] = None
             self.exception: Optional[BaseException] = None
+            # Event that is set when the task has completed, either
+            # successfully or with an exception
+            self.done = threading.Event()
+            # Functions to call when the task completes, cf. wait_async()
+            self.waiters: List[Callable[[], None]] = []
+            # True if the task was accepted, i.e. dispatched to
+            # the pool or answered from the result cache
+            self.accepted = False
+            # Key of this task in the result cache
+            self.cache_key = ""
             self.text = ""
             self.started = datetime.utcnow()
             self.options = options
-            # Create the process pool that will be used for correction tasks.
-            # We do this as late as possible, upon invocation of the first ChildTask.
-            # Note that ChildTask instances are never created in child processes.
-            self.init_pool()
-
-    @staticmethod
-    def progress_func(process_id: str, progress: float) -> None:
-        """Update the child task progress in the shared dictionary"""
-        if process_id in ChildTask.progress:
-            ChildTask.progress[process_id] = progress
-
-    @staticmethod
-    def task(process_id: str, text: str, options: Dict[str, Any]) -> Tuple[Any, ...]:
-        """This is a task that runs in a child process within the pool"""
-        # We do a bit of functools.partial magic to pass the process_id as the first
-        # parameter to the progress_func whenever it is called
-        task_result = check_grammar(
-            text,
-            progress_func=partial(ChildTask.progress_func, process_id),
-            split_paragraphs=True,
-            **options,
-        )
-        # The result is automatically communicated back to the parent process via IPC
-        return task_result
-
-    def complete(self, task_result: Tuple[Any, ...]) -> None:
-        """This runs in the parent process when the task has completed
-        within the child process"""
+            # The total length of the task's texts, which stands in for the
+            # size of its result, and whether that is counted as retained
+            self.size = 0
+            self.retained = False
+            # When the task is evicted from the processes dict; until it
+            # completes, this is the end of its maximum lifetime
+            self.deadline = 0.0
+            self.expire_at(time.monotonic() + MAX_TASK_LIFETIME)
+        if self.polled:
+            self.registry.register(self.identifier, time.time() + MAX_TASK_LIFETIME)
+        # Make sure that the process pool that will be used for correction
+        # tasks exists. It is normally created, and warmed up, when the
+        # server starts; otherwise upon invocation of the first ChildTask.
+        # Note that ChildTask instances are never created in child processes.
+        self.init_pool()
+
+    def complete(self, group: int, task_results: List[UnitResult]) -> None:
+        """This runs in the parent process when a pool job of the task
+        has completed within a child process"""
+        admission.release(self.costs[group])
+        for ix, task_result in zip(self.groups[group], task_results):
+            self.units[ix] = task_result
+        if any(unit is None for unit in self.units):
+            # Still waiting for other pool jobs
+            return
+        self.assemble()
+
+    def assemble(self) -> None:
+        """Assemble the final result of the task from its units"""
+        if self.batch:
+            # Batch items are independent: cache their results individually
+            for key, unit in zip(self.unit_keys, self.units):
+                if key and not isinstance(unit, str):
+                    result_cache.put(key, cast(CheckResult, unit))
+            self.set_done()
+            return
+        units = cast(List[CheckResult], self.units)
+        if len(units) == 1:
+            task_result = units[0]
+        else:
+            # Stitch the units together, rebasing their character offsets
+            task_result = merge_check_results(units)
+        if not self.keep_units:
+            self.units = []
+        if self.cache_key:
+            result_cache.put(self.cache_key, task_result)
         self.task_result = task_result
-
-    def error(self, e: BaseException) -> None:
-        """This runs in the parent process and is called if the
-        child task raised an exception"""
-        self.exception = e
+        self.set_done()
+
+    def error(self, group: int, e: BaseException) -> None:
+        """This runs in the parent process and is called if a pool job
+        of the child task raised an exception. The task fails, so
+        its remaining pool jobs are cancelled."""
+        admission.release(self.costs[group])
+        failed = self.exception is None
+        if failed:
+            self.exception = e
+        self.set_done()
+        with self.arrived:
+            self.arrived.notify_all()
+        if failed:
+            self.cancel_jobs()
+
+    def set_done(self) -> None:
+        """Mark the task as complete, successfully or not, and keep
+        its outcome around for the result availability window"""
+        cls = self.__class__
+        with cls.lock:
+            if not self.done.is_set() and cls.processes.get(self.identifier) is self:
+                self.retained = True
+                cls.retained_chars += self.size
+                self.expire_at(
+                    time.monotonic() + RESULT_AVAILABILITY_WINDOW.total_seconds()
+                )
+                cls.evict_overflow()
+                if self.polled:
+                    cls.unpublished.put(("finish", self))
+            self.done.set()
+            for wake in self.waiters:
+                wake()
+            self.waiters = []
+
+    def expire_at(self, deadline: float) -> None:
+        """Set the time, in terms of time.monotonic(), at which the task
+        is evicted. The caller must hold the class lock."""
+        self.deadline = deadline
+        heapq.heappush(self.expiry, (deadline, self.identifier))
+        self.expiry_changed.notify()
+
+    def lost(self, group: int, reason: str, pid: int) -> None:
+        """This runs in the parent process if the worker running a pool job
+        of the task crashed or hung, as detected by check_workers(). The job
+        is retried if its worker crashed, in case that was caused by
+        something else; otherwise, the job fails."""
+        if (
+            reason == "crashed"
+            # Paragraphs of a streaming task may already have been delivered
+            and not self.stream
+            and self.attempts[group] <= WATCHDOG_RETRIES
+            and self.identifier in self.processes
+        ):
+            self.submit_job(group)
+            return
+        if reason == "crashed":
+            e = WorkerLostError("The worker process died while checking the text")
+        else:
+            e = WorkerLostError("Checking the text took too long and was stopped")
+        if self.batch:
+            # Report the error in place of each of the job's batch items
+            message = f"Exception {type(e).__qualname__}: {e}"
+            self.complete(group, [message] * len(self.groups[group]))
+        else:
+            self.error(group, e)
+
+    def receive(self, group: int, pos: int, pg: Optional[List[AnnResultDict]]) -> None:
+        """This runs in the parent process when a paragraph of a streaming
+        task arrives from a worker. The paragraph belongs to the unit at the
+        given position within the given pool job; if it is None,
+        all paragraphs of that unit have arrived."""
+        unit = self.groups[group][pos]
+        with self.arrived:
+            if pg is None:
+                self.closed[unit] = True
+            else:
+                self.streamed[unit].append(pg)
+            self.arrived.notify_all()
+
+    def paragraphs(self, deadline: float) -> Iterator[List[AnnResultDict]]:
+        """Generate the annotated paragraphs of a streaming task in order,
+        as soon as they arrive, with character offsets counted from the
+        start of the text. Stops early if the task fails or if the
+        deadline (in terms of time.monotonic()) passes."""
+        if not self.streamed and self.task_result is not None:
+            # Found in the result cache
+            yield from self.task_result[0]
+            return
+        offset = 0
+        for unit, pgs in enumerate(self.streamed):
+            # Character offset of the start of this unit
+            base = offset
+            while True:
+                with self.arrived:
+                    while not pgs and not self.closed[unit] and self.exception is None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0.0:
+                            return
+                        self.arrived.wait(remaining)
+                    if self.exception is not None:
+                        return
+                    if not pgs:
+                        # All paragraphs of this unit have been consumed
+                        break
+                    pg = pgs.popleft()
+                offset += paragraph_length(pg)
+                yield rebase_paragraph(pg, base) if base else pg
+
+    def ndjson(self) -> Iterator[str]:
+        """Generate the outcome of a streaming task as newline-delimited
+        JSON: a line for each paragraph, as soon as it has been checked,
+        followed by a final line with the statistics or an error message.
+        The task is removed once done, or cancelled if the client goes away."""
+        deadline = time.monotonic() + MAX_SYNCHRONOUS_WAIT
+        try:
+            for ix, pg in enumerate(self.paragraphs(deadline)):
+                line = dict(index=ix, paragraph=pg)
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            if self.exception is not None:
+                final = self.outcome()
+            elif all(self.closed) and self.wait(deadline - time.monotonic()):
+                assert self.task_result is not None
+                final = dict(valid=True, stats=self.task_result[1], text=self.text)
+            else:
+                final = dict(
+                    valid=False,
+                    reason=f"Request took too long to process; maximum is "
+                    f"{MAX_SYNCHRONOUS_WAIT/60.0:.1f} minutes",
+                )
+            yield json.dumps(final, ensure_ascii=False) + "\n"
+        finally:
+            self.cancel()
 
     @property
     def is_complete(self) -> bool:
         """Return True if the child process has finished this task"""
-        return self.task_result is not None or self.exception is not None
+        return self.done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the child process has finished this task or the
+        timeout (in seconds) has passed. Returns True if the task is complete."""
+        return self.done.wait(timeout)
+
+    async def wait_async(self, timeout: Optional[float] = None) -> bool:
+        """Wait, without blocking the running event loop, until the child
+        process has finished this task or the timeout (in seconds) has
+        passed. Returns True if the task is complete."""
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[None]" = loop.create_future()
+
+        def resolve() -> None:
+            if not future.done():
+                future.set_result(None)
+
+        def wake() -> None:
+            # Called from the thread that completes the task
+            try:
+                loop.call_soon_threadsafe(resolve)
+            except RuntimeError:
+                # The event loop has been closed
+                pass
+
+        with self.lock:
+            if self.done.is_set():
+                return True
+            self.waiters.append(wake)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.lock:
+                if wake in self.waiters:
+                    self.waiters.remove(wake)
+        return self.done.is_set()
 
     @property
     def current_progress(self) -> float:
         """Return the current progress of this child task"""
-        return self.progress.get(self.identifier, 0.0)
+        pool = self.pool
+        if not self.job_tickets or pool is None:
+            return 0.0
+        if len(self.job_tickets) == 1:
+            return pool.progress(self.job_tickets[0])
+        # Average the progress of the pool jobs, weighted by their length
+        progress = sum(
+            pool.progress(ticket) * w
+            for ticket, w in zip(self.job_tickets, self.weights)
+        )
+        return progress / (sum(self.weights) or 1)
 
     def finish(self) -> Tuple[Any, Any, str]:
         """Finish a task that ran within a child process,
@@ -480,41 +1412,197 @@ class ChildTask:
 
     def abort(self) -> None:
         """The child task has finished with an exception:
-        remove it from the dictionary of active tasks
-        as well as from the progress dictionary"""
-        try:
-            del self.processes[self.identifier]
-        except KeyError:
-            pass
-        try:
-            del self.progress[self.identifier]
-        except KeyError:
-            pass
+        remove it from the dictionary of active tasks"""
+        with self.__class__.lock:
+            self.remove()
+
+    def cancel(self) -> bool:
+        """Cancel the task and remove it from the dictionary of active
+        tasks. Its pool jobs are dropped if they are waiting for a worker,
+        and stopped at their next progress report if they are running.
+        Returns False if the task had already completed."""
+        self.abort()
+        if self.is_complete:
+            return False
+        self.cancel_jobs()
+        if self.exception is None:
+            self.exception = TaskCancelledError("The task was cancelled")
+        self.set_done()
+        with self.arrived:
+            self.arrived.notify_all()
+        return True
+
+    def cancel_jobs(self) -> None:
+        """Cancel those pool jobs of the task that have not finished"""
+        if self.pool is None:
+            return
+        for group, ticket in enumerate(self.job_tickets):
+            if ticket and self.pool.cancel(ticket):
+                admission.release(self.costs[group])
+
+    def remove(self) -> None:
+        """Remove the task from the dictionary of active tasks.
+        The caller must hold the class lock."""
+        cls = self.__class__
+        if cls.processes.get(self.identifier) is self:
+            del cls.processes[self.identifier]
+            if self.polled:
+                cls.unpublished.put(("remove", self))
+        if self.retained:
+            cls.retained_chars -= self.size
+            self.retained = False
 
     def launch(self, text: str) -> Any:
         """Launch a new task using a child process from the pool,
         correcting the given text"""
+        self.text = text
+        self.size = len(text)
+        self.cache_key = result_cache.key(text, self.options)
+        cached = result_cache.get(self.cache_key)
+        if self.stream:
+            # The paragraphs of a streaming task are not kept together
+            # in one place, so its result cannot be cached
+            self.cache_key = ""
+        if cached is not None:
+            # We have seen this text before: no need to involve the pool
+            self.task_result = cached
+            self.set_done()
+            self.accepted = True
+            return self.accepted_response()
+        chunks = [text]
+        num_chunks = min(self.pool.size, len(text) // FANOUT_CHUNK_LENGTH)
+        if self.fan_out or (self.fan_out is None and num_chunks > 1):
+            # Split the text on paragraph boundaries so that the
+            # chunks can be corrected in parallel
+            chunks = [c for c in split_into_chunks(text, num_chunks) if c.strip()]
+        self.units = [None] * len(chunks)
+        # Each chunk is checked by a separate pool job
+        return self.dispatch(chunks, [[ix] for ix in range(len(chunks))])
+
+    def launch_paragraphs(
+        self, paragraphs: List[str], known: Mapping[int, CheckResult]
+    ) -> Any:
+        """Launch a task that checks a text paragraph by paragraph, keeping
+        the result for each paragraph. The results in known, indexed by
+        paragraph, are reused and only the remaining paragraphs are checked."""
+        self.text = "\n".join(paragraphs)
+        self.size = len(self.text)
+        self.units = [
+            known.get(ix) if pg.strip() else empty_check_result()
+            for ix, pg in enumerate(paragraphs)
+        ]
+        pending = [ix for ix, unit in enumerate(self.units) if unit is None]
+        lengths = [len(paragraphs[ix]) for ix in pending]
+        num_groups = min(self.pool.size, sum(lengths) // FANOUT_CHUNK_LENGTH)
+        return self.dispatch(paragraphs, group_units(pending, lengths, num_groups))
+
+    def launch_batch(self, texts: List[str]) -> Any:
+        """Launch a batch task that checks a list of independent texts,
+        spreading them across the pool. Texts whose results are found
+        in the result cache are not checked again."""
+        self.size = sum(len(text) for text in texts)
+        self.unit_keys = [result_cache.key(text, self.options) for text in texts]
+        self.units = [result_cache.get(key) for key in self.unit_keys]
+        pending = [ix for ix, unit in enumerate(self.units) if unit is None]
+        lengths = [len(texts[ix]) for ix in pending]
+        # Spread the texts across the pool workers, balancing their total length
+        num_groups = min(self.pool.size, len(pending))
+        return self.dispatch(texts, group_units(pending, lengths, num_groups))
+
+    def dispatch(self, texts: List[str], groups: List[List[int]]) -> Any:
+        """Dispatch pool jobs to check the given groups of text units"""
         assert self.pool is not None
-        if len(self.processes) > MAX_CHILD_TASKS:
+        if not groups:
+            # All results are already known
+            self.assemble()
+            self.accepted = True
+            return self.accepted_response()
+        cost = sum(estimate_cost(texts[ix]) for group in groups for ix in group)
+        retry_after = admission.admit(cost, batch=self.batch)
+        if retry_after is not None:
+            # Too much work is already queued: tell the client when to retry
+            self.abort()
+            self.retry_after = retry_after
+            return (
+                json.dumps(
+                    dict(
+                        valid=False,
+                        error="Server busy, please retry later",
+                        retry_after=retry_after,
+                    )
+                ),
+                429,  # TOO MANY REQUESTS
+                {"Retry-After": str(retry_after)},
+            )
+        capacity = self.pool.capacity()
+        if capacity < len(groups):
+            # Not enough room for a fan-out: use a single pool job
+            groups = [[ix for group in groups for ix in group]]
+        if not capacity:
             # Protect the server by not allowing too many child tasks at the same time
+            admission.release(cost)
+            self.abort()
+            self.retry_after = admission.retry_after()
             return (
                 json.dumps(
                     dict(valid=False, error="Too many child tasks already running")
                 ),
                 503,  # SERVER BUSY
+                {"Retry-After": str(self.retry_after)},
             )
-        self.text = text
-        # Here the magic happens, i.e. the handover into one of the child
-        # processes via pickling and interprocess communication
-        self.status = self.pool.apply_async(
-            ChildTask.task,
-            args=(self.identifier, text, self.options),
-            callback=self.complete,
-            error_callback=self.error,
+        self.groups = groups
+        if self.stream:
+            self.streamed = [deque() for _ in texts]
+            self.closed = [False] * len(texts)
+        self.weights = [sum(len(texts[ix]) for ix in group) for group in groups]
+        self.costs = [sum(estimate_cost(texts[ix]) for ix in group) for group in groups]
+        self.job_texts = [[texts[ix] for ix in group] for group in groups]
+        self.job_tickets = [0] * len(groups)
+        self.attempts = [0] * len(groups)
+        for gix in range(len(groups)):
+            self.submit_job(gix)
+        self.accepted = True
+        return self.accepted_response()
+
+    def submit_job(self, group: int) -> None:
+        """Submit a pool job that checks a group of the task's text units"""
+        assert self.pool is not None
+        if self.exception is not None:
+            # The task has already failed or been cancelled
+            admission.release(self.costs[group])
+            return
+        self.attempts[group] += 1
+        ticket = self.pool.submit(
+            self.lane,
+            self.costs[group],
+            self.job_texts[group],
+            self.options,
+            partial(self.complete, group),
+            partial(self.error, group),
+            partial(self.lost, group),
+            partial(self.receive, group) if self.stream else None,
+            isolate=self.batch,
         )
+        self.job_tickets[group] = ticket
+        if not ticket:
+            # Another task took the last free slot in the meantime
+            self.error(group, PoolBusyError("Server busy, please retry later"))
+        elif self.exception is not None and self.pool.cancel(ticket):
+            # The task failed while the job was being submitted
+            admission.release(self.costs[group])
+
+    def accepted_response(self) -> Tuple[str, int, Dict[str, str]]:
+        """Return a HTTP 202 response for a task that has been accepted"""
         # Return a HTTP 202 status, including a status-checking URL
+        # and, if offered, a URL for a Server-Sent Events stream with
+        # the task's progress
+        body: Dict[str, Any] = dict(progress=0.0)
+        if self.stream_events:
+            body["events"] = url_for(
+                "routes.get_process_events", process=self.identifier
+            )
         return (
-            json.dumps(dict(progress=0.0)),
+            json.dumps(body),
             202,  # ACCEPTED
             {
                 "Location": url_for(
@@ -524,85 +1612,306 @@ class ChildTask:
             },
         )
 
+    def event_stream(self) -> Iterator[str]:
+        """Generate the Server-Sent Events for this child task: progress
+        events while the task is running, and finally a result event
+        containing the outcome of the task. An empty string means that
+        there is nothing to send yet; the caller should then wait for
+        the task for up to SSE_PROGRESS_INTERVAL before asking again."""
+        last_progress = -1.0
+        last_sent = started = time.monotonic()
+        while not self.is_complete:
+            now = time.monotonic()
+            if now - started > MAX_SYNCHRONOUS_WAIT:
+                data = dict(
+                    valid=False,
+                    reason=f"Request took too long to process; maximum is "
+                    f"{MAX_SYNCHRONOUS_WAIT/60.0:.1f} minutes",
+                )
+                yield sse_event("result", data)
+                return
+            progress = self.current_progress
+            if progress != last_progress:
+                last_progress = progress
+                last_sent = now
+                yield sse_event("progress", dict(progress=progress))
+            elif now - last_sent > SSE_KEEPALIVE_INTERVAL:
+                # Keep proxies from timing out an idle connection
+                last_sent = now
+                yield ": keepalive\n\n"
+            else:
+                yield ""
+        if not self.claim():
+            # Another process has delivered the outcome from the registry
+            data = dict(valid=False, error="The result has already been delivered")
+            yield sse_event("result", data)
+            return
+        yield sse_event("result", self.outcome())
+
+    def events(self) -> Iterator[str]:
+        """Generate a stream of Server-Sent Events for this child task,
+        blocking the calling thread while waiting for it"""
+        for event in self.event_stream():
+            if event:
+                yield event
+            else:
+                self.wait(SSE_PROGRESS_INTERVAL)
+
+    async def events_async(self) -> AsyncIterator[str]:
+        """Generate a stream of Server-Sent Events for this child task,
+        waiting for it on the running event loop"""
+        for event in self.event_stream():
+            if event:
+                yield event
+            else:
+                await self.wait_async(SSE_PROGRESS_INTERVAL)
+
     @classmethod
-    def get_status(cls, process_id: str) -> Any:
-        """Get the status of an ongoing correction task"""
+    def get_events(cls, process_id: str) -> Response:
+        """Return a Server-Sent Events stream for an ongoing correction task"""
+        if not cls.stream_events:
+            # Not offered by this server, cf. accepted_response()
+            abort(404)  # Return HTTP 404 NOT FOUND
         process = cls.processes.get(process_id)
         if process is None:
             # This is not an ongoing task
             abort(410)  # Return HTTP 410 GONE
+        return Response(
+            process.events(),
+            mimetype="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                # Instruct nginx not to buffer the stream
+                "X-Accel-Buffering": "no",
+            },
+        )
+
+    @classmethod
+    def get_status(cls, process_id: str, wait: float = 0.0) -> Any:
+        """Get the status of an ongoing correction task, optionally
+        waiting for up to wait seconds for it to complete"""
+        process = cls.processes.get(process_id)
+        if process is None:
+            # Not a task of this process, but perhaps of another one
+            return cls.get_shared_status(process_id, wait)
+        if wait > 0.0:
+            # Long polling: block until the task completes or the time is up
+            process.wait(wait)
+        if process.is_complete and not process.claim():
+            # Another process has delivered the outcome from the registry
+            abort(410)  # Return HTTP 410 GONE
         return process.result()
 
-    def result(self) -> Response:
-        """Return a Response object with the current status of this child task"""
-        if self.exception is not None:
-            # The task raised an exception: remove it herewith,
-            # and return an HTTP 200 reply with an error message
+    def claim(self) -> bool:
+        """Make sure that the outcome of a completed task is only delivered
+        once: if it has been published in the shared registry, this process
+        may only deliver it if no other process has done so. Returns False,
+        and removes the task, if another process got there first."""
+        if not self.polled:
+            return True
+        with self.publish_lock:
+            try:
+                claimed = not self.published or self.registry.claim(self.identifier)
+            except Exception as e:
+                logging.error(f"Could not claim task in the registry: {e}")
+                claimed = True
+            # Once collected here, the outcome is no longer published
+            self.collected = claimed
+        if not claimed:
             self.abort()
-            return better_jsonify(
+        return claimed
+
+    @classmethod
+    def cancel_task(cls, process_id: str) -> Response:
+        """Cancel a correction task, which may be run by this process
+        or, if the task registry is shared, by another one"""
+        process = cls.processes.get(process_id)
+        if process is not None:
+            process.cancel()
+        elif not cls.registry.cancel(process_id):
+            # This is not an ongoing task
+            abort(410)  # Return HTTP 410 GONE
+        return better_jsonify(valid=True)
+
+    @classmethod
+    def get_shared_status(cls, process_id: str, wait: float = 0.0) -> Any:
+        """Get the status of a correction task from the shared registry,
+        optionally waiting for up to wait seconds for it to complete"""
+        deadline = time.monotonic() + wait
+        while True:
+            entry = cls.registry.lookup(process_id)
+            if entry is None:
+                # This is not an ongoing task
+                abort(410)  # Return HTTP 410 GONE
+            progress, outcome = entry
+            if outcome is not None:
+                return better_jsonify(**outcome)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0.0:
+                return cls.progress_response(process_id, progress)
+            # Long polling: check again when the progress is next published
+            time.sleep(min(REGISTRY_INTERVAL, remaining))
+
+    def report(self) -> Dict[str, Any]:
+        """Return the outcome of a completed child task as a dict"""
+        if isinstance(self.exception, PoolBusyError):
+            # The pool had no room for the task: the client should retry
+            if not self.retry_after:
+                self.retry_after = admission.retry_after()
+            return dict(
+                valid=False, error=str(self.exception), retry_after=self.retry_after
+            )
+        if self.exception is not None:
+            return dict(
                 valid=False,
                 error=f"Exception {type(self.exception).__qualname__}: {self.exception}",
             )
-        if self.task_result is not None:
-            # Task completed: return a HTTP 200 reply with a success result
-            pgs, stats, text = self.finish()
-            return better_jsonify(valid=True, result=pgs, stats=stats, text=text)
+        if self.task_result is None:
+            raise ValueError("Child task is not complete")
+        pgs, stats = self.task_result
+        return dict(valid=True, result=pgs, stats=stats, text=self.text)
+
+    def outcome(self) -> Dict[str, Any]:
+        """Return the outcome of a completed child task as a dict,
+        removing the task from the dictionary of active tasks"""
+        if self.exception is not None:
+            # The task raised an exception: remove it herewith,
+            # and return an error message
+            self.abort()
+            return self.report()
+        pgs, stats, text = self.finish()
+        return dict(valid=True, result=pgs, stats=stats, text=text)
+
+    def result(self) -> Response:
+        """Return a Response object with the current status of this child task"""
+        if self.is_complete:
+            # Task completed, successfully or not: return a HTTP 200 reply,
+            # unless the pool had no room for it, as in dispatch()
+            resp = better_jsonify(**self.outcome())
+            if isinstance(self.exception, PoolBusyError):
+                resp.status_code = 503  # SERVER BUSY
+                resp.headers["Retry-After"] = str(self.retry_after)
+            return resp
         # Not yet completed: report progress
+        return self.progress_response(self.identifier, self.current_progress)
+
+    @staticmethod
+    def progress_response(process_id: str, progress: float) -> Response:
+        """Return a HTTP 202 response with the progress of a task
+        that has not completed"""
         return Response(
-            response=json.dumps(dict(progress=self.current_progress)),
+            response=json.dumps(dict(progress=progress)),
             status=202,  # ACCEPTED
             headers={
-                "Location": url_for(
-                    "routes.get_process_status", process=self.identifier
-                ),
+                "Location": url_for("routes.get_process_status", process=process_id),
                 "Content-Type": "application/json; charset=utf-8",
             },
         )
 
     @classmethod
-    def cleanup(cls) -> None:
-        """Clean up lapsed child tasks from the processes dict.
-        This is called every 15 seconds from a housecleaner thread."""
-        # Only keep tasks that are running or
-        # that finished within the result availability window
-        keep_results = datetime.utcnow() - RESULT_AVAILABILITY_WINDOW
+    def evict(cls, task: "ChildTask", reason: str) -> None:
+        """Evict a task from the processes dict, for the given reason.
+        The caller must hold the class lock."""
+        cls.evictions[reason] += 1
+        task.remove()
+
+    @classmethod
+    def evict_overflow(cls) -> None:
+        """Evict the completed tasks with the earliest deadlines until the
+        total size of the retained results is within the limit. The caller
+        must hold the class lock."""
+        running: List[Tuple[float, str]] = []
+        while cls.retained_chars > RESULT_RETENTION_SIZE and cls.expiry:
+            deadline, identifier = heapq.heappop(cls.expiry)
+            task = cls.processes.get(identifier)
+            if task is None or task.deadline != deadline:
+                # Stale entry
+                continue
+            if not task.retained:
+                # Still running: keep its deadline
+                running.append((deadline, identifier))
+                continue
+            logging.info(f"Evicting result of task {identifier} to free memory")
+            cls.evict(task, "overflow")
+        for entry in running:
+            heapq.heappush(cls.expiry, entry)
+
+    @classmethod
+    def expire_tasks(cls) -> None:
+        """Evict tasks from the processes dict as their deadlines pass,
+        for as long as the parent process runs: completed tasks whose
+        results have not been collected within the availability window,
+        and tasks that have not completed within their maximum lifetime"""
         with cls.lock:
-            # Create a list of completed processes that are older than the limit
-            lapsed = [
-                process.identifier
-                for process in cls.processes.values()
-                if process.started < keep_results and process.task_result is not None
-            ]
-            # Delete the lapsed processes from our list
-            for process_id in lapsed:
-                del cls.processes[process_id]
-                del cls.progress[process_id]
+            while True:
+                now = time.monotonic()
+                while cls.expiry and cls.expiry[0][0] <= now:
+                    deadline, identifier = heapq.heappop(cls.expiry)
+                    task = cls.processes.get(identifier)
+                    if task is not None and task.deadline == deadline:
+                        cls.evict(task, "expired" if task.retained else "lapsed")
+                # Sleep until the next deadline, or until an earlier one is added
+                timeout = cls.expiry[0][0] - now if cls.expiry else None
+                cls.expiry_changed.wait(timeout)
 
 
 @routes.route("/status/<process>", methods=["GET"])
 def get_process_status(process: str):
     """Return the status of a correction task. If this request returns a
     202 ACCEPTED status code, it means that the task hasn't finished yet.
-    Else, the result from the task is returned (normally with a 200 OK status)."""
-    return ChildTask.get_status(process)
+    Else, the result from the task is returned (normally with a 200 OK status).
+    If a wait=N parameter is given, the request blocks for up to N seconds
+    (long polling), returning as soon as the task completes."""
+    try:
+        wait = float(request.args.get("wait", 0.0))
+    except ValueError:
+        wait = 0.0
+    wait = max(0.0, min(wait, MAX_LONG_POLL_WAIT))
+    return ChildTask.get_status(process, wait=wait)
 
 
-def start_delete_old_child_tasks_thread() -> None:
-    """Start a background thread that cleans up old tasks"""
+@routes.route("/status/<process>", methods=["DELETE"])
+def cancel_process(process: str) -> Response:
+    """Cancel a correction task that the client no longer wants, which
+    frees the worker processes for other work. The task, and its result
+    if it has completed, are gone afterwards."""
+    return ChildTask.cancel_task(process)
 
-    def delete_tasks() -> None:
-        """This function runs every 15 seconds and initiates a clean-up
-        of completed child tasks"""
-        while True:
-            time.sleep(CLEANUP_INTERVAL)
-            ChildTask.cleanup()
 
+@routes.route("/events/<process>", methods=["GET"])
+def get_process_events(process: str) -> Response:
+    """Stream the progress of a correction task as Server-Sent Events
+    (text/event-stream). A 'progress' event is sent whenever the progress
+    changes, and a final 'result' event contains the same JSON as
+    a completed /status/<process> request."""
+    return ChildTask.get_events(process)
+
+
+def start_delete_old_child_tasks_thread() -> None:
+    """Start a background thread that evicts old tasks at their deadlines"""
     # Don't start the cleanup thread if we're only running tests
     if not current_app.config["TESTING"]:
-        thread = threading.Thread(target=delete_tasks)
+        thread = threading.Thread(target=ChildTask.expire_tasks)
         thread.start()
 
 
+@routes.route("/ready.api", methods=["GET"])
+def ready_api() -> Tuple[Response, int]:
+    """Report whether the correction pool has been created and all of its
+    workers have warmed up, with HTTP 503 until then. This is intended
+    for load balancers and deployment scripts."""
+    readiness = ChildTask.readiness()
+    return better_jsonify(**readiness), 200 if readiness["ready"] else 503
+
+
+@routes.route("/memory.api", methods=["GET"])
+@restricted
+def memory_api() -> Response:
+    """Report the memory usage of the server process and of each pool
+    worker, showing how much memory is shared between them"""
+    return better_jsonify(**ChildTask.memory_report())
+
+
 @routes.route("/exit.api", methods=["GET"])
 def exit_api():
     """Allow a server to be remotely terminated if running in debug mode"""
@@ -0,0 +1,228 @@
+"""
+
+    Yfirlestur: Online spelling and grammar correction for Icelandic
+
+    Job scheduler module
+
+    Copyright (C) 2020-2025 Miðeind ehf.
+
+    This software is licensed under the MIT License:
+
+        Permission is hereby granted, free of charge, to any person
+        obtaining a copy of this software and associated documentation
+        files (the "Software"), to deal in the Software without restriction,
+        including without limitation the rights to use, copy, modify, merge,
+        publish, distribute, sublicense, and/or sell copies of the Software,
+        and to permit persons to whom the Software is furnished to do so,
+        subject to the following conditions:
+
+        The above copyright notice and this permission notice shall be
+        included in all copies or substantial portions of the Software.
+
+        THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+        EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+        MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+        IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+        CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+        TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+        SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+    This module contains a scheduler that sits in front of the
+    multiprocessing pool used for correction jobs. Instead of handing
+    every job to the pool at once, where they would be processed in
+    first-in, first-out order, the scheduler keeps at most one job per
+    worker in the pool and holds the rest back. Whenever a worker becomes
+    free, the scheduler picks the next job to run based on its lane
+    (quality of service class) and its estimated cost, so that short
+    interactive jobs are not stuck behind large documents or batches.
+    Jobs that have waited for a long time gain priority, so that no
+    lane is starved.
+
+    The scheduler also keeps track of the jobs that it has handed to
+    the pool. If a job is lost, e.g. because its worker process crashed,
+    it can be abandoned, which frees its place in the pool for the next
+    job. A job that is no longer wanted can be cancelled while it waits.
+
+"""
+
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+import time
+import threading
+from functools import partial
+
+
+# Quality of service classes, in order of priority
+LANE_INTERACTIVE = "interactive"
+LANE_API = "api"
+LANE_BATCH = "batch"
+
+# Cost multipliers of the lanes: a job in a lower-priority lane is
+# scheduled as if it were this many times more costly
+LANE_WEIGHTS: Mapping[str, float] = {
+    LANE_INTERACTIVE: 1.0,
+    LANE_API: 4.0,
+    LANE_BATCH: 16.0,
+}
+
+# The effective cost of a waiting job is halved for every AGING_TIME
+# seconds that it has waited
+AGING_TIME = 5.0  # Seconds
+
+
+class ScheduledJob:
+
+    """A job that is waiting to be handed to the pool"""
+
+    __slots__ = (
+        "lane",
+        "cost",
+        "submitted",
+        "func",
+        "args",
+        "callback",
+        "error",
+        "key",
+        "result",
+    )
+
+    def __init__(
+        self,
+        lane: str,
+        cost: float,
+        func: Callable[..., Any],
+        args: Tuple[Any, ...],
+        callback: Callable[[Any], None],
+        error: Callable[[BaseException], None],
+        key: int = 0,
+    ) -> None:
+        self.lane = lane
+        self.cost = cost
+        self.submitted = time.monotonic()
+        self.func = func
+        self.args = args
+        self.callback = callback
+        self.error = error
+        # An identifier of the job, for the submitter's use
+        self.key = key
+        # The pool's handle for the job, once it has been handed over
+        self.result: Optional[Any] = None
+
+    def priority(self, now: float) -> float:
+        """Return the effective cost of the job; lower runs first"""
+        waited = now - self.submitted
+        return self.cost * LANE_WEIGHTS[self.lane] / 2.0 ** (waited / AGING_TIME)
+
+
+class Scheduler:
+
+    """Schedules jobs on a multiprocessing pool, shortest (weighted)
+    job first, keeping at most capacity jobs in the pool at a time"""
+
+    def __init__(self, pool: Any, capacity: int) -> None:
+        self._pool = pool
+        self._capacity = max(1, capacity)
+        self._lock = threading.Lock()
+        self._pending: List[ScheduledJob] = []
+        self._running: Set[ScheduledJob] = set()
+
+    def submit(
+        self,
+        lane: str,
+        cost: float,
+        func: Callable[..., Any],
+        args: Tuple[Any, ...],
+        callback: Callable[[Any], None],
+        error: Callable[[BaseException], None],
+        key: int = 0,
+    ) -> ScheduledJob:
+        """Submit a job to be run in the pool as soon as it gets its turn.
+        The callback or the error function is called with the result
+        or the exception, respectively, once the job has run."""
+        if lane not in LANE_WEIGHTS:
+            raise ValueError(f"Unknown lane '{lane}'")
+        job = ScheduledJob(lane, cost, func, args, callback, error, key)
+        with self._lock:
+            self._pending.append(job)
+            self._dispatch()
+        return job
+
+    def _dispatch(self) -> None:
+        """Hand the most urgent pending jobs to the pool, while there
+        is room for them. The caller must hold the lock."""
+        while self._pending and len(self._running) < self._capacity:
+            now = time.monotonic()
+            ix = min(
+                range(len(self._pending)),
+                key=lambda i: self._pending[i].priority(now),
+            )
+            job = self._pending.pop(ix)
+            self._running.add(job)
+            job.result = self._pool.apply_async(
+                job.func,
+                args=job.args,
+                callback=partial(self._finished, job, job.callback),
+                error_callback=partial(self._finished, job, job.error),
+            )
+
+    def _finished(
+        self, job: ScheduledJob, func: Callable[[Any], None], arg: Any
+    ) -> None:
+        """A job has finished: make room for the next one and
+        then invoke the job's callback or error function"""
+        with self._lock:
+            if job not in self._running:
+                # The job has been abandoned
+                return
+            self._running.remove(job)
+            self._dispatch()
+        func(arg)
+
+    def resize(self, capacity: int) -> None:
+        """Change the number of jobs that are kept in the pool at a time,
+        e.g. when the number of workers in the pool changes"""
+        with self._lock:
+            self._capacity = max(1, capacity)
+            self._dispatch()
+
+    def running(self) -> List[ScheduledJob]:
+        """Return the jobs that have been handed to the pool
+        and have not finished"""
+        with self._lock:
+            return list(self._running)
+
+    def abandon(self, job: ScheduledJob) -> bool:
+        """Give up on a job that has been handed to the pool but will never
+        finish, e.g. because its worker process died, and make room for the
+        next job. Neither the job's callback nor its error function will be
+        called. Returns False if the job was not running."""
+        with self._lock:
+            if job not in self._running:
+                return False
+            self._running.remove(job)
+            # Stop the pool from waiting for the job's result; if the
+            # result does arrive after all, the pool ignores it
+            cache = getattr(self._pool, "_cache", None)
+            if cache is not None and job.result is not None:
+                cache.pop(job.result._job, None)
+            self._dispatch()
+        return True
+
+    def cancel(self, job: ScheduledJob) -> bool:
+        """Drop a job that has not been handed to the pool yet. Neither the
+        job's callback nor its error function will be called. Returns False
+        if the job has already been handed to the pool."""
+        with self._lock:
+            if job not in self._pending:
+                return False
+            self._pending.remove(job)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of running and pending jobs, per lane"""
+        with self._lock:
+            pending = {lane: 0 for lane in LANE_WEIGHTS}
+            for job in self._pending:
+                pending[job.lane] += 1
+            return dict(running=len(self._running), pending=pending)
@@ -0,0 +1,242 @@
+"""
+
+    Yfirlestur: Online spelling and grammar correction for Icelandic
+
+    Task registry module
+
+    Copyright (C) 2020-2025 Miðeind ehf.
+
+    This software is licensed under the MIT License:
+
+        Permission is hereby granted, free of charge, to any person
+        obtaining a copy of this software and associated documentation
+        files (the "Software"), to deal in the Software without restriction,
+        including without limitation the rights to use, copy, modify, merge,
+        publish, distribute, sublicense, and/or sell copies of the Software,
+        and to permit persons to whom the Software is furnished to do so,
+        subject to the following conditions:
+
+        The above copyright notice and this permission notice shall be
+        included in all copies or substantial portions of the Software.
+
+        THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+        EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+        MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+        IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+        CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+        TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+        SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+    This module contains registries of correction tasks, which make the
+    status and results of tasks available to other web server processes
+    than the one that runs them. A status request for a task may then be
+    served by any process: while the task runs, its last published progress
+    is reported, and once it has completed, its result is taken from the
+    registry. A task may also be cancelled by any process, which passes
+    the request on to the process that runs it.
+
+    The default registry is not shared, and is used when the web server
+    runs as a single process. The SQLite registry is kept in a database
+    file that all web server processes on the machine open.
+
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+class TaskRegistry:
+
+    """A registry that is not shared with other processes. It keeps nothing,
+    since the tasks of the process itself are found in its own memory."""
+
+    # Is the registry shared with other processes?
+    shared = False
+
+    def register(self, identifier: str, expires: float) -> None:
+        """Register a new task, which is forgotten at the given time
+        (in terms of time.time()) unless it completes before then"""
+
+    def publish_progress(self, progress: List[Tuple[str, float]]) -> None:
+        """Publish the progress of running tasks, given as a list
+        of (identifier, progress) tuples"""
+
+    def finish(self, identifier: str, outcome: Dict[str, Any], expires: float) -> None:
+        """Store the outcome of a completed task, which is available
+        until the given time (in terms of time.time())"""
+
+    def lookup(self, identifier: str) -> Optional[Tuple[float, Optional[Dict[str, Any]]]]:
+        """Look up a task, returning None if it is not found. Otherwise,
+        returns a tuple of its progress and, if it has completed, its outcome.
+        The outcome is only returned once, after which the task is forgotten,
+        and the process that ran it is told to drop it, cf. cancelled()."""
+        return None
+
+    def claim(self, identifier: str) -> bool:
+        """Forget a task whose outcome the process that ran it is about
+        to deliver itself. Returns False if another process has already
+        delivered the outcome from the registry."""
+        return True
+
+    def remove(self, identifier: str) -> None:
+        """Forget a task"""
+
+    def cancel(self, identifier: str) -> bool:
+        """Forget a task and, if it has not completed, ask the process
+        that runs it to cancel it. Returns False if the task is not found."""
+        return False
+
+    def cancelled(self, identifiers: List[str]) -> List[str]:
+        """Return those of the given tasks whose cancellation has been
+        asked for, or whose outcome another process has delivered,
+        forgetting the requests"""
+        return []
+
+    def expire(self) -> None:
+        """Forget the tasks whose time is up"""
+
+
+class SQLiteRegistry(TaskRegistry):
+
+    """A registry kept in an SQLite database file, shared by
+    all processes that open the same file"""
+
+    shared = True
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        # The process that opened the connection, which is not
+        # to be used in processes forked from it
+        self._pid = 0
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """The connection to the database, opened on first use in each
+        process. The caller must hold the lock."""
+        if self._db is None or self._pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "id TEXT PRIMARY KEY, progress REAL, outcome TEXT, expires REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cancellations ("
+                "id TEXT PRIMARY KEY, expires REAL)"
+            )
+            db.commit()
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def register(self, identifier: str, expires: float) -> None:
+        with self.lock, self.db as db:
+            db.execute(
+                "INSERT OR REPLACE INTO tasks VALUES (?, 0.0, NULL, ?)",
+                (identifier, expires),
+            )
+
+    def publish_progress(self, progress: List[Tuple[str, float]]) -> None:
+        if not progress:
+            return
+        with self.lock, self.db as db:
+            db.executemany(
+                "UPDATE tasks SET progress = ? WHERE id = ? AND outcome IS NULL",
+                [(ratio, identifier) for identifier, ratio in progress],
+            )
+
+    def finish(self, identifier: str, outcome: Dict[str, Any], expires: float) -> None:
+        data = json.dumps(outcome, ensure_ascii=False)
+        with self.lock, self.db as db:
+            db.execute(
+                "UPDATE tasks SET progress = 1.0, outcome = ?, expires = ? WHERE id = ?",
+                (data, expires, identifier),
+            )
+
+    def lookup(self, identifier: str) -> Optional[Tuple[float, Optional[Dict[str, Any]]]]:
+        with self.lock, self.db as db:
+            row = db.execute(
+                "SELECT progress, outcome, expires FROM tasks "
+                "WHERE id = ? AND expires > ?",
+                (identifier, time.time()),
+            ).fetchone()
+            if row is None:
+                return None
+            progress, data, expires = row
+            if data is None:
+                return progress, None
+            # The outcome is delivered once: if another process got
+            # to it first, the task is gone
+            cursor = db.execute("DELETE FROM tasks WHERE id = ?", (identifier,))
+            if not cursor.rowcount:
+                return None
+            # Tell the process that ran the task to drop its copy
+            db.execute(
+                "INSERT OR REPLACE INTO cancellations VALUES (?, ?)",
+                (identifier, expires),
+            )
+            return progress, json.loads(data)
+
+    def claim(self, identifier: str) -> bool:
+        with self.lock, self.db as db:
+            cursor = db.execute("DELETE FROM tasks WHERE id = ?", (identifier,))
+            return cursor.rowcount > 0
+
+    def remove(self, identifier: str) -> None:
+        with self.lock, self.db as db:
+            db.execute("DELETE FROM tasks WHERE id = ?", (identifier,))
+
+    def cancel(self, identifier: str) -> bool:
+        with self.lock, self.db as db:
+            row = db.execute(
+                "SELECT outcome, expires FROM tasks WHERE id = ? AND expires > ?",
+                (identifier, time.time()),
+            ).fetchone()
+            if row is None:
+                return False
+            db.execute("DELETE FROM tasks WHERE id = ?", (identifier,))
+            if row[0] is None:
+                db.execute(
+                    "INSERT OR REPLACE INTO cancellations VALUES (?, ?)",
+                    (identifier, row[1]),
+                )
+            return True
+
+    def cancelled(self, identifiers: List[str]) -> List[str]:
+        if not identifiers:
+            return []
+        with self.lock, self.db as db:
+            # The table only holds requests until their tasks expire, so it
+            # is read in full, rather than binding one SQL variable for each
+            # task; older versions of SQLite only allow 999 of them
+            requested = {row[0] for row in db.execute("SELECT id FROM cancellations")}
+            found = [i for i in identifiers if i in requested]
+            db.executemany(
+                "DELETE FROM cancellations WHERE id = ?", [(i,) for i in found]
+            )
+        return found
+
+    def expire(self) -> None:
+        now = time.time()
+        with self.lock, self.db as db:
+            db.execute("DELETE FROM tasks WHERE expires <= ?", (now,))
+            db.execute("DELETE FROM cancellations WHERE expires <= ?", (now,))
+
+
+def open_registry(spec: str) -> TaskRegistry:
+    """Open the task registry given by a specification such as
+    'sqlite:/var/run/yfirlestur/tasks.db', or an unshared registry
+    if the specification is empty"""
+    if not spec:
+        return TaskRegistry()
+    kind, _, location = spec.partition(":")
+    if kind == "sqlite" and location:
+        return SQLiteRegistry(location)
+    raise ValueError(f"Unknown task registry: {spec}")
@@ -32,7 +32,9 @@
 from typing import Dict, Any, List
 
 import sys
+import json
 import os
+import time
 
 import pytest
 from flask.testing import FlaskClient
@@ -164,6 +166,282 @@ def test_api_async_routes(client: FlaskClient):
     assert "progress" in resp.json and isinstance(resp.json["progress"], float)
     assert resp.headers["Location"].startswith("/status/")
 
+    # Long-poll the status URL until the task completes
+    resp = client.get(resp.headers["Location"] + "?wait=20")
+    verify_correct_api_response(resp)
+
+
+def test_api_task_eviction(client: FlaskClient, monkeypatch: pytest.MonkeyPatch):
+    """Test that uncollected results are evicted when too many are retained."""
+    import routes.api
+    from routes.api import ChildTask
+
+    monkeypatch.setattr(routes.api, "RESULT_RETENTION_SIZE", 0)
+    evicted = ChildTask.evictions["overflow"]
+    resp = client.post("/correct.task", data={"text": "Þetta er önnur prufa."})
+    assert resp.status_code == 202  # Accepted
+    # The result is evicted as soon as the task completes
+    for _ in range(200):
+        if ChildTask.evictions["overflow"] > evicted:
+            break
+        time.sleep(0.1)
+    assert ChildTask.evictions["overflow"] == evicted + 1
+    resp = client.get(resp.headers["Location"])
+    assert resp.status_code == 410  # Gone
+
+
+def test_async_task_back_pressure(monkeypatch: pytest.MonkeyPatch):
+    """Test that @async_task refuses tasks when all its places are taken."""
+    import threading
+    import routes
+
+    monkeypatch.setattr(routes, "_task_places", threading.BoundedSemaphore(1))
+    gate = threading.Event()
+
+    @routes.async_task
+    def work() -> Any:
+        gate.wait(10.0)
+        return routes.better_jsonify(valid=True)
+
+    with app.test_request_context("/work"):
+        first = work()
+        assert first[1] == 202  # Accepted
+        busy = work()
+        assert busy[1] == 503  # Service Unavailable
+        assert "Retry-After" in busy[2]
+        gate.set()
+
+    def finished(response: Any) -> Dict[str, Any]:
+        """Wait for the place of an accepted task to be given back"""
+        task_id = response[2]["Location"].rsplit("/", 1)[-1]
+        for _ in range(100):
+            if "t" in routes._tasks[task_id]:
+                break
+            time.sleep(0.1)
+        # The place is given back right after the time has been noted
+        time.sleep(0.1)
+        # The finished task awaits expiry
+        assert any(t == task_id for _, t in routes._task_expiry)
+        return routes._tasks[task_id]
+
+    assert "rv" in finished(first)
+    with app.test_request_context("/work"):
+        second = work()
+        assert second[1] == 202
+    finished(second)
+
+    def fail(*args: Any, **kwargs: Any) -> Any:
+        raise RuntimeError("No request context")
+
+    # A task whose request context cannot be created fails,
+    # and also gives back its place
+    monkeypatch.setattr(routes, "RequestContext", fail)
+    with app.test_request_context("/work"):
+        third = work()
+    assert finished(third)["rv"].code == 500
+    with app.test_request_context("/work"):
+        assert work()[1] == 202
+
+
+def test_asgi_correct_sync():
+    """Test synchronous correction requests via the asyncio front end."""
+    import asyncio
+    from asgi import app as asgi_app
+
+    async def post(text: str) -> Dict[str, Any]:
+        messages = [
+            dict(type="http.request", body=f"text={text}".encode("utf-8")),
+        ]
+        response: Dict[str, Any] = dict(body=b"")
+
+        async def receive() -> Dict[str, Any]:
+            if messages:
+                return messages.pop(0)
+            # The client stays connected until it has its response
+            await asyncio.Event().wait()
+            return dict(type="http.disconnect")
+
+        async def send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            else:
+                response["body"] += message.get("body", b"")
+
+        scope = dict(
+            type="http",
+            method="POST",
+            path="/correct.api",
+            query_string=b"",
+            headers=[(b"content-type", b"application/x-www-form-urlencoded")],
+        )
+        await asgi_app(scope, receive, send)
+        return response
+
+    async def post_all() -> List[Dict[str, Any]]:
+        return await asyncio.gather(
+            post("Þetta er prufa."), post("Þetta er önnur prufa.")
+        )
+
+    for response in asyncio.run(post_all()):
+        assert response["status"] == 200
+        assert json.loads(response["body"])["valid"]
+
+
+def test_asgi_event_stream(client: FlaskClient, monkeypatch: pytest.MonkeyPatch):
+    """Test that progress streams are only offered by the asyncio front end,
+    which serves them on its event loop."""
+    import asyncio
+    from asgi import app as asgi_app
+    from routes.api import ChildTask
+
+    monkeypatch.setattr(ChildTask, "stream_events", False)
+    resp = client.post("/correct.task", data={"text": "Þetta er prufa."})
+    assert resp.status_code == 202  # Accepted
+    assert resp.json and "events" not in resp.json
+    resp = client.get("/events/" + resp.headers["Location"][len("/status/") :])
+    assert not resp.content_type.startswith("text/event-stream")
+    monkeypatch.setattr(ChildTask, "stream_events", True)
+
+    async def request(method: str, path: str, body: bytes = b"") -> Dict[str, Any]:
+        messages = [dict(type="http.request", body=body)]
+        response: Dict[str, Any] = dict(body=b"")
+
+        async def receive() -> Dict[str, Any]:
+            if messages:
+                return messages.pop(0)
+            await asyncio.Event().wait()
+            return dict(type="http.disconnect")
+
+        async def send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            else:
+                response["body"] += message.get("body", b"")
+
+        scope = dict(
+            type="http",
+            method=method,
+            path=path,
+            query_string=b"",
+            headers=[(b"content-type", b"application/x-www-form-urlencoded")],
+        )
+        await asgi_app(scope, receive, send)
+        return response
+
+    async def stream() -> List[str]:
+        text = "text=Þetta er önnur prufa.".encode("utf-8")
+        response = await request("POST", "/correct.task", text)
+        assert response["status"] == 202  # Accepted
+        events = json.loads(response["body"])["events"]
+        response = await request("GET", events)
+        assert response["status"] == 200
+        return response["body"].decode("utf-8").split("\n\n")
+
+    events = [e for e in asyncio.run(stream()) if e]
+    assert events[-1].startswith("event: result\ndata: ")
+    assert json.loads(events[-1].split("data: ", 1)[1])["valid"]
+
+
+def test_api_ready_route(client: FlaskClient):
+    """Test the readiness report of the worker pool."""
+    from routes.api import ChildTask
+
+    assert ChildTask.wait_until_ready(timeout=60.0)
+    resp = client.get("/ready.api")
+    assert resp.status_code == 200
+    assert resp.json and resp.json["ready"]
+    assert resp.json["warm"] >= resp.json["workers"]
+
+
+def test_api_cancel_route(client: FlaskClient):
+    """Test the cancellation of an asynchronous task."""
+    resp = client.post("/correct.task", data={"text": "Þetta er prufa."})
+    assert resp.status_code == 202  # Accepted
+    location = resp.headers["Location"]
+    resp = client.delete(location)
+    assert resp.status_code == 200
+    assert resp.json and resp.json["valid"]
+    # The task is gone
+    assert client.get(location).status_code == 410
+    assert client.delete(location).status_code == 410
+
+
+def test_api_events_route(client: FlaskClient, monkeypatch: pytest.MonkeyPatch):
+    """Test the Server-Sent Events stream for an asynchronous task."""
+    from routes.api import ChildTask
+
+    # As under the asyncio front end, cf. test_asgi_event_stream()
+    monkeypatch.setattr(ChildTask, "stream_events", True)
+    resp = client.post("/correct.task", data={"text": "Þetta er prufa."})
+    assert resp.status_code == 202  # Accepted
+    assert resp.json and resp.json["events"].startswith("/events/")
+    resp = client.get(resp.json["events"])
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("text/event-stream")
+    data = resp.get_data(as_text=True)
+    assert "event: result\n" in data
+    assert '"valid": true' in data
+
+
+def test_api_sync_streaming(client: FlaskClient):
+    """Test streaming of paragraphs as NDJSON from /correct.api."""
+    text = "Manninum á verkstæðinu vanntar hamar.\nMér dreimdi stórann brauðhleyf."
+    resp = client.post(
+        "/correct.api",
+        data={"text": text},
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [line["index"] for line in lines[:-1]] == [0, 1]
+    assert lines[1]["paragraph"][0]["tokens"][0]["i"] == len(text.split("\n")[0])
+    assert lines[-1]["valid"] and lines[-1]["text"] == text
+    assert lines[-1]["stats"]["num_sentences"] == 2
+
+
+def test_api_batch_route(client: FlaskClient):
+    """Test the batch correction endpoint, in JSON and NDJSON."""
+    items = ["Ég á hest.", {"text": "Hún á kött.", "suppress_suggestions": True}, ""]
+    resp = client.post("/correct.batch", json={"items": items})
+    assert resp.status_code == 200
+    assert resp.json and resp.json["valid"]
+    results = resp.json["results"]
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert results[0]["valid"] and results[0]["text"] == "Ég á hest."
+    assert results[1]["valid"] and results[1]["text"] == "Hún á kött."
+    assert not results[2]["valid"]
+    ndjson = "\n".join(json.dumps(item) for item in items)
+    resp = client.post(
+        "/correct.batch", data=ndjson, content_type="application/x-ndjson"
+    )
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [r["valid"] for r in lines] == [True, True, False]
+
+
+def test_api_recheck_route(client: FlaskClient):
+    """Test incremental re-checking of a document."""
+    resp = client.post("/recheck.api", json={"text": "Ég á hest.\nHún á kött."})
+    assert resp.status_code == 200
+    assert resp.json and resp.json["valid"]
+    doc = resp.json["document"]
+    assert len(resp.json["result"]) == 2
+    changes = [
+        {"op": "replace", "index": 1, "text": "Hún á hund."},
+        {"op": "insert", "index": 2, "text": "Þetta er prufa."},
+    ]
+    resp = client.post("/recheck.api", json={"document": doc, "changes": changes})
+    assert resp.json and resp.json["valid"]
+    assert resp.json["document"] == doc
+    assert resp.json["text"] == "Ég á hest.\nHún á hund.\nÞetta er prufa."
+    assert len(resp.json["result"]) == 3
+    resp = client.post("/recheck.api", json={"document": "nonexistent", "text": "x"})
+    assert resp.json and not resp.json["valid"]
+    resp = client.post("/recheck.api", json={"document": [doc], "text": "x"})
+    assert resp.status_code == 400  # Bad request
+
 
 def verify_char_spans(text: str, real: List[int]) -> None:
     resp = check_grammar(text)
@@ -296,6 +574,456 @@ def test_character_spans() -> None:
     # verify_char_spans(text, real)
 
 
+def test_admission_control() -> None:
+    """Test the admission control of correction tasks."""
+    from routes.api import AdmissionControl, estimate_cost
+
+    assert estimate_cost("Ég á hest.") > len("Ég á hest.")
+    ac = AdmissionControl(max_delay=1.0, workers=1)
+    throughput = ac.throughput
+    # Work is always admitted when nothing is queued
+    assert ac.admit(10 * throughput) is None
+    retry_after = ac.admit(throughput)
+    assert retry_after is not None and retry_after >= 1
+    ac.release(10 * throughput)
+    assert ac.admit(throughput / 2) is None
+    # Batch work may only fill a part of the queue
+    assert ac.admit(throughput / 2, batch=True) is not None
+
+
+def test_failed_task_cancels_jobs(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the remaining pool jobs of a failed task are cancelled,
+    and that a task whose jobs find no room in the pool is refused."""
+    import routes.api
+    from routes.api import ChildTask, admission
+
+    class StubPool:
+        """Keeps submitted jobs until they are cancelled"""
+
+        size = 3
+        full = False
+
+        def __init__(self) -> None:
+            self.jobs: Dict[int, Any] = dict()
+
+        def capacity(self) -> int:
+            return 10
+
+        def submit(self, lane: str, cost: float, texts: Any, *args: Any, **kw: Any):
+            if self.full:
+                return 0
+            # The options are followed by the complete and error functions
+            self.jobs[len(self.jobs) + 1] = args[2]
+            return len(self.jobs)
+
+        def cancel(self, ticket: int) -> bool:
+            return self.jobs.pop(ticket, None) is not None
+
+    pool = StubPool()
+    monkeypatch.setattr(routes.api, "FANOUT_CHUNK_LENGTH", 10)
+    queued = admission.queued
+    text = "\n".join(f"Þetta er {n}. málsgreinin." for n in range(3))
+    with app.test_request_context():
+        task = ChildTask()
+        task.pool = pool  # type: ignore
+        assert task.launch(text)[1] == 202  # Accepted
+    assert len(pool.jobs) == 3
+    pool.jobs.pop(2)(ValueError("The second job failed"))
+    assert task.is_complete and isinstance(task.exception, ValueError)
+    # The other jobs are gone, and their costs are released
+    assert not pool.jobs
+    assert admission.queued == pytest.approx(queued)
+    task.abort()
+    # As when the pool has no capacity, the client is told when to retry
+    pool.full = True
+    with app.test_request_context():
+        task = ChildTask()
+        task.pool = pool  # type: ignore
+        task.launch(text)
+        resp = task.result()
+    assert resp.status_code == 503  # Service unavailable
+    assert int(resp.headers["Retry-After"]) >= 1
+    assert admission.queued == pytest.approx(queued)
+
+
+def test_result_cache() -> None:
+    """Test that the result cache is bounded by the size of the results."""
+    from routes.api import ResultCache
+
+    result = check_grammar("Þetta er prufa.")
+    size = ResultCache.sizeof(result)
+    assert size > len("Þetta er prufa.")
+    rc = ResultCache(maxsize=2 * size, ttl=60)
+    rc.put("a", result)
+    rc.put("b", result)
+    rc.put("c", result)
+    # The least recently used result has made room for the last one
+    assert rc.get("a") is None
+    assert rc.get("c") == result
+
+
+def test_throughput_measurement() -> None:
+    """Test that the throughput of the pool is measured from the running
+    times of its jobs, however far apart they arrive."""
+    from correctionpool import CorrectionPool, THROUGHPUT_WINDOW
+    from routes.api import AdmissionControl, estimate_cost
+
+    pool = CorrectionPool()
+    now = time.monotonic()
+    # Small jobs that each keep a worker busy for 50 ms, six seconds apart
+    for i in range(10):
+        pool.record_service(100.0, 0.05, now - THROUGHPUT_WINDOW + 6.0 * (i + 1))
+    assert abs(pool.worker_throughput() - 2000.0) < 1.0
+    assert abs(pool.throughput() - 2000.0 * pool.size) < pool.size
+    ac = AdmissionControl(max_delay=60.0, workers=pool.size)
+    ac.measure = pool.throughput
+    # An idle server admits a long document, and small requests after it
+    assert ac.admit(estimate_cost("Þetta er orð. " * 800)) is None
+    assert ac.admit(estimate_cost("Ég á hest.")) is None
+
+
+def test_scheduler() -> None:
+    """Test that the scheduler runs the most urgent job first."""
+    from scheduler import Scheduler, LANE_API, LANE_BATCH, LANE_INTERACTIVE
+
+    class FakePool:
+        """Holds submitted jobs until run() is called"""
+
+        def __init__(self) -> None:
+            self.jobs: List[Any] = []
+
+        def apply_async(self, func: Any, args: Any, callback: Any, error_callback: Any):
+            self.jobs.append((func, args, callback))
+
+        def run(self) -> None:
+            func, args, callback = self.jobs.pop(0)
+            callback(func(*args))
+
+    pool = FakePool()
+    scheduler = Scheduler(pool, 1)
+    order: List[str] = []
+    for name, lane, cost in [
+        ("first", LANE_API, 100.0),
+        ("big", LANE_API, 1000.0),
+        ("batch", LANE_BATCH, 100.0),
+        ("ui", LANE_INTERACTIVE, 100.0),
+    ]:
+        scheduler.submit(lane, cost, str, (name,), order.append, print)
+    assert scheduler.stats()["running"] == 1
+    while pool.jobs:
+        pool.run()
+    assert order == ["first", "ui", "batch", "big"]
+
+    # An abandoned job makes room for the next one, and its
+    # callback is not called even if it does finish
+    lost = scheduler.submit(LANE_API, 1.0, str, ("lost",), order.append, print)
+    scheduler.submit(LANE_API, 1.0, str, ("next",), order.append, print)
+    assert scheduler.running() == [lost]
+    assert scheduler.abandon(lost)
+    assert not scheduler.abandon(lost)
+    while pool.jobs:
+        pool.run()
+    assert order[-1] == "next"
+    assert "lost" not in order
+
+    # A cancelled job is dropped while it waits, but not once it runs
+    running = scheduler.submit(LANE_API, 1.0, str, ("running",), order.append, print)
+    waiting = scheduler.submit(LANE_API, 1.0, str, ("waiting",), order.append, print)
+    assert scheduler.cancel(waiting)
+    assert not scheduler.cancel(running)
+    while pool.jobs:
+        pool.run()
+    assert order[-1] == "running"
+    assert "waiting" not in order
+
+
+def test_autoscaler() -> None:
+    """Test that the autoscaler grows the pool when jobs are waiting,
+    and shrinks it when workers are idle, within its limits."""
+    from autoscaler import Autoscaler
+
+    scaler = Autoscaler(1, 4, 2, up_delay=2.0, idle_time=60.0)
+    # A momentary backlog does not grow the pool
+    assert scaler.update(2, 3, 0.0) == 2
+    assert scaler.update(2, 0, 1.0) == 2
+    # A lasting one does, up to the maximum size
+    assert scaler.update(2, 3, 2.0) == 2
+    assert scaler.update(2, 3, 4.0) == 4
+    # Busy workers keep the pool from shrinking
+    assert scaler.update(4, 0, 70.0) == 4
+    # An idle worker makes it shrink, one worker at a time,
+    # down to the minimum size
+    for t in range(80, 600, 10):
+        scaler.update(0, 0, float(t))
+    assert scaler.size == 1
+
+
+def test_task_registry(tmp_path: Any) -> None:
+    """Test the task registry that is shared between web server processes."""
+    from taskregistry import open_registry
+
+    assert open_registry("").lookup("x") is None
+    registry = open_registry(f"sqlite:{tmp_path / 'tasks.db'}")
+    other = open_registry(f"sqlite:{tmp_path / 'tasks.db'}")
+    assert registry.shared
+    registry.register("a", time.time() + 60.0)
+    registry.register("b", time.time() - 1.0)
+    registry.publish_progress([("a", 0.5)])
+    assert other.lookup("a") == (0.5, None)
+    # Tasks whose time is up are not found
+    assert other.lookup("b") is None
+    registry.finish("a", dict(valid=True), time.time() + 60.0)
+    assert other.lookup("a") == (1.0, dict(valid=True))
+    # The outcome is only delivered once, and the process that ran
+    # the task is told to drop it
+    assert registry.lookup("a") is None
+    assert not registry.claim("a")
+    assert registry.cancelled(["a"]) == ["a"]
+    # The process that ran a task can deliver its outcome itself
+    registry.register("d", time.time() + 60.0)
+    registry.finish("d", dict(valid=True), time.time() + 60.0)
+    assert registry.claim("d")
+    assert other.lookup("d") is None
+    # A cancellation is passed on to the process that runs the task
+    registry.register("c", time.time() + 60.0)
+    assert other.cancel("c")
+    assert other.lookup("c") is None
+    assert not other.cancel("c")
+    assert registry.cancelled(["a", "c", "d"]) == ["c"]
+    assert registry.cancelled(["c"]) == []
+    # Any number of running tasks can be checked at once
+    assert registry.cancelled([f"x{n}" for n in range(2000)]) == []
+
+
+def test_correction_service(tmp_path: Any) -> None:
+    """Test the protocol between the correction service and its clients,
+    with a stub in place of the correction pool."""
+    import socket
+    import threading
+    from multiprocessing.connection import Client, Listener
+    from correctiond import ServiceClient, ServiceSession
+    from workerpool import PoolBusyError, WorkerLostError
+
+    class StubPool:
+        """Keeps submitted jobs until the test finishes them"""
+
+        size = 2
+        free = 10
+
+        def __init__(self) -> None:
+            self.jobs: Dict[int, Any] = dict()
+            self.cancelled: List[int] = []
+            self.last_ticket = 0
+
+        def submit(self, lane: str, cost: float, texts: Any, *args: Any, **kw: Any):
+            if not self.free:
+                return 0
+            self.last_ticket += 1
+            # The options are followed by the complete and error functions
+            self.jobs[self.last_ticket] = (texts, args[1], args[2])
+            return self.last_ticket
+
+        def cancel(self, ticket: int) -> bool:
+            self.cancelled.append(ticket)
+            return self.jobs.pop(ticket, None) is not None
+
+        def job(self, text: str) -> Any:
+            """Wait for the job that checks the given text to arrive"""
+            wait_for(lambda: any(job[0] == [text] for job in self.jobs.values()))
+            return next(
+                (ticket, job) for ticket, job in self.jobs.items() if job[0] == [text]
+            )
+
+        def capacity(self) -> int:
+            return self.free
+
+        def progress(self, ticket: int) -> float:
+            return 0.5
+
+        def readiness(self) -> Dict[str, Any]:
+            return dict(ready=True, workers=self.size, warm=self.size)
+
+        def throughput(self) -> float:
+            return 1000.0
+
+        def memory_report(self) -> Dict[str, Any]:
+            return dict(workers=dict())
+
+    def wait_for(condition: Any) -> None:
+        deadline = time.monotonic() + 10.0
+        while not condition():
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    path = str(tmp_path / "correction.sock")
+    listener = Listener(path, family="AF_UNIX")
+    pool = StubPool()
+    sessions: List[ServiceSession] = []
+
+    def accept() -> None:
+        while True:
+            session = ServiceSession(pool, listener.accept())  # type: ignore
+            sessions.append(session)
+            threading.Thread(target=session.run, daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    client = ServiceClient(path)
+    client.start()
+    wait_for(lambda: client.readiness()["ready"] and client.capacity() > 0)
+    assert client.throughput() == 1000.0
+    outcomes: List[Any] = []
+
+    def submit(text: str) -> int:
+        return client.submit(
+            "api", 1.0, [text], dict(), outcomes.append, outcomes.append, print
+        )
+
+    # A job completes
+    ticket = submit("a")
+    _, (_, complete, _) = pool.job("a")
+    wait_for(lambda: client.progress(ticket) == 0.5)
+    complete(["result"])
+    wait_for(lambda: outcomes == [["result"]])
+    assert client.progress(ticket) == 1.0
+    # A job fails
+    submit("b")
+    _, (_, _, error) = pool.job("b")
+    error(ValueError("b"))
+    wait_for(lambda: len(outcomes) == 2)
+    assert isinstance(outcomes[1], ValueError)
+    # A job is refused
+    pool.free = 0
+    submit("c")
+    wait_for(lambda: len(outcomes) == 3)
+    assert isinstance(outcomes[2], PoolBusyError)
+    pool.free = 10
+    # A job is cancelled by the client
+    ticket = submit("d")
+    service_ticket, _ = pool.job("d")
+    assert client.cancel(ticket)
+    wait_for(lambda: service_ticket in pool.cancelled)
+    # The jobs of a client that disconnects are cancelled
+    other = Client(path, family="AF_UNIX")
+    other.send(("submit", 1, "api", 1.0, ["e"], dict(), False, False))
+    service_ticket, _ = pool.job("e")
+    other.close()
+    wait_for(lambda: service_ticket in pool.cancelled)
+    # The outstanding jobs fail if the service goes away
+    submit("f")
+    service_ticket, _ = pool.job("f")
+    with socket.fromfd(
+        sessions[0].conn.fileno(), socket.AF_UNIX, socket.SOCK_STREAM
+    ) as sock:
+        sock.shutdown(socket.SHUT_RDWR)
+    wait_for(lambda: len(outcomes) == 4)
+    assert isinstance(outcomes[3], WorkerLostError)
+    wait_for(lambda: service_ticket in pool.cancelled)
+    # No further outcomes are delivered for cancelled jobs
+    assert len(outcomes) == 4
+    listener.close()
+
+
+def test_memory_usage() -> None:
+    """Test the memory usage report of a process."""
+    from workerpool import memory_usage
+
+    usage = memory_usage(os.getpid())
+    if usage is None:
+        # Not available on this platform
+        return
+    assert usage["rss"] > 0
+    assert usage["shared"] + usage["private"] <= usage["rss"] + 4
+
+
+def test_prepare_fork(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that garbage collection is resumed after forking, also where
+    the heap cannot be frozen and when the preload function fails."""
+    import gc
+    from workerpool import finish_fork, prepare_fork
+
+    def fail() -> None:
+        raise RuntimeError("Collecting failed")
+
+    monkeypatch.delattr(gc, "freeze", raising=False)
+    prepare_fork()
+    assert not gc.isenabled()
+    finish_fork()
+    assert gc.isenabled()
+    monkeypatch.setattr(gc, "collect", fail)
+    with pytest.raises(RuntimeError):
+        prepare_fork()
+    assert gc.isenabled()
+
+
+def test_recycling_pool() -> None:
+    """Test that pool workers are replaced after a number of tasks,
+    without losing any of the queued tasks"""
+    from multiprocessing import get_context
+    from workerpool import RecyclingPool
+
+    pool = RecyclingPool(1, maxtasksperchild=2, context=get_context("fork"))
+    try:
+        pids = [pool.apply_async(os.getpid) for _ in range(5)]
+        pids = [r.get(timeout=30) for r in pids]
+    finally:
+        pool.terminate()
+    assert len(pids) == 5
+    assert len(set(pids)) == 3
+
+
+def test_split_and_merge() -> None:
+    """Test that checking a text in paragraph chunks and merging the
+    results gives the same offsets and statistics as checking it whole"""
+    from correct import split_into_chunks, merge_check_results
+
+    text = "Ég á hest.\nHér er Maríanna Gvendardóttir.\n\nMér langar í brauðsneið."
+    chunks = split_into_chunks(text, 2)
+    assert len(chunks) == 2
+    assert "\n".join(chunks) == text
+
+    whole_pgs, whole_stats = check_grammar(text)
+    pgs, stats = merge_check_results([check_grammar(c) for c in chunks])
+    assert len(pgs) == len(whole_pgs)
+
+    def spans(pgs: List[List[Any]]) -> List[Any]:
+        return [
+            (
+                [t["i"] for t in sent["tokens"]],
+                [(a["start_char"], a["end_char"]) for a in sent["annotations"]],
+            )
+            for pg in pgs
+            for sent in pg
+        ]
+
+    assert spans(pgs) == spans(whole_pgs)
+    for key in ("num_tokens", "num_sentences", "num_parsed", "num_chars"):
+        assert stats[key] == whole_stats[key]
+
+
+def test_sentence_cache() -> None:
+    """Test that sentences taken from the sentence cache get correct
+    character offsets, as well as a fresh nonce and token"""
+    from correct import _sentence_cache
+
+    text1 = "Ég á hest. Mér langar í brauðsneið."
+    text2 = "Hér er Maríanna. Mér langar í brauðsneið."
+    pgs1, _ = check_grammar(text1)
+    size = len(_sentence_cache)
+    pgs2, stats2 = check_grammar(text2)
+    # Only the first sentence of text2 should have been added to the cache
+    assert len(_sentence_cache) == size + 1
+    assert stats2["num_sentences"] == 2
+    sent1, sent2 = pgs1[0][1], pgs2[0][1]
+    assert sent1["corrected"] == sent2["corrected"]
+    assert len(sent2["annotations"]) == 1
+    ann = sent2["annotations"][0]
+    assert ann["code"] == sent1["annotations"][0]["code"]
+    # Token offsets include preceding whitespace
+    assert sent2["tokens"][0]["i"] == text2.index(" Mér")
+    assert ann["start_char"] == sent2["tokens"][ann["start"]]["i"]
+    assert validate_token_and_nonce(sent2["original"], sent2["token"], sent2["nonce"])
+
+
 def test_doc():
     """Test document-related functions in doc.py"""
     from doc import PlainTextDocument, DocxDocument
@@ -0,0 +1,543 @@
+"""
+
+    Yfirlestur: Online spelling and grammar correction for Icelandic
+
+    Worker process utilities
+
+    Copyright (C) 2020-2025 Miðeind ehf.
+
+    This software is licensed under the MIT License:
+
+        Permission is hereby granted, free of charge, to any person
+        obtaining a copy of this software and associated documentation
+        files (the "Software"), to deal in the Software without restriction,
+        including without limitation the rights to use, copy, modify, merge,
+        publish, distribute, sublicense, and/or sell copies of the Software,
+        and to permit persons to whom the Software is furnished to do so,
+        subject to the following conditions:
+
+        The above copyright notice and this permission notice shall be
+        included in all copies or substantial portions of the Software.
+
+        THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+        EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+        MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+        IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+        CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+        TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+        SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+    This module contains the code that runs within the worker processes
+    of the correction pool, as well as utilities for preparing the parent
+    process for forking them, and for measuring how much of their memory
+    is shared with the parent, as opposed to private to each worker.
+
+    The module does not depend on Flask or on the web server, so that it
+    can be imported cleanly into workers that are not forked from the web
+    server process, i.e. when using the 'forkserver' or 'spawn' start
+    methods.
+
+    Forked workers share the memory pages of the parent process until
+    either one writes to them. In CPython, merely touching an object
+    writes to it, since its reference count changes, and garbage
+    collection passes write to the GC header of every tracked object.
+    Freezing the parent's objects before forking exempts them from
+    garbage collection in the workers, which keeps the pages holding
+    the (large) correction engine shared for longer.
+
+    Workers do not live forever: the parser may allocate a lot of memory
+    for a pathological sentence, and the process rarely gives it back.
+    A worker therefore exits, and is replaced by a fresh one, once it has
+    completed a given number of tasks, or when its private memory exceeds
+    a watermark after a task. This happens between tasks, so that no
+    queued task is lost or fails.
+
+    Each worker notes in a shared job table which task it is running, and
+    since when, so that the parent process can detect workers that crash
+    or hang while running a task.
+    Conversely, the parent process can ask for a running task to be
+    stopped through a shared cancel table, which the worker checks each
+    time it reports progress.
+
+    Optionally, each worker is pinned to a CPU core of its own (on Linux),
+    so that it keeps the parser's large tables in that core's caches
+    instead of being moved between cores by the operating system.
+
+"""
+
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Set,
+    Union,
+)
+
+import os
+import gc
+import time
+import logging
+import ctypes
+from functools import partial
+from multiprocessing.pool import Pool, worker as pool_worker
+
+from correct import AnnResultDict, CheckResult, check_grammar, warm_up
+
+
+# The result of checking a unit of text within a child task: for batch
+# tasks, this may be an error message instead of a check result
+UnitResult = Union[CheckResult, str]
+
+# Modules that the forkserver loads before forking workers: the correction
+# stack, without the web server
+FORKSERVER_PRELOAD = ["reynir", "reynir_correct", "nertokenizer", "correct"]
+
+# Minimum change in progress ratio before a worker updates the progress table
+PROGRESS_STEP = 0.01
+
+# Reasons for recycling a worker, in the order of their counters in
+# the shared recycling table
+RECYCLE_REASONS = ("tasks", "memory")
+
+
+class JobInfo(ctypes.Structure):
+
+    """An entry in the shared job table, describing the job that is
+    running in a slot: its ticket (a number that identifies the job),
+    the worker process that runs it and when it started"""
+
+    _fields_ = [
+        ("ticket", ctypes.c_long),
+        ("pid", ctypes.c_int),
+        ("started", ctypes.c_double),
+    ]
+
+
+class WorkerLostError(Exception):
+
+    """A pool worker died or hung while running a job"""
+
+
+class TaskCancelledError(Exception):
+
+    """A job, or the task that it belongs to, was cancelled"""
+
+
+class PoolBusyError(Exception):
+
+    """The pool had no room for a job"""
+
+
+# Shared-memory progress table and paragraph queue, as seen by a worker
+_progress_table: Optional[MutableSequence[float]] = None
+_paragraph_queue: Optional[Any] = None
+# Shared-memory counters of recycled workers, one per reason
+_recycle_table: Optional[Any] = None
+# Shared-memory job table, with an entry per slot
+_job_table: Optional[Any] = None
+# Shared-memory table of the ticket of the job to be cancelled in each slot
+_cancel_table: Optional[Any] = None
+# Shared counter of warmed-up workers
+_warm_workers: Optional[Any] = None
+# The CPU cores that workers are pinned to, and a shared table
+# of the pid of the worker that has claimed each of them
+_worker_cpus: Sequence[int] = ()
+_cpu_table: Optional[Any] = None
+# Private memory watermark of a worker, in kB, or 0 if there is none
+_memory_limit = 0
+
+
+# Fields of /proc/<pid>/smaps_rollup that we report, in kB
+_SMAPS_FIELDS = (
+    "Rss",
+    "Pss",
+    "Shared_Clean",
+    "Shared_Dirty",
+    "Private_Clean",
+    "Private_Dirty",
+)
+
+
+def prepare_fork(preload: Optional[Callable[[], None]] = None) -> None:
+    """Prepare the current process for forking worker processes.
+    If given, the preload function is called first to load large,
+    long-lived data structures that the workers will share. Garbage
+    is then collected, so that the workers don't inherit it, and the
+    remaining objects are moved to the permanent generation, where
+    the garbage collector leaves them (and their memory pages) alone.
+    Garbage collection stays disabled until finish_fork() is called,
+    so that no holes are punched into the frozen pages meanwhile.
+    Where the collector has no permanent generation, as on PyPy,
+    the heap is not frozen."""
+    if preload is not None:
+        preload()
+    gc.disable()
+    try:
+        gc.collect()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+    except BaseException:
+        gc.enable()
+        raise
+
+
+def finish_fork() -> None:
+    """Resume garbage collection in the parent process once the
+    workers have been forked"""
+    gc.enable()
+
+
+def init_forked_worker() -> None:
+    """This runs in each worker process as it starts, after forking.
+    Objects created in the worker itself are garbage collected as
+    usual, while the frozen objects inherited from the parent remain
+    untouched by the collector."""
+    gc.enable()
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    """Parse a list of CPU cores such as '0-3,8,10-11', as used by
+    taskset and in /sys/devices/system/cpu, into a sorted list"""
+    cpus: Set[int] = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def set_affinity(cpus: Sequence[int]) -> bool:
+    """Restrict the current process to the given CPU cores, if the
+    platform supports it. Returns True if this was done."""
+    if not cpus or not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        os.sched_setaffinity(0, cpus)
+    except OSError as e:
+        logging.warning(f"Unable to set CPU affinity to {list(cpus)}: {e}")
+        return False
+    return True
+
+
+def _pid_alive(pid: int) -> bool:
+    """Return True if a process with the given pid exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def pin_worker() -> None:
+    """Restrict the current worker process to the workers' CPU cores.
+    If there is a table of cores, the worker is pinned to a core of its
+    own, claiming the first core that is not held by a running worker;
+    if all of them are taken, it may run on any of the workers' cores."""
+    if not _worker_cpus:
+        return
+    cpus = _worker_cpus
+    if _cpu_table is not None:
+        with _cpu_table.get_lock():
+            for i, cpu in enumerate(_worker_cpus):
+                pid = _cpu_table[i]
+                if pid == 0 or not _pid_alive(pid):
+                    _cpu_table[i] = os.getpid()
+                    cpus = [cpu]
+                    break
+    set_affinity(cpus)
+
+
+def unpin_worker() -> None:
+    """Release the CPU core claimed by the current worker process"""
+    if _cpu_table is None:
+        return
+    pid = os.getpid()
+    with _cpu_table.get_lock():
+        for i in range(len(_cpu_table)):
+            if _cpu_table[i] == pid:
+                _cpu_table[i] = 0
+
+
+def init_worker(
+    table: MutableSequence[float],
+    paragraph_queue: Any,
+    warm_workers: Any,
+    recycle_table: Optional[Any] = None,
+    memory_limit: int = 0,
+    job_table: Optional[Any] = None,
+    worker_cpus: Sequence[int] = (),
+    cpu_table: Optional[Any] = None,
+    cancel_table: Optional[Any] = None,
+) -> None:
+    """This runs in each child process as it starts"""
+    global _progress_table, _paragraph_queue, _recycle_table, _memory_limit
+    global _job_table, _warm_workers, _worker_cpus, _cpu_table, _cancel_table
+    init_forked_worker()
+    _worker_cpus = worker_cpus
+    _cpu_table = cpu_table
+    # Pin the worker before warming up, so that the memory it touches
+    # first is allocated close to its core
+    pin_worker()
+    _progress_table = table
+    _paragraph_queue = paragraph_queue
+    _recycle_table = recycle_table
+    _memory_limit = memory_limit
+    _job_table = job_table
+    _cancel_table = cancel_table
+    _warm_workers = warm_workers
+    # Warm up the correction engine within this worker, so that the
+    # first real task does not pay for its lazy initialization
+    try:
+        warm_up()
+    except Exception as e:
+        logging.warning(f"Exception while warming up pool worker: {e}")
+    with warm_workers.get_lock():
+        warm_workers.value += 1
+
+
+def check_cancelled(slot: int, ticket: int) -> None:
+    """Raise TaskCancelledError if the parent process has asked for
+    the job with the given ticket to be stopped"""
+    if ticket and _cancel_table is not None and _cancel_table[slot] == ticket:
+        raise TaskCancelledError("The task was cancelled")
+
+
+def progress_func(
+    slot: int, ticket: int, base: float, scale: float, progress: float
+) -> None:
+    """Update the child task progress in the shared progress table.
+    To keep the cost of reporting down, small increments are skipped.
+    This is also where a running job notices that it has been cancelled."""
+    check_cancelled(slot, ticket)
+    table = _progress_table
+    assert table is not None
+    progress = base + scale * progress
+    if progress - table[slot] >= PROGRESS_STEP or progress >= 1.0:
+        table[slot] = progress
+
+
+def send_paragraph(
+    stream: str, slot: int, pos: int, pg: Optional[List[AnnResultDict]]
+) -> None:
+    """Send an annotated paragraph of a streaming task from
+    a worker to the parent process"""
+    assert _paragraph_queue is not None
+    _paragraph_queue.put((stream, slot, pos, pg))
+
+
+def run_task(
+    slot: int,
+    texts: List[str],
+    options: Dict[str, Any],
+    isolate: bool = False,
+    stream: str = "",
+    ticket: int = 0,
+) -> List[UnitResult]:
+    """This is a task that runs in a child process within the pool,
+    checking one or more consecutive units of text. If isolate is True,
+    an exception while checking a unit is returned as an error message
+    in place of its result, instead of failing the entire task.
+    If stream is given, it is the identifier of a streaming task,
+    and the annotated paragraphs are sent to the parent process via
+    the paragraph queue instead of being returned. The ticket, if
+    given, identifies the task in the job table and in the cancel table."""
+    if ticket and _job_table is not None:
+        # Note which worker runs this job, and since when; the ticket
+        # is written last, so that the entry is complete once it matches
+        info = _job_table[slot]
+        info.pid = os.getpid()
+        info.started = time.time()
+        info.ticket = ticket
+    # The job may have been cancelled while it waited in the pool's queue
+    check_cancelled(slot, ticket)
+    total = sum(len(text) for text in texts) or 1
+    done = 0
+    task_results: List[UnitResult] = []
+    for pos, text in enumerate(texts):
+        # We do a bit of functools.partial magic to pass the slot and the
+        # scaling of this unit's progress to the progress_func whenever
+        # it is called
+        unit_progress_func = partial(
+            progress_func, slot, ticket, done / total, len(text) / total
+        )
+        paragraph_func = (
+            partial(send_paragraph, stream, slot, pos) if stream else None
+        )
+        try:
+            task_results.append(
+                check_grammar(
+                    text,
+                    progress_func=unit_progress_func,
+                    paragraph_func=paragraph_func,
+                    split_paragraphs=True,
+                    **options,
+                )
+            )
+        except Exception as e:
+            if not isolate or isinstance(e, TaskCancelledError):
+                raise
+            task_results.append(f"Exception {type(e).__qualname__}: {e}")
+        if stream:
+            # Signal the end of this unit
+            send_paragraph(stream, slot, pos, None)
+        done += len(text)
+    # The result is automatically communicated back to the parent process via IPC
+    return task_results
+
+
+class _SentQueue:
+
+    """Wraps the result queue of a pool worker, noting whether
+    a result has been sent through it"""
+
+    def __init__(self, queue: Any) -> None:
+        self._queue = queue
+        self._reader = queue._reader
+        self.sent = False
+
+    def put(self, obj: Any) -> None:
+        self._queue.put(obj)
+        self.sent = True
+
+
+def recycle(reason: str, completed: int) -> None:
+    """Count and log the recycling of the current worker process"""
+    if _recycle_table is not None:
+        with _recycle_table.get_lock():
+            _recycle_table[RECYCLE_REASONS.index(reason)] += 1
+    logging.info(
+        f"Recycling pool worker {os.getpid()} ({reason}) "
+        f"after {completed} tasks"
+    )
+
+
+def recycling_worker(
+    inqueue: Any,
+    outqueue: Any,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: Any = (),
+    maxtasks: Optional[int] = None,
+    wrap_exception: bool = False,
+) -> None:
+    """The main loop of a pool worker process. This has the same signature
+    as the standard library's worker loop, which it runs for one task at
+    a time, checking after each task whether the worker should exit.
+    The pool then starts a new worker in its place, unless the worker
+    was asked to exit because the pool is shrinking or shutting down."""
+    if initializer is not None:
+        initializer(*initargs)
+    try:
+        queue = _SentQueue(outqueue)
+        completed = 0
+        while maxtasks is None or completed < maxtasks:
+            queue.sent = False
+            pool_worker(inqueue, queue, None, (), 1, wrap_exception)
+            if not queue.sent:
+                # The worker was asked to exit
+                return
+            completed += 1
+            if _memory_limit:
+                usage = memory_usage(os.getpid())
+                if usage is not None and usage["private"] > _memory_limit:
+                    recycle("memory", completed)
+                    return
+        recycle("tasks", completed)
+    finally:
+        unpin_worker()
+        if _warm_workers is not None:
+            with _warm_workers.get_lock():
+                _warm_workers.value -= 1
+
+
+class RecyclingPool(Pool):
+
+    """A process pool whose workers run recycling_worker(), and which
+    can grow and shrink beyond its initial number of workers. Note that
+    the pool itself only replaces workers that exit while there are fewer
+    than the initial number of them; above that, the owner of the pool
+    is responsible for starting replacements, cf. add_workers()."""
+
+    @staticmethod
+    def Process(ctx: Any, *args: Any, **kwds: Any) -> Any:
+        if kwds.get("target") is pool_worker:
+            kwds["target"] = recycling_worker
+        return ctx.Process(*args, **kwds)
+
+    def alive_workers(self) -> int:
+        """Return the number of worker processes that are running"""
+        return sum(1 for w in list(self._pool) if w.exitcode is None)
+
+    def add_workers(self, count: int) -> None:
+        """Start additional worker processes"""
+        for _ in range(count):
+            w = self.Process(
+                self._ctx,
+                target=pool_worker,
+                args=(
+                    self._inqueue,
+                    self._outqueue,
+                    self._initializer,
+                    self._initargs,
+                    self._maxtasksperchild,
+                    self._wrap_exception,
+                ),
+            )
+            w.name = w.name.replace("Process", "PoolWorker")
+            w.daemon = True
+            w.start()
+            self._pool.append(w)
+        # Wake up the pool's worker handler, so that it notices
+        # when the new workers exit
+        self._change_notifier.put(None)
+
+    def retire_workers(self, count: int) -> None:
+        """Ask the given number of workers to exit, once they have
+        finished the jobs that have already been handed to the pool"""
+        # A None task tells a worker to exit; it goes through the task
+        # queue, and thereby to the workers after any waiting jobs
+        self._taskqueue.put(([None] * count, None))
+
+
+def memory_usage(pid: int) -> Optional[Dict[str, int]]:
+    """Return the memory usage of a process, in kB, from
+    /proc/<pid>/smaps_rollup, with shared and private totals.
+    Returns None if the information is not available, e.g.
+    on platforms other than Linux."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    usage: Dict[str, int] = dict()
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].rstrip(":") in _SMAPS_FIELDS:
+            usage[parts[0].rstrip(":").lower()] = int(parts[1])
+    usage["shared"] = usage.get("shared_clean", 0) + usage.get("shared_dirty", 0)
+    usage["private"] = usage.get("private_clean", 0) + usage.get("private_dirty", 0)
+    return usage
+
+
+def cpu_affinity(pid: int) -> Optional[List[int]]:
+    """Return the CPU cores that a process may run on, or None
+    if this is not available"""
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    try:
+        return sorted(os.sched_getaffinity(pid))
+    except OSError:
+        return None
+
+
+def memory_report(pids: List[int]) -> Dict[str, Optional[Dict[str, int]]]:
+    """Return the memory usage of the given processes, keyed by pid"""
+    return {str(pid): memory_usage(pid) for pid in pids}